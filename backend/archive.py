@@ -0,0 +1,129 @@
+"""Archival tier for closed maintenance requests.
+
+Requests that have been ``repaired`` or ``scrap`` for longer than the
+retention window are moved in batches from ``requests`` to
+``requests_archive``, so the hot collection, its indexes and every
+dashboard count only cover the working set.
+
+Each archived batch adds its contribution to per-dimension counters in
+``archive_rollups`` (stage, type, team, category), and the dashboard adds
+them back. Equipment stats are kept incrementally and are not affected.
+Read paths that take ``include_archived`` merge both collections.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+
+from database import transactional
+from overdue import CLOSED_STAGES
+from sync import record_deletes
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = "requests_archive"
+ROLLUPS_COLLECTION = "archive_rollups"
+ROLLUP_DIMENSIONS = ("stage", "request_type", "team_id", "team_name", "equipment_category")
+
+
+async def ensure_indexes(database) -> None:
+    await database.requests.create_index([("stage", ASCENDING), ("updated_at", ASCENDING)])
+    archive = database[ARCHIVE_COLLECTION]
+    await archive.create_index("id", unique=True)
+    await archive.create_index([("created_at", DESCENDING)])
+    await archive.create_index(
+        [("equipment_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]
+    )
+
+
+def rollup_ops(docs: List[dict], sign: int = 1) -> List[UpdateOne]:
+    """Rollup increments for archiving ``docs``; ``sign=-1`` takes them back out"""
+    counts: Counter = Counter()
+    for doc in docs:
+        counts[("total", None)] += sign
+        for dimension in ROLLUP_DIMENSIONS:
+            counts[(dimension, doc.get(dimension))] += sign
+    return [
+        UpdateOne({"_id": {"dim": dimension, "value": value}}, {"$inc": {"count": count}}, upsert=True)
+        for (dimension, value), count in counts.items()
+    ]
+
+
+async def archived_rollups(database) -> Dict[str, Dict[Any, int]]:
+    """``{dimension: {value: count}}`` over everything archived so far"""
+    rollups: Dict[str, Dict[Any, int]] = {}
+    async for doc in database[ROLLUPS_COLLECTION].find({}):
+        rollups.setdefault(doc["_id"]["dim"], {})[doc["_id"]["value"]] = doc["count"]
+    return rollups
+
+
+async def _archive_batch(database, docs: List[dict], closed_query: dict) -> int:
+    ids = [doc["id"] for doc in docs]
+
+    async def write(session):
+        await database[ARCHIVE_COLLECTION].bulk_write(
+            [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs],
+            ordered=False,
+            session=session,
+        )
+        # Re-check the filter: a request reopened or touched since the read
+        # keeps a newer updated_at and stays in the hot collection
+        await database.requests.delete_many({**closed_query, "id": {"$in": ids}}, session=session)
+        kept = {
+            doc["id"]
+            async for doc in database.requests.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}, session=session)
+        }
+        if kept:
+            await database[ARCHIVE_COLLECTION].delete_many({"id": {"$in": list(kept)}}, session=session)
+        moved = [doc for doc in docs if doc["id"] not in kept]
+        if moved:
+            await database[ROLLUPS_COLLECTION].bulk_write(rollup_ops(moved), ordered=False, session=session)
+        return [doc["id"] for doc in moved]
+
+    moved_ids = await transactional(write)
+    # Clients that sync drop archived requests like deleted ones
+    await record_deletes(database, "requests", moved_ids)
+    return len(moved_ids)
+
+
+async def archive_closed_requests(database, after_days: int, batch_size: int = 500) -> int:
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=after_days)).isoformat()
+    closed_query = {"stage": {"$in": CLOSED_STAGES}, "updated_at": {"$lt": cutoff}}
+    archived = 0
+    while True:
+        docs = await database.requests.find(closed_query, {"_id": 0}).to_list(batch_size)
+        if not docs:
+            break
+        archived += await _archive_batch(database, docs, closed_query)
+        # Yield between batches so foreground traffic is not starved
+        await asyncio.sleep(0)
+    if archived:
+        logger.info("Archived %d closed requests older than %d days", archived, after_days)
+    return archived
+
+
+def _sort_in_memory(rows: List[dict], sort: list) -> List[dict]:
+    # Stable sorts from the least to the most significant key; None first
+    # when ascending, as MongoDB orders it
+    for field, direction in reversed(sort):
+        rows.sort(
+            key=lambda row: (row.get(field) is not None, row.get(field) if row.get(field) is not None else ""),
+            reverse=direction == DESCENDING,
+        )
+    return rows
+
+
+async def find_requests(database, query: dict, sort: list, limit: int, include_archived: bool) -> List[dict]:
+    """Requests matching ``query``, optionally merged with archived ones, in ``sort`` order"""
+    live = database.requests.find(query, {"_id": 0}).sort(sort).to_list(limit)
+    if not include_archived:
+        return await live
+    # Requests soft-deleted with their equipment stay readable by id only
+    archived_query = {**query, "deleted_at": {"$exists": False}}
+    live, archived = await asyncio.gather(
+        live, database[ARCHIVE_COLLECTION].find(archived_query, {"_id": 0}).sort(sort).to_list(limit)
+    )
+    return _sort_in_memory(live + archived, sort)[:limit]
@@ -0,0 +1,422 @@
+"""File attachments for maintenance requests and equipment.
+
+Contents live in an ``AttachmentStore``: GridFS by default, or a
+directory on local disk with ``ATTACHMENT_STORE=local``. Both take writes
+and serve reads chunk by chunk, so no file is ever held in memory whole,
+and local-disk I/O runs on worker threads. Metadata (owner, name, type,
+size, SHA-256 used as the ETag) is kept in the ``attachments`` collection.
+
+Thumbnails for images are rendered after the upload returns, in a small
+process pool, when the optional ``Pillow`` package is installed. The
+source is streamed to a temporary file that the pool process opens, and
+JPEGs are decoded at reduced scale, so neither process holds the whole
+original in memory.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from fastapi.responses import Response, StreamingResponse
+from pymongo import ASCENDING
+from starlette.datastructures import Headers
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENTS_COLLECTION = "attachments"
+GRIDFS_BUCKET = "attachment_files"
+OWNER_TYPES = ("request", "equipment")
+READ_CHUNK_SIZE = 256 * 1024
+BYTE_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+# Served inline; anything else (HTML, SVG, scripts, ...) downloads as a file
+INLINE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "application/pdf"}
+
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+# =============================================================================
+# STORES
+# =============================================================================
+class Upload(ABC):
+    @abstractmethod
+    async def write(self, chunk: bytes) -> None:
+        ...
+
+    @abstractmethod
+    async def commit(self) -> None:
+        ...
+
+    @abstractmethod
+    async def abort(self) -> None:
+        ...
+
+
+class AttachmentStore(ABC):
+    @abstractmethod
+    async def create(self, file_id: str, filename: str, content_type: str) -> Upload:
+        ...
+
+    @abstractmethod
+    def read(self, file_id: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Bytes ``start`` through ``end`` (inclusive) of the file"""
+
+    @abstractmethod
+    async def delete(self, file_id: str) -> None:
+        ...
+
+
+class _GridFSUpload(Upload):
+    def __init__(self, grid_in):
+        self._grid_in = grid_in
+
+    async def write(self, chunk: bytes) -> None:
+        await self._grid_in.write(chunk)
+
+    async def commit(self) -> None:
+        await self._grid_in.close()
+
+    async def abort(self) -> None:
+        await self._grid_in.abort()
+
+
+class GridFSStore(AttachmentStore):
+    def __init__(self, get_database):
+        # Looked up per call: the database handle belongs to the current
+        # worker's client, which is created after fork
+        self._get_database = get_database
+
+    def _bucket(self) -> AsyncIOMotorGridFSBucket:
+        return AsyncIOMotorGridFSBucket(self._get_database(), bucket_name=GRIDFS_BUCKET)
+
+    async def create(self, file_id: str, filename: str, content_type: str) -> Upload:
+        grid_in = self._bucket().open_upload_stream_with_id(
+            file_id, filename, metadata={"content_type": content_type}
+        )
+        return _GridFSUpload(grid_in)
+
+    async def read(self, file_id: str, start: int, end: int) -> AsyncIterator[bytes]:
+        grid_out = await self._bucket().open_download_stream(file_id)
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def delete(self, file_id: str) -> None:
+        try:
+            await self._bucket().delete(file_id)
+        except NoFile:
+            pass
+
+
+class _LocalUpload(Upload):
+    def __init__(self, path: Path):
+        self._path = path
+        self._partial = path.with_name(path.name + ".part")
+        self._file = None
+
+    async def open(self) -> None:
+        await asyncio.to_thread(self._path.parent.mkdir, parents=True, exist_ok=True)
+        self._file = await asyncio.to_thread(open, self._partial, "wb")
+
+    async def write(self, chunk: bytes) -> None:
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def commit(self) -> None:
+        await asyncio.to_thread(self._file.close)
+        await asyncio.to_thread(os.replace, self._partial, self._path)
+
+    async def abort(self) -> None:
+        await asyncio.to_thread(self._file.close)
+        await asyncio.to_thread(self._partial.unlink, missing_ok=True)
+
+
+class LocalDiskStore(AttachmentStore):
+    def __init__(self, root: str):
+        self._root = Path(root)
+
+    def _path(self, file_id: str) -> Path:
+        # Fan out over subdirectories so no single directory grows huge
+        return self._root / file_id[:2] / file_id
+
+    async def create(self, file_id: str, filename: str, content_type: str) -> Upload:
+        upload = _LocalUpload(self._path(file_id))
+        await upload.open()
+        return upload
+
+    async def read(self, file_id: str, start: int, end: int) -> AsyncIterator[bytes]:
+        handle = await asyncio.to_thread(open, self._path(file_id), "rb")
+        try:
+            await asyncio.to_thread(handle.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(handle.read, min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(handle.close)
+
+    async def delete(self, file_id: str) -> None:
+        await asyncio.to_thread(self._path(file_id).unlink, missing_ok=True)
+
+
+def store_from_env(get_database) -> AttachmentStore:
+    if os.environ.get("ATTACHMENT_STORE", "gridfs") == "local":
+        return LocalDiskStore(os.environ.get("ATTACHMENT_DIR", "attachments"))
+    return GridFSStore(get_database)
+
+
+# =============================================================================
+# RANGES
+# =============================================================================
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """``(start, end)`` for a single ``bytes=`` range, or None to send the
+    whole file. Raises ``ValueError`` if the range cannot be satisfied."""
+    if not header or not header.startswith("bytes=") or "," in header or size == 0:
+        # Multipart byte ranges are not supported; send the full body
+        return None
+    match = BYTE_RANGE.fullmatch(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        # Not a byte-range-spec; ignore the header
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def content_disposition(media_type: str, filename: str) -> str:
+    """``inline`` only for types a browser cannot run script from"""
+    kind = "inline" if media_type.split(";")[0].strip().lower() in INLINE_TYPES else "attachment"
+    return f"{kind}; filename*=UTF-8''{quote(filename)}"
+
+
+def download_response(
+    store: AttachmentStore, file_id: str, size: int, etag: str, media_type: str, filename: str, headers: Headers
+) -> Response:
+    """Stream a stored file, honouring If-None-Match, Range and If-Range"""
+    common = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # An attachment id always names the same bytes
+        "Cache-Control": "private, max-age=31536000, immutable",
+        # The type is whatever the uploader claimed. Never sniff it into
+        # something else, and run any HTML or SVG without script or the
+        # API origin
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "sandbox",
+    }
+    if_none_match = headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=common)
+
+    range_header = headers.get("range")
+    if_range = headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**common, "Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range or (0, size - 1)
+    response_headers = {
+        **common,
+        "Content-Length": str(end - start + 1),
+        "Content-Disposition": content_disposition(media_type, filename),
+    }
+    if byte_range:
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        store.read(file_id, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=media_type,
+        headers=response_headers,
+    )
+
+
+# =============================================================================
+# THUMBNAILS
+# =============================================================================
+def render_thumbnail(path: str, size: int) -> bytes:
+    """JPEG thumbnail of the image file at ``path``; runs in a worker process"""
+    from io import BytesIO
+
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale straight away
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        out = BytesIO()
+        image.convert("RGB").save(out, "JPEG", quality=80)
+        return out.getvalue()
+
+
+# =============================================================================
+# SERVICE
+# =============================================================================
+class AttachmentService:
+    def __init__(
+        self,
+        database,
+        store: AttachmentStore,
+        max_bytes: int,
+        thumbnail_size: int = 256,
+        thumbnail_workers: int = 2,
+        thumbnail_max_source_bytes: int = 20 * 1024 * 1024,
+    ):
+        self._database = database
+        self.store = store
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_workers = thumbnail_workers
+        self.thumbnail_max_source_bytes = thumbnail_max_source_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def ensure_indexes(self) -> None:
+        collection = self._database[ATTACHMENTS_COLLECTION]
+        await collection.create_index("id", unique=True)
+        await collection.create_index([("owner_type", ASCENDING), ("owner_id", ASCENDING), ("created_at", ASCENDING)])
+
+    async def upload(
+        self, owner_type: str, owner_id: str, filename: str, content_type: str, chunks: AsyncIterator[bytes]
+    ) -> dict:
+        file_id = str(uuid.uuid4())
+        digest = hashlib.sha256()
+        size = 0
+        upload = await self.store.create(file_id, filename, content_type)
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise AttachmentTooLarge(f"Attachments are limited to {self.max_bytes} bytes")
+                digest.update(chunk)
+                await upload.write(chunk)
+            await upload.commit()
+        except BaseException:
+            await upload.abort()
+            raise
+
+        doc = {
+            "id": file_id,
+            "owner_type": owner_type,
+            "owner_id": owner_id,
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "sha256": digest.hexdigest(),
+            "thumbnail": "pending" if self._wants_thumbnail(content_type, size) else None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self._database[ATTACHMENTS_COLLECTION].insert_one(doc)
+        if doc["thumbnail"]:
+            task = asyncio.create_task(self._make_thumbnail(doc), name=f"thumbnail:{file_id}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return {k: v for k, v in doc.items() if k != "_id"}
+
+    async def get(self, attachment_id: str) -> Optional[dict]:
+        return await self._database[ATTACHMENTS_COLLECTION].find_one({"id": attachment_id}, {"_id": 0})
+
+    async def list(self, owner_type: str, owner_id: str) -> List[dict]:
+        return await self._database[ATTACHMENTS_COLLECTION].find(
+            {"owner_type": owner_type, "owner_id": owner_id}, {"_id": 0}
+        ).sort("created_at", ASCENDING).to_list(1000)
+
+    async def delete(self, attachment: dict) -> None:
+        await self._database[ATTACHMENTS_COLLECTION].delete_one({"id": attachment["id"]})
+        await self.store.delete(attachment["id"])
+        if attachment.get("thumbnail"):
+            await self.store.delete(thumbnail_id(attachment["id"]))
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _wants_thumbnail(self, content_type: str, size: int) -> bool:
+        return (
+            PILLOW_AVAILABLE
+            and self.thumbnail_workers > 0
+            and content_type.startswith("image/")
+            and 0 < size <= self.thumbnail_max_source_bytes
+        )
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn rather than fork: the worker has a running loop and
+            # driver threads that must not be copied into the children
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.thumbnail_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def _make_thumbnail(self, attachment: dict) -> None:
+        status = "failed"
+        source = None
+        try:
+            source = await asyncio.to_thread(tempfile.NamedTemporaryFile, suffix=".src", delete=False)
+            async for chunk in self.store.read(attachment["id"], 0, attachment["size"] - 1):
+                await asyncio.to_thread(source.write, chunk)
+            await asyncio.to_thread(source.close)
+            thumbnail = await asyncio.get_running_loop().run_in_executor(
+                self._executor(), render_thumbnail, source.name, self.thumbnail_size
+            )
+            upload = await self.store.create(thumbnail_id(attachment["id"]), attachment["filename"], "image/jpeg")
+            await upload.write(thumbnail)
+            await upload.commit()
+            status = "ready"
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Thumbnail for attachment %s failed", attachment["id"])
+        finally:
+            if source is not None:
+                await asyncio.to_thread(source.close)
+                await asyncio.to_thread(Path(source.name).unlink, missing_ok=True)
+        await self._database[ATTACHMENTS_COLLECTION].update_one(
+            {"id": attachment["id"]},
+            {"$set": {"thumbnail": status, **({"thumbnail_bytes": len(thumbnail)} if status == "ready" else {})}},
+        )
+
+
+def thumbnail_id(attachment_id: str) -> str:
+    return f"{attachment_id}.thumb"
@@ -338,6 +338,344 @@ class GearGuardAPITester:
         
         return all_passed
 
+    def test_filtered_requests(self):
+        """Test server-side request filtering and sorting"""
+        if not self.team_id:
+            print("   Skipping - No team ID available")
+            return False
+            
+        success, response = self.run_test(
+            "Filter Requests by Team",
+            "GET",
+            f"requests?team_id={self.team_id}&sort_by=created_at&sort_order=desc",
+            200
+        )
+        
+        if success and isinstance(response, list):
+            if any(r.get('team_id') != self.team_id for r in response):
+                print("   Filter returned requests from other teams")
+                return False
+            print(f"   Found {len(response)} requests for team")
+            return True
+        return False
+
+    def test_search(self):
+        """Test full-text search over equipment and requests"""
+        success, response = self.run_test(
+            "Search",
+            "GET",
+            "search?q=Generator",
+            200
+        )
+        
+        if success and 'equipment' in response and 'requests' in response:
+            print(f"   Matched {len(response['equipment'])} equipment, {len(response['requests'])} requests")
+            return True
+        return False
+
+    def test_equipment_suggest(self):
+        """Test equipment typeahead suggestions"""
+        success, response = self.run_test(
+            "Equipment Suggest",
+            "GET",
+            "equipment/suggest?q=GEN-",
+            200
+        )
+        
+        if success and isinstance(response, list):
+            print(f"   Got {len(response)} suggestions")
+            return True
+        return False
+
+    def test_equipment_history(self):
+        """Test paged equipment history with rollup stats"""
+        if not self.equipment_id:
+            print("   Skipping - No equipment ID available")
+            return False
+            
+        success, response = self.run_test(
+            "Equipment History",
+            "GET",
+            f"equipment/{self.equipment_id}/history?limit=5",
+            200
+        )
+        
+        if success and 'items' in response and 'stats' in response:
+            print(f"   {len(response['items'])} items, stats: {response['stats']}")
+            return True
+        return False
+
+    def test_reliability_analytics(self):
+        """Test MTTR / MTBF analytics for each grouping"""
+        all_passed = True
+        for group_by in ["equipment", "category", "team", "department"]:
+            success, response = self.run_test(
+                f"Reliability by {group_by}",
+                "GET",
+                f"analytics/reliability?group_by={group_by}&days=365",
+                200
+            )
+            if success and isinstance(response.get('results'), list):
+                print(f"   {len(response['results'])} {group_by} groups")
+            else:
+                all_passed = False
+        return all_passed
+
+    def test_cycle_time(self):
+        """Test stage transition log and cycle-time report"""
+        if not self.request_id:
+            print("   Skipping - No request ID available")
+            return False
+            
+        success, response = self.run_test(
+            "Request Transitions",
+            "GET",
+            f"requests/{self.request_id}/transitions",
+            200
+        )
+        if not success or not isinstance(response, list):
+            return False
+        print(f"   {len(response)} transitions recorded")
+        
+        success, response = self.run_test(
+            "Cycle Time Report",
+            "GET",
+            "analytics/cycle-time?days=30",
+            200
+        )
+        if success and 'stages' in response and 'lead_time' in response:
+            print(f"   Stages: {response['stages']}")
+            return True
+        return False
+
+    def test_idempotent_create(self):
+        """Test that retried creates with the same Idempotency-Key are not duplicated"""
+        if not self.equipment_id:
+            print("   Skipping - No equipment ID available")
+            return False
+            
+        key = f"test-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        request_data = {
+            "subject": "Idempotent Request",
+            "equipment_id": self.equipment_id,
+            "request_type": "corrective"
+        }
+        
+        success, first = self.run_test(
+            "Create Request (first attempt)",
+            "POST",
+            "requests",
+            200,
+            data=request_data,
+            headers={'Idempotency-Key': key}
+        )
+        success_retry, retry = self.run_test(
+            "Create Request (retry)",
+            "POST",
+            "requests",
+            200,
+            data=request_data,
+            headers={'Idempotency-Key': key}
+        )
+        
+        if success and success_retry and first.get('id') == retry.get('id'):
+            print(f"   Retry returned the original request: {first['id']}")
+            return True
+        return False
+
+    def test_delta_sync(self):
+        """Test that a sync with a fresh token only returns later changes"""
+        success, first = self.run_test(
+            "Initial Sync",
+            "GET",
+            "sync?limit=5000",
+            200
+        )
+        if not success or 'token' not in first:
+            return False
+        print(f"   Initial sync: {[(k, len(v)) for k, v in first['changes'].items()]}")
+        
+        success, delta = self.run_test(
+            "Delta Sync",
+            "GET",
+            f"sync?since={first['token']}",
+            200
+        )
+        if success and not delta.get('reset'):
+            print(f"   Delta sync: {[(k, len(v)) for k, v in delta['changes'].items()]}")
+            return True
+        return False
+
+    def test_bootstrap(self):
+        """Test the composite post-login payload"""
+        success, response = self.run_test(
+            "Bootstrap",
+            "GET",
+            "bootstrap",
+            200
+        )
+        expected = ['user', 'dashboard', 'teams', 'equipment', 'technicians']
+        if success and all(key in response for key in expected):
+            print(f"   User: {response['user'].get('email')}, {len(response['equipment'])} equipment")
+            return True
+        return False
+
+    def test_include_archived(self):
+        """Test list reads that merge the request archive"""
+        success, live = self.run_test(
+            "Requests (hot only)",
+            "GET",
+            "requests",
+            200
+        )
+        success_all, merged = self.run_test(
+            "Requests (with archive)",
+            "GET",
+            "requests?include_archived=true",
+            200
+        )
+        if success and success_all and len(merged) >= len(live):
+            print(f"   {len(live)} hot, {len(merged)} including archived")
+            return True
+        return False
+
+    def test_delete_cascade(self):
+        """Test that deleting equipment schedules a cascade job for its requests"""
+        success, equipment = self.run_test(
+            "Create Equipment (to delete)",
+            "POST",
+            "equipment",
+            200,
+            data={
+                "name": "Test Scrap Press",
+                "serial_number": f"DEL-{datetime.now().strftime('%H%M%S%f')}",
+                "location": "Test Bay",
+                "department": "Testing",
+                "category": "Press"
+            }
+        )
+        if not success:
+            return False
+        self.run_test(
+            "Create Request (on deleted equipment)",
+            "POST",
+            "requests",
+            200,
+            data={"subject": "Orphan check", "equipment_id": equipment['id']}
+        )
+        success, deleted = self.run_test(
+            "Delete Equipment",
+            "DELETE",
+            f"equipment/{equipment['id']}",
+            200
+        )
+        if not success or 'job_id' not in deleted:
+            return False
+        success, job = self.run_test(
+            "Cascade Job Status",
+            "GET",
+            f"jobs/{deleted['job_id']}",
+            200
+        )
+        if success and job.get('kind') == 'equipment':
+            print(f"   Job {job['status']}: {job['progress']}")
+            return True
+        return False
+
+    def test_team_membership(self):
+        """Test adding and removing a single team member"""
+        if not self.team_id or not self.user_id:
+            print("   Skipping - No team or user ID available")
+            return False
+        
+        success, added = self.run_test(
+            "Add Team Member",
+            "POST",
+            f"teams/{self.team_id}/members",
+            200,
+            data={"user_ids": [self.user_id]}
+        )
+        if not success or self.user_id not in added.get('member_ids', []):
+            return False
+        success, removed = self.run_test(
+            "Remove Team Member",
+            "DELETE",
+            f"teams/{self.team_id}/members/{self.user_id}",
+            200
+        )
+        return success and self.user_id not in removed.get('member_ids', [])
+
+    def test_logout_revokes_token(self):
+        """Test that a logged-out token is rejected"""
+        success, response = self.run_test(
+            "Login (second session)",
+            "POST",
+            "auth/login",
+            200,
+            data={"email": "manager@test.com", "password": "password123"}
+        )
+        if not success:
+            return False
+        session = {'Authorization': f"Bearer {response['access_token']}"}
+        success, _ = self.run_test(
+            "Logout",
+            "POST",
+            "auth/logout",
+            200,
+            headers=session
+        )
+        success_rejected, _ = self.run_test(
+            "Bootstrap (revoked token)",
+            "GET",
+            "bootstrap",
+            401,
+            headers=session
+        )
+        return success and success_rejected
+
+    def test_request_attachments(self):
+        """Test listing a request's attachments"""
+        if not self.request_id:
+            print("   Skipping - No request ID available")
+            return False
+        
+        success, response = self.run_test(
+            "Request Attachments",
+            "GET",
+            f"requests/{self.request_id}/attachments",
+            200
+        )
+        if success and isinstance(response, list):
+            print(f"   {len(response)} attachments")
+            return True
+        return False
+
+    def test_meter_readings(self):
+        """Test batched meter ingestion and the per-asset meter summary"""
+        if not self.equipment_id:
+            print("   Skipping - No equipment ID available")
+            return False
+        
+        success, response = self.run_test(
+            "Ingest Meter Readings",
+            "POST",
+            "meters/readings",
+            202,
+            data={"readings": [
+                {"equipment_id": self.equipment_id, "meter": "hours", "value": 120.5},
+                {"equipment_id": self.equipment_id, "meter": "cycles", "value": 3400}
+            ]}
+        )
+        if not success or response.get('accepted') != 2:
+            return False
+        success, meters = self.run_test(
+            "Equipment Meters",
+            "GET",
+            f"equipment/{self.equipment_id}/meters",
+            200
+        )
+        return success and isinstance(meters, dict)
+
 def main():
     print("🚀 Starting GearGuard API Testing...")
     tester = GearGuardAPITester()
@@ -355,7 +693,22 @@ def main():
         ("Kanban Stage Update", tester.test_kanban_stage_update),
         ("Calendar Requests", tester.test_calendar_requests),
         ("Create Preventive Maintenance", tester.test_create_preventive_maintenance),
-        ("Analytics Reports", tester.test_analytics_reports)
+        ("Analytics Reports", tester.test_analytics_reports),
+        ("Filtered Requests", tester.test_filtered_requests),
+        ("Search", tester.test_search),
+        ("Equipment Suggest", tester.test_equipment_suggest),
+        ("Equipment History", tester.test_equipment_history),
+        ("Reliability Analytics", tester.test_reliability_analytics),
+        ("Cycle Time", tester.test_cycle_time),
+        ("Idempotent Create", tester.test_idempotent_create),
+        ("Delta Sync", tester.test_delta_sync),
+        ("Bootstrap", tester.test_bootstrap),
+        ("Include Archived", tester.test_include_archived),
+        ("Delete Cascade", tester.test_delete_cascade),
+        ("Team Membership", tester.test_team_membership),
+        ("Logout Revokes Token", tester.test_logout_revokes_token),
+        ("Request Attachments", tester.test_request_attachments),
+        ("Meter Readings", tester.test_meter_readings)
     ]
     
     print(f"\n📋 Running {len(tests)} test scenarios...")
@@ -0,0 +1,94 @@
+"""Periodic background jobs that run in exactly one worker at a time.
+
+With several worker processes (see gunicorn.conf.py) every worker starts
+the same jobs, so each run first takes a short lease in the ``leases``
+collection; whoever holds it does the work and the others skip the tick.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = "leases"
+
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lease(database, name: str, ttl_seconds: float) -> bool:
+    """Take or renew the named lease for ``ttl_seconds``; False if someone else holds it"""
+    now = datetime.now(timezone.utc)
+    try:
+        lease = await database[LEASES_COLLECTION].find_one_and_update(
+            {"_id": name, "$or": [{"expires_at": {"$lt": now}}, {"holder": HOLDER_ID}]},
+            {"$set": {"holder": HOLDER_ID, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The lease exists and is held by another live worker
+        return False
+    return lease is not None and lease.get("holder") == HOLDER_ID
+
+
+async def release_lease(database, name: str) -> None:
+    await database[LEASES_COLLECTION].delete_one({"_id": name, "holder": HOLDER_ID})
+
+
+class PeriodicJob:
+    def __init__(
+        self,
+        name: str,
+        interval_seconds: float,
+        run: Callable[[], Awaitable[None]],
+        database,
+        single_worker: bool = True,
+    ):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self._run = run
+        self._database = database
+        self._single_worker = single_worker
+        self._task: Optional[asyncio.Task] = None
+        self.last_run_at: Optional[datetime] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name=f"job:{self.name}")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self._single_worker:
+                await release_lease(self._database, self.name)
+
+    async def run_once(self) -> bool:
+        if self._single_worker:
+            # Hold the lease across a missed tick so a slow run is not duplicated
+            if not await acquire_lease(self._database, self.name, self.interval_seconds * 2):
+                return False
+        await self._run()
+        self.last_run_at = datetime.now(timezone.utc)
+        return True
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Background job %s failed", self.name)
+            await asyncio.sleep(self.interval_seconds)
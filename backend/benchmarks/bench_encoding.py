@@ -0,0 +1,120 @@
+"""Bytes on the wire and encode CPU per response format.
+
+Encodes a synthetic page of maintenance requests shaped like
+``GET /api/requests`` rows as JSON and MessagePack, each raw, gzipped and
+(if the ``brotli`` package is installed) brotli-compressed, with the
+settings ``CompressionMiddleware`` uses. No server or database is needed.
+
+    cd backend && python benchmarks/bench_encoding.py --rows 10000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msgpack  # noqa: E402
+
+from negotiation import _pack_default, brotli  # noqa: E402
+
+STAGES = ["new", "in_progress", "repaired", "scrap"]
+PRIORITIES = ["low", "medium", "high"]
+CATEGORIES = ["CNC", "Hydraulics", "Conveyor", "Electrical", "HVAC", "Forklift"]
+SUBJECTS = ["Oil leak", "Spindle noise", "Belt slipping", "Overheating", "Sensor fault", "Routine check"]
+
+
+def make_rows(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    teams = [(str(uuid.UUID(int=rng.getrandbits(128))), f"Team {i}") for i in range(8)]
+    techs = [(str(uuid.UUID(int=rng.getrandbits(128))), f"Technician {i}") for i in range(40)]
+    now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        created = now - timedelta(minutes=rng.randint(0, 500_000))
+        team_id, team_name = rng.choice(teams)
+        tech_id, tech_name = rng.choice(techs)
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "subject": f"{rng.choice(SUBJECTS)} #{i}",
+            "description": "Reported by operator during shift handover." if rng.random() < 0.6 else None,
+            "request_type": "preventive" if rng.random() < 0.3 else "corrective",
+            "scheduled_date": (created + timedelta(days=7)).date().isoformat(),
+            "priority": rng.choice(PRIORITIES),
+            "equipment_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "equipment_name": f"{rng.choice(CATEGORIES)} unit {rng.randint(1, 400)}",
+            "equipment_category": rng.choice(CATEGORIES),
+            "team_id": team_id,
+            "team_name": team_name,
+            "assigned_technician_id": tech_id,
+            "assigned_technician_name": tech_name,
+            "assigned_technician_avatar": f"https://api.dicebear.com/7.x/initials/svg?seed={tech_name}",
+            "stage": rng.choice(STAGES),
+            "hours_spent": round(rng.random() * 12, 2),
+            "created_at": created.isoformat(),
+            "updated_at": (created + timedelta(hours=rng.randint(0, 200))).isoformat(),
+            "stage_entered_at": created.isoformat(),
+            "scheduled_at": created + timedelta(days=7),
+            "is_overdue": rng.random() < 0.1,
+            "created_by": None,
+        })
+    return rows
+
+
+def encode_json(rows) -> bytes:
+    return json.dumps(rows, default=_pack_default, separators=(",", ":")).encode()
+
+
+def encode_msgpack(rows) -> bytes:
+    return msgpack.packb(rows, default=_pack_default, use_bin_type=True)
+
+
+def gzip(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def timed(fn, arg, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.process_time()
+        result = fn(arg)
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5, help="report the fastest of N runs")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    compressors = [("identity", None), ("gzip", gzip)]
+    if brotli is not None:
+        compressors.append(("br", lambda data: brotli.compress(data, quality=4)))
+    else:
+        print("brotli not installed; skipping br")
+
+    print(f"{args.rows} rows\n")
+    print(f"{'format':<22}{'bytes':>12}{'ratio':>8}{'encode ms':>12}{'compress ms':>13}{'total ms':>10}")
+    baseline = None
+    for name, encoder in (("json", encode_json), ("msgpack", encode_msgpack)):
+        encoded, encode_ms = timed(encoder, rows, args.repeat)
+        for coding, compress in compressors:
+            body, compress_ms = (encoded, 0.0) if compress is None else timed(compress, encoded, args.repeat)
+            baseline = baseline or len(body)
+            print(
+                f"{name + '+' + coding:<22}{len(body):>12,}{len(body) / baseline:>8.2f}"
+                f"{encode_ms:>12.1f}{compress_ms:>13.1f}{encode_ms + compress_ms:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Throughput vs. worker count for the gunicorn deployment mode.
+
+Starts ``gunicorn -c gunicorn.conf.py server:app`` with 1, 2, 4, ... workers
+(up to the CPU count), drives it with keep-alive HTTP clients running in
+separate processes, and prints requests/second and scaling efficiency
+relative to a single worker. MONGO_URL / DB_NAME must point at a reachable
+MongoDB because workers connect on startup. Run it on a host with at least
+as many cores as the largest worker count plus the load clients; on fewer
+cores the workers only take turns and the numbers show nothing about
+scaling. All load comes from one address, so the per-IP rate limit and
+load shedding are switched off in the workers; otherwise the run measures
+those limits rather than the workers. The table is printed as Markdown,
+ready to commit next to the host's core count.
+
+    cd backend && python benchmarks/bench_workers.py --path /api/equipment/suggest?q=a
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _client_loop(host: str, port: int, path: str, deadline: float, counts: list, index: int):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    done = 0
+    while time.monotonic() < deadline:
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.close()
+    counts[index] = done
+
+
+def _load_process(host: str, port: int, path: str, seconds: float, threads: int, result):
+    deadline = time.monotonic() + seconds
+    counts = [0] * threads
+    workers = [
+        threading.Thread(target=_client_loop, args=(host, port, path, deadline, counts, i))
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    with result.get_lock():
+        result.value += sum(counts)
+
+
+def _wait_ready(server: subprocess.Popen, log, host: str, port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            log.seek(0)
+            tail = log.read().decode(errors="replace").splitlines()[-15:]
+            raise RuntimeError("gunicorn exited during startup:\n" + "\n".join(tail))
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError("server did not become healthy")
+
+
+def measure(workers: int, args) -> float:
+    env = dict(
+        os.environ,
+        WEB_CONCURRENCY=str(workers),
+        BIND=f"{args.host}:{args.port}",
+        RATE_LIMIT_ENABLED="false",
+        SHED_MAX_LAG_MS="1000000",
+        **{f"SHED_MAX_INFLIGHT_{name}": "100000" for name in ("INTERACTIVE", "LIST", "REPORTING")},
+    )
+    log = tempfile.TemporaryFile()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "server:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+    try:
+        _wait_ready(server, log, args.host, args.port)
+        # Warm every worker before timing
+        time.sleep(1)
+        total = multiprocessing.Value("q", 0)
+        clients = [
+            multiprocessing.Process(
+                target=_load_process,
+                args=(args.host, args.port, args.path, args.seconds, args.threads, total),
+            )
+            for _ in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        return total.value / args.seconds
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=max(1, multiprocessing.cpu_count() // 2))
+    parser.add_argument("--threads", type=int, default=16, help="connections per client process")
+    parser.add_argument("--max-workers", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    cpus = multiprocessing.cpu_count()
+    if args.max_workers + args.clients > cpus:
+        print(
+            f"warning: {args.max_workers} workers + {args.clients} client processes on {cpus} CPUs; "
+            "speedup will be capped by the host, not the app",
+            file=sys.stderr,
+        )
+
+    counts = []
+    n = 1
+    while n <= args.max_workers:
+        counts.append(n)
+        n *= 2
+
+    baseline = None
+    print(f"{cpus} CPUs, {args.clients} client processes x {args.threads} connections, GET {args.path}\n")
+    print("| workers | req/s | speedup | efficiency |")
+    print("|--------:|------:|--------:|-----------:|")
+    for workers in counts:
+        rps = measure(workers, args)
+        baseline = baseline or rps
+        speedup = rps / baseline if baseline else 0.0
+        print(f"| {workers} | {rps:.0f} | {speedup:.2f} | {speedup / workers:.0%} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Import-time budget check for ``server``.
+
+Imports the app in a fresh interpreter with ``-X importtime``, prints the
+slowest top-level imports and exits non-zero when the total exceeds the
+budget. Importing must not open connections or load optional heavy
+dependencies (pandas, numpy, boto3, passlib backends); those belong in the
+lifespan hooks or behind first use.
+
+    cd backend && python benchmarks/import_time.py --budget-ms 600
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+FORBIDDEN = ("pandas", "numpy", "boto3", "passlib")
+
+
+def measure(runs: int):
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://127.0.0.1:1")
+    env.setdefault("DB_NAME", "import_time")
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import server"],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        modules = {}
+        total_us = 0
+        for match in LINE.finditer(result.stderr):
+            cumulative, depth, name = int(match.group(2)), len(match.group(3)), match.group(4)
+            modules[name] = cumulative
+            if depth == 1:
+                total_us += cumulative
+        if best is None or total_us < best[0]:
+            best = (total_us, modules)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_BUDGET_MS", 600)))
+    parser.add_argument("--runs", type=int, default=3, help="report the fastest of N runs")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total_us, modules = measure(args.runs)
+    top_level = sorted(
+        ((name, us) for name, us in modules.items() if "." not in name),
+        key=lambda item: item[1], reverse=True,
+    )
+    for name, us in top_level[: args.top]:
+        print(f"{us / 1000:>8.1f} ms  {name}")
+    print(f"{total_us / 1000:>8.1f} ms  total (budget {args.budget_ms:.0f} ms)")
+
+    loaded = [name for name in FORBIDDEN if name in modules]
+    if loaded:
+        print(f"FAIL: imported at startup: {', '.join(loaded)}")
+        return 1
+    if total_us / 1000 > args.budget_ms:
+        print("FAIL: import time over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""Background cleanup of records that depend on deleted equipment or teams.
+
+Deleting an asset or a team removes the document itself right away and
+schedules a cascade job for everything that points at it:
+
+* equipment: its requests are soft-deleted (moved to the archive with
+  ``deleted_at`` set, without adding to the archive rollups), its
+  already archived requests are marked ``deleted_at`` and taken back out
+  of the rollups, and its stats rollup and meter thresholds are dropped;
+* team: equipment and requests, live and archived, are re-pointed to no
+  team, and the team's archive rollups are folded into "no team".
+
+Every step works in batches of ``batch_size`` documents and only matches
+documents it has not handled yet, so a job that dies half way is simply
+run again. Progress is kept in the ``jobs`` collection; a job whose
+worker stopped heartbeating is picked up by ``resume_stale``. So is a job
+whose step raised: it is set to ``retrying`` and run again after a
+backoff that doubles per attempt, up to ``MAX_ATTEMPTS``; after that it
+stays ``failed`` with its last error, for an operator to look at.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo import ASCENDING, ReplaceOne, ReturnDocument, UpdateOne
+
+from archive import ARCHIVE_COLLECTION, ROLLUPS_COLLECTION, rollup_ops
+from database import transactional
+from equipment_stats import STATS_COLLECTION
+from meters import LATEST_COLLECTION, THRESHOLDS_COLLECTION
+from sync import record_deletes, sync_stamp
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "jobs"
+# A running job whose heartbeat is older than this is considered abandoned
+STALE_AFTER_SECONDS = 60
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+
+async def ensure_indexes(database) -> None:
+    await database[JOBS_COLLECTION].create_index("id", unique=True)
+    await database[JOBS_COLLECTION].create_index([("status", ASCENDING), ("heartbeat_at", ASCENDING)])
+    await database[ARCHIVE_COLLECTION].create_index("team_id")
+
+
+# =============================================================================
+# EQUIPMENT STEPS
+# =============================================================================
+async def _soft_delete_requests(database, target: dict, batch_size: int) -> List[str]:
+    docs = await database.requests.find({"equipment_id": target["id"]}, {"_id": 0}).to_list(batch_size)
+    if not docs:
+        return []
+    deleted_at = datetime.now(timezone.utc).isoformat()
+    ids = [doc["id"] for doc in docs]
+
+    async def write(session):
+        await database[ARCHIVE_COLLECTION].bulk_write(
+            [
+                ReplaceOne({"id": doc["id"]}, {**doc, "deleted_at": deleted_at}, upsert=True)
+                for doc in docs
+            ],
+            ordered=False,
+            session=session,
+        )
+        await database.requests.delete_many({"id": {"$in": ids}}, session=session)
+
+    await transactional(write)
+    await record_deletes(database, "requests", ids)
+    return ids
+
+
+async def _soft_delete_archived_requests(database, target: dict, batch_size: int) -> List[str]:
+    archive = database[ARCHIVE_COLLECTION]
+    docs = await archive.find(
+        {"equipment_id": target["id"], "deleted_at": {"$exists": False}}, {"_id": 0}
+    ).to_list(batch_size)
+    if not docs:
+        return []
+    deleted_at = datetime.now(timezone.utc).isoformat()
+    ids = [doc["id"] for doc in docs]
+
+    async def write(session):
+        # Only this job's worker touches these documents (see _claim), so
+        # the batch read above is what gets marked and subtracted
+        await archive.update_many(
+            {"id": {"$in": ids}, "deleted_at": {"$exists": False}},
+            {"$set": {"deleted_at": deleted_at}},
+            session=session,
+        )
+        await database[ROLLUPS_COLLECTION].bulk_write(rollup_ops(docs, sign=-1), ordered=False, session=session)
+
+    await transactional(write)
+    return ids
+
+
+async def _drop_equipment_stats(database, target: dict, batch_size: int) -> List[str]:
+    result = await database[STATS_COLLECTION].delete_one({"equipment_id": target["id"]})
+    return [target["id"]] if result.deleted_count else []
+
+
+async def _drop_meter_state(database, target: dict, batch_size: int) -> List[str]:
+    # Readings stay in the time-series collection as history
+    thresholds = await database[THRESHOLDS_COLLECTION].delete_many({"equipment_id": target["id"]})
+    latest = await database[LATEST_COLLECTION].delete_many({"equipment_id": target["id"]})
+    return [target["id"]] if thresholds.deleted_count or latest.deleted_count else []
+
+
+# =============================================================================
+# TEAM STEPS
+# =============================================================================
+async def _repoint_equipment(database, target: dict, batch_size: int) -> List[str]:
+    docs = await database.equipment.find(
+        {"assigned_team_id": target["id"]}, {"_id": 0, "id": 1}
+    ).to_list(batch_size)
+    ids = [doc["id"] for doc in docs]
+    if ids:
+        await database.equipment.update_many(
+            {"id": {"$in": ids}, "assigned_team_id": target["id"]},
+            {"$set": {
+                "assigned_team_id": None,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                **await sync_stamp(database),
+            }},
+        )
+    return ids
+
+
+async def _repoint_requests(database, target: dict, batch_size: int) -> List[str]:
+    docs = await database.requests.find({"team_id": target["id"]}, {"_id": 0, "id": 1}).to_list(batch_size)
+    ids = [doc["id"] for doc in docs]
+    if ids:
+        # updated_at is left alone: it dates the workflow change that
+        # archiving and the stats rollups key off
+        await database.requests.update_many(
+            {"id": {"$in": ids}, "team_id": target["id"]},
+            {"$set": {"team_id": None, "team_name": None, **await sync_stamp(database)}},
+        )
+    return ids
+
+
+async def _repoint_archived_requests(database, target: dict, batch_size: int) -> List[str]:
+    archive = database[ARCHIVE_COLLECTION]
+    docs = await archive.find({"team_id": target["id"]}, {"_id": 0, "id": 1}).to_list(batch_size)
+    ids = [doc["id"] for doc in docs]
+    if ids:
+        await archive.update_many(
+            {"id": {"$in": ids}, "team_id": target["id"]},
+            {"$set": {"team_id": None, "team_name": None}},
+        )
+    return ids
+
+
+async def _fold_team_rollups(database, target: dict, batch_size: int) -> List[str]:
+    rollups = database[ROLLUPS_COLLECTION]
+    folded = []
+    for dimension, value in (("team_id", target["id"]), ("team_name", target.get("name"))):
+        doc = await rollups.find_one_and_delete({"_id": {"dim": dimension, "value": value}})
+        if doc and doc.get("count"):
+            await rollups.bulk_write([
+                UpdateOne({"_id": {"dim": dimension, "value": None}}, {"$inc": {"count": doc["count"]}}, upsert=True)
+            ])
+            folded.append(dimension)
+    return folded
+
+
+CASCADES: Dict[str, List[tuple]] = {
+    "equipment": [
+        ("requests", _soft_delete_requests),
+        ("archived_requests", _soft_delete_archived_requests),
+        ("stats", _drop_equipment_stats),
+        ("meters", _drop_meter_state),
+    ],
+    "team": [
+        ("equipment", _repoint_equipment),
+        ("requests", _repoint_requests),
+        ("archived_requests", _repoint_archived_requests),
+        # Last, so rollups added by an archive batch that raced the steps
+        # above are folded too
+        ("rollups", _fold_team_rollups),
+    ],
+}
+
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+class CascadeRunner:
+    """Schedules cascade jobs and runs them as tasks on the current loop.
+
+    ``on_batch(kind, step, ids)`` is awaited after every batch so callers
+    can refresh in-memory copies; ``on_finished(job)`` once a job is done.
+    """
+
+    def __init__(
+        self,
+        database,
+        batch_size: int = 500,
+        pause_seconds: float = 0.05,
+        on_batch: Optional[Callable[[str, str, List[str]], Awaitable[None]]] = None,
+        on_finished: Optional[Callable[[dict], Awaitable[None]]] = None,
+    ):
+        self._database = database
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self._on_batch = on_batch
+        self._on_finished = on_finished
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def schedule(self, kind: str, target: dict) -> dict:
+        """Record a pending job for ``target`` and start running it"""
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": "cascade",
+            "kind": kind,
+            "target": target,
+            "status": "pending",
+            "progress": {name: 0 for name, _ in CASCADES[kind]},
+            "error": None,
+            "attempts": 0,
+            "retry_at": None,
+            "created_at": now.isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "heartbeat_at": now,
+        }
+        await self._database[JOBS_COLLECTION].insert_one(job)
+        self._spawn(job["id"])
+        return {k: v for k, v in job.items() if k not in ("_id", "heartbeat_at")}
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self._database[JOBS_COLLECTION].find_one({"id": job_id}, {"_id": 0, "heartbeat_at": 0})
+
+    async def by_status(self, status: str, limit: int) -> List[dict]:
+        return await self._database[JOBS_COLLECTION].find(
+            {"status": status}, {"_id": 0, "heartbeat_at": 0}
+        ).sort("created_at", ASCENDING).to_list(limit)
+
+    async def resume_stale(self) -> int:
+        """Restart jobs left pending or running by a worker that went away,
+        and failed jobs whose retry is due"""
+        stale = await self._database[JOBS_COLLECTION].find(
+            {"$or": _resumable(datetime.now(timezone.utc))}, {"_id": 0, "id": 1}
+        ).to_list(100)
+        for job in stale:
+            self._spawn(job["id"])
+        return len(stale)
+
+    async def stop(self) -> None:
+        # Unfinished jobs keep their progress and are resumed later
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _spawn(self, job_id: str) -> None:
+        task = asyncio.create_task(self._run(job_id), name=f"cascade:{job_id}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _claim(self, job_id: str) -> Optional[dict]:
+        # Claiming bumps the heartbeat, so two workers resuming the same
+        # stale job cannot both get it
+        now = datetime.now(timezone.utc)
+        return await self._database[JOBS_COLLECTION].find_one_and_update(
+            {"id": job_id, "$or": [{"status": "pending"}, *_resumable(now)]},
+            {"$set": {"status": "running", "heartbeat_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _run(self, job_id: str) -> None:
+        job = await self._claim(job_id)
+        if job is None:
+            return
+        jobs = self._database[JOBS_COLLECTION]
+        if not job.get("started_at"):
+            await jobs.update_one({"id": job_id}, {"$set": {"started_at": datetime.now(timezone.utc).isoformat()}})
+        try:
+            for name, step in CASCADES[job["kind"]]:
+                while True:
+                    ids = await step(self._database, job["target"], self.batch_size)
+                    if not ids:
+                        break
+                    await jobs.update_one(
+                        {"id": job_id},
+                        {"$inc": {f"progress.{name}": len(ids)}, "$set": {"heartbeat_at": datetime.now(timezone.utc)}},
+                    )
+                    if self._on_batch:
+                        await self._on_batch(job["kind"], name, ids)
+                    # Spread the writes out so foreground requests keep their latency
+                    await asyncio.sleep(self.pause_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            await self._failed(job, exc)
+            return
+        finished = await jobs.find_one_and_update(
+            {"id": job_id},
+            {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc).isoformat()}},
+            {"_id": 0, "heartbeat_at": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        logger.info("Cascade job %s for %s %s done: %s", job_id, job["kind"], job["target"]["id"], finished["progress"])
+        if self._on_finished:
+            await self._on_finished(finished)
+
+    async def _failed(self, job: dict, exc: Exception) -> None:
+        attempts = job.get("attempts", 0) + 1
+        update = {"attempts": attempts, "error": str(exc), "retry_at": None}
+        if attempts < MAX_ATTEMPTS:
+            delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+            update.update(status="retrying", retry_at=datetime.now(timezone.utc) + timedelta(seconds=delay))
+            logger.exception(
+                "Cascade job %s for %s %s failed (attempt %d of %d); retrying in %d s",
+                job["id"], job["kind"], job["target"]["id"], attempts, MAX_ATTEMPTS, delay,
+            )
+        else:
+            update["status"] = "failed"
+            logger.exception(
+                "Cascade job %s for %s %s failed %d times; giving up",
+                job["id"], job["kind"], job["target"]["id"], attempts,
+            )
+        await self._database[JOBS_COLLECTION].update_one({"id": job["id"]}, {"$set": update})
+
+
+def _resumable(now: datetime) -> List[dict]:
+    """Queries for jobs another worker may take over at ``now``"""
+    stale_before = now - timedelta(seconds=STALE_AFTER_SECONDS)
+    return [
+        {"status": {"$in": ["pending", "running"]}, "heartbeat_at": {"$lt": stale_before}},
+        {"status": "retrying", "retry_at": {"$lte": now}},
+        # Failed for good before failed jobs were retried
+        {"status": "failed", "attempts": {"$exists": False}},
+    ]
@@ -0,0 +1,239 @@
+"""Motor client lifecycle, connection-pool settings and pool monitoring."""
+import asyncio
+import os
+import threading
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring, read_preferences
+
+T = TypeVar("T")
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def pool_settings_from_env() -> dict:
+    """MongoClient keyword arguments for the connection pool, read from the environment"""
+    return {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 10),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "readPreference": os.environ.get("MONGO_READ_PREFERENCE", "primary"),
+    }
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks connection counts and checkout waiters per server.
+
+    pymongo publishes pool events from its own threads (Motor runs driver
+    calls in an executor), so counters are guarded by a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, dict] = {}
+
+    def _pool(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "max_pool_size": None,
+                "open": 0,
+                "in_use": 0,
+                "waiting": 0,
+                "checkout_timeouts": 0,
+                "checkout_failures": 0,
+            }
+        return pool
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)["max_pool_size"] = event.options.get("maxPoolSize")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["open"] = max(0, pool["open"] - 1)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._pool(event.address)["waiting"] += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(0, pool["waiting"] - 1)
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                pool["checkout_timeouts"] += 1
+            else:
+                pool["checkout_failures"] += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(0, pool["waiting"] - 1)
+            pool["in_use"] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["in_use"] = max(0, pool["in_use"] - 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            servers = {address: dict(pool) for address, pool in self._pools.items()}
+        for pool in servers.values():
+            max_size = pool["max_pool_size"] or 0
+            pool["saturation"] = round(pool["in_use"] / max_size, 3) if max_size else 0.0
+        return {
+            "servers": servers,
+            "in_use": sum(p["in_use"] for p in servers.values()),
+            "wait_queue_depth": sum(p["waiting"] for p in servers.values()),
+            "saturation": max((p["saturation"] for p in servers.values()), default=0.0),
+        }
+
+
+pool_monitor = PoolMonitor()
+
+_READ_MODES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+# Route classes and the read preference each gets unless overridden by
+# MONGO_READ_POLICY_<CLASS>. The "write" class covers writes and
+# read-after-write lookups and is pinned to the primary. List and report
+# reads go to secondaries when there are any, so they can trail a write by
+# the replication lag; set MONGO_READ_POLICY_LIST=primary where screens
+# must show a change the moment it is saved.
+READ_POLICY_DEFAULTS = {
+    "write": "primary",
+    "list": "secondaryPreferred",
+    "reporting": "secondaryPreferred",
+}
+
+
+def read_preference_for(policy: str):
+    if policy == "write":
+        return read_preferences.Primary()
+    mode = os.environ.get(f"MONGO_READ_POLICY_{policy.upper()}", READ_POLICY_DEFAULTS[policy])
+    if mode not in _READ_MODES:
+        raise ValueError(f"Unknown read preference '{mode}' for policy '{policy}'")
+    if mode == "primary":
+        return read_preferences.Primary()
+    # -1 means no staleness bound; MongoDB requires at least 90 seconds otherwise
+    max_staleness = _env_int("MONGO_MAX_STALENESS_SECONDS", 120)
+    return _READ_MODES[mode](max_staleness=max_staleness)
+
+
+def database_for(client: AsyncIOMotorClient, name: str, policy: str) -> AsyncIOMotorDatabase:
+    """A handle on ``name`` whose reads follow the given route-class policy"""
+    return client.get_database(name, read_preference=read_preference_for(policy))
+
+
+def create_client(mongo_url: str) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(mongo_url, event_listeners=[pool_monitor], **pool_settings_from_env())
+
+
+# One client per worker process. Motor clients are not fork-safe, so the
+# client is created on first use and recreated if the pid changes (e.g. when
+# gunicorn forks workers from a preloaded app).
+_client: Optional[AsyncIOMotorClient] = None
+_client_pid: Optional[int] = None
+_databases: Dict[str, AsyncIOMotorDatabase] = {}
+
+
+def get_client() -> AsyncIOMotorClient:
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = create_client(os.environ["MONGO_URL"])
+        _client_pid = os.getpid()
+        _databases.clear()
+    return _client
+
+
+def get_database(policy: str = "write") -> AsyncIOMotorDatabase:
+    client = get_client()
+    database = _databases.get(policy)
+    if database is None:
+        database = _databases[policy] = database_for(client, os.environ["DB_NAME"], policy)
+    return database
+
+
+def close_client() -> None:
+    global _client, _client_pid, _transactions_supported
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+    _client = None
+    _client_pid = None
+    _transactions_supported = None
+    _databases.clear()
+
+
+_transactions_supported: Optional[bool] = None
+
+
+async def transactions_supported() -> bool:
+    """Multi-document transactions need a replica set or sharded cluster"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await get_client().admin.command("hello")
+        _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+    return _transactions_supported
+
+
+async def transactional(callback: Callable[[object], Awaitable[T]]) -> T:
+    """Run ``callback(session)`` inside a transaction when the deployment
+    supports one; on a standalone server it runs with ``session=None``.
+    Returns whatever the callback returns."""
+    if not await transactions_supported():
+        return await callback(None)
+    async with await get_client().start_session() as session:
+        async with session.start_transaction():
+            return await callback(session)
+
+
+class LazyDatabase:
+    """Module-level stand-in for a database handle that binds to the
+    current worker's client on first attribute access."""
+
+    def __init__(self, policy: str):
+        self._policy = policy
+
+    def __getattr__(self, name):
+        return getattr(get_database(self._policy), name)
+
+    def __getitem__(self, name):
+        return get_database(self._policy)[name]
+
+
+async def warm_pool(client: AsyncIOMotorClient, connections: int) -> None:
+    """Open up to ``connections`` sockets up front by issuing concurrent pings"""
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(1, connections))))
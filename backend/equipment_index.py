@@ -0,0 +1,119 @@
+"""In-memory prefix index over equipment name and serial number.
+
+Keys are kept in a single sorted list of ``"<key>\\x00<equipment id>"``
+strings, so a lookup is one ``bisect`` plus a short forward scan and the
+index costs a handful of strings per asset rather than a trie node per
+character.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+SEPARATOR = "\x00"
+
+# Index at most this many word-suffixes of a name ("hydraulic press 2",
+# "press 2", "2") so memory stays bounded for long free-text names
+MAX_NAME_TOKENS = 4
+
+
+class EquipmentSuggestion:
+    __slots__ = ("id", "name", "serial_number", "category", "location")
+
+    def __init__(self, id: str, name: str, serial_number: str, category: str, location: str):
+        self.id = id
+        self.name = name
+        self.serial_number = serial_number
+        self.category = category
+        self.location = location
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "serial_number": self.serial_number,
+            "category": self.category,
+            "location": self.location,
+        }
+
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").replace(SEPARATOR, "").lower().split())
+
+
+def _index_keys(name: str, serial_number: str) -> List[str]:
+    keys = []
+    serial = _normalize(serial_number)
+    if serial:
+        keys.append(serial)
+    words = _normalize(name).split(" ")
+    for i in range(min(len(words), MAX_NAME_TOKENS)):
+        key = " ".join(words[i:])
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+class EquipmentPrefixIndex:
+    def __init__(self):
+        self._entries: List[str] = []
+        self._records: Dict[str, Tuple[EquipmentSuggestion, List[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def load(self, docs) -> None:
+        """Replace the index contents with ``docs`` in a single sort"""
+        records = {}
+        entries = []
+        for doc in docs:
+            record, keys = self._build(doc)
+            records[record.id] = (record, keys)
+            entries.extend(f"{key}{SEPARATOR}{record.id}" for key in keys)
+        entries.sort()
+        self._records = records
+        self._entries = entries
+
+    def upsert(self, doc: dict) -> None:
+        self.remove(doc["id"])
+        record, keys = self._build(doc)
+        self._records[record.id] = (record, keys)
+        for key in keys:
+            insort(self._entries, f"{key}{SEPARATOR}{record.id}")
+
+    def remove(self, equipment_id: str) -> None:
+        existing = self._records.pop(equipment_id, None)
+        if not existing:
+            return
+        for key in existing[1]:
+            entry = f"{key}{SEPARATOR}{equipment_id}"
+            pos = bisect_left(self._entries, entry)
+            if pos < len(self._entries) and self._entries[pos] == entry:
+                del self._entries[pos]
+
+    def suggest(self, query: str, limit: int = 10) -> List[dict]:
+        prefix = _normalize(query)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        pos = bisect_left(self._entries, prefix)
+        while pos < len(self._entries) and len(results) < limit:
+            entry = self._entries[pos]
+            if not entry.startswith(prefix):
+                break
+            equipment_id = entry.rsplit(SEPARATOR, 1)[1]
+            if equipment_id not in seen:
+                seen.add(equipment_id)
+                results.append(self._records[equipment_id][0].to_dict())
+            pos += 1
+        return results
+
+    @staticmethod
+    def _build(doc: dict) -> Tuple[EquipmentSuggestion, List[str]]:
+        record = EquipmentSuggestion(
+            id=doc["id"],
+            name=doc.get("name") or "",
+            serial_number=doc.get("serial_number") or "",
+            category=doc.get("category") or "",
+            location=doc.get("location") or "",
+        )
+        return record, _index_keys(record.name, record.serial_number)
@@ -0,0 +1,155 @@
+"""Per-asset maintenance rollups kept in the ``equipment_stats`` collection.
+
+Each request write turns into a small ``$inc``/``$min``/``$max`` update on
+its asset's stats document, so the equipment detail page reads one
+document instead of scanning the asset's history. ``rebuild_pipeline``
+recomputes everything from ``requests`` for backfills.
+
+MTTR is the mean time from creation to ``repaired`` for corrective
+requests; MTBF is the mean gap between corrective requests. Timestamps are
+the ISO strings the API already stores, which order correctly as strings.
+"""
+from datetime import datetime
+from typing import Optional
+
+STATS_COLLECTION = "equipment_stats"
+
+CLOSED_REPAIR_STAGE = "repaired"
+
+
+def _hours_between(start: str, end: str) -> float:
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds() / 3600
+
+
+def _request_type(request: dict) -> str:
+    request_type = request.get("request_type") or "corrective"
+    return getattr(request_type, "value", request_type)
+
+
+def _is_corrective(request: dict) -> bool:
+    return _request_type(request) == "corrective"
+
+
+def stats_for_create(request: dict) -> dict:
+    inc = {
+        "request_count": 1,
+        f"{_request_type(request)}_count": 1,
+        "total_hours": request.get("hours_spent") or 0,
+    }
+    update = {"$inc": inc}
+    if _is_corrective(request):
+        inc["failure_count"] = 1
+        update["$min"] = {"first_failure_at": request["created_at"]}
+        update["$max"] = {"last_failure_at": request["created_at"]}
+    return update
+
+
+def stats_for_change(existing: dict, changes: dict, now: str) -> Optional[dict]:
+    """Stats update for applying ``changes`` to request ``existing``.
+
+    Also adds ``repaired_at`` to ``changes`` when the request enters the
+    repaired stage (and clears it when it leaves), since that is what a
+    later reversal needs to undo its contribution.
+    """
+    inc = {}
+    update = {}
+
+    if changes.get("hours_spent") is not None:
+        delta = changes["hours_spent"] - (existing.get("hours_spent") or 0)
+        if delta:
+            inc["total_hours"] = delta
+
+    new_stage = changes.get("stage")
+    old_stage = existing.get("stage")
+    if new_stage is not None and new_stage != old_stage and _is_corrective(existing):
+        if new_stage == CLOSED_REPAIR_STAGE:
+            changes["repaired_at"] = now
+            inc["repair_count"] = 1
+            inc["repair_hours_total"] = _hours_between(existing["created_at"], now)
+            update["$max"] = {"last_repair_at": now}
+        elif old_stage == CLOSED_REPAIR_STAGE and existing.get("repaired_at"):
+            changes["repaired_at"] = None
+            inc["repair_count"] = -1
+            inc["repair_hours_total"] = -_hours_between(existing["created_at"], existing["repaired_at"])
+
+    if not inc and not update:
+        return None
+    if inc:
+        update["$inc"] = inc
+    return update
+
+
+def stats_for_delete(existing: dict) -> dict:
+    inc = {
+        "request_count": -1,
+        f"{_request_type(existing)}_count": -1,
+        "total_hours": -(existing.get("hours_spent") or 0),
+    }
+    if _is_corrective(existing):
+        # first/last failure bounds are left as-is; MTBF drifts slightly
+        # until the next rebuild
+        inc["failure_count"] = -1
+        if existing.get("stage") == CLOSED_REPAIR_STAGE and existing.get("repaired_at"):
+            inc["repair_count"] = -1
+            inc["repair_hours_total"] = -_hours_between(existing["created_at"], existing["repaired_at"])
+    return {"$inc": inc}
+
+
+def summarize(stats: Optional[dict]) -> dict:
+    stats = stats or {}
+    repair_count = stats.get("repair_count", 0)
+    failure_count = stats.get("failure_count", 0)
+    mtbf = None
+    if failure_count > 1 and stats.get("first_failure_at") and stats.get("last_failure_at"):
+        mtbf = _hours_between(stats["first_failure_at"], stats["last_failure_at"]) / (failure_count - 1)
+    return {
+        "request_count": stats.get("request_count", 0),
+        "corrective_count": stats.get("corrective_count", 0),
+        "preventive_count": stats.get("preventive_count", 0),
+        "total_hours": round(stats.get("total_hours", 0), 2),
+        "repair_count": repair_count,
+        "mttr_hours": round(stats["repair_hours_total"] / repair_count, 2) if repair_count else None,
+        "mtbf_hours": round(mtbf, 2) if mtbf is not None else None,
+        "last_repair_at": stats.get("last_repair_at"),
+        "last_failure_at": stats.get("last_failure_at"),
+    }
+
+
+def rebuild_pipeline(union_with: Optional[str] = None) -> list:
+    """Aggregation that recomputes every asset's stats from ``requests``,
+    plus the ``union_with`` collection (the archive) when given.
+
+    Requests repaired before ``repaired_at`` was recorded use ``updated_at``
+    as their repair time.
+    """
+    corrective = {"$eq": [{"$ifNull": ["$request_type", "corrective"]}, "corrective"]}
+    repaired = {"$and": [corrective, {"$eq": ["$stage", CLOSED_REPAIR_STAGE]}]}
+    repaired_at = {"$ifNull": ["$repaired_at", "$updated_at"]}
+    repair_ms = {
+        "$subtract": [
+            {"$dateFromString": {"dateString": repaired_at}},
+            {"$dateFromString": {"dateString": "$created_at"}},
+        ]
+    }
+    # Archived requests soft-deleted with their equipment are left out
+    union = [
+        {"$unionWith": {"coll": union_with, "pipeline": [{"$match": {"deleted_at": {"$exists": False}}}]}}
+    ] if union_with else []
+    return union + [
+        {"$group": {
+            "_id": "$equipment_id",
+            "request_count": {"$sum": 1},
+            "corrective_count": {"$sum": {"$cond": [corrective, 1, 0]}},
+            "preventive_count": {"$sum": {"$cond": [corrective, 0, 1]}},
+            "total_hours": {"$sum": {"$ifNull": ["$hours_spent", 0]}},
+            "failure_count": {"$sum": {"$cond": [corrective, 1, 0]}},
+            "first_failure_at": {"$min": {"$cond": [corrective, "$created_at", None]}},
+            "last_failure_at": {"$max": {"$cond": [corrective, "$created_at", None]}},
+            "repair_count": {"$sum": {"$cond": [repaired, 1, 0]}},
+            "repair_hours_total": {"$sum": {"$cond": [repaired, {"$divide": [repair_ms, 3600000]}, 0]}},
+            "last_repair_at": {"$max": {"$cond": [repaired, repaired_at, None]}},
+        }},
+        {"$addFields": {"equipment_id": "$_id"}},
+        {"$project": {"_id": 0}},
+        {"$merge": {"into": STATS_COLLECTION, "on": "equipment_id", "whenMatched": "replace"}},
+    ]
@@ -0,0 +1,25 @@
+"""Multi-process deployment: ``gunicorn -c gunicorn.conf.py server:app`` from backend/.
+
+Each worker builds its own Motor client and in-memory caches on startup
+(see database.get_client and the startup hooks in server.py); caches are
+kept consistent across workers by invalidation.InvalidationBus.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Importing server.py opens no connections, so the app can be loaded once
+# in the master and shared copy-on-write by the forked workers
+preload_app = True
+
+keepalive = int(os.environ.get("KEEPALIVE_SECONDS", "5"))
+timeout = int(os.environ.get("WORKER_TIMEOUT_SECONDS", "60"))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT_SECONDS", "30"))
+max_requests = int(os.environ.get("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.environ.get("ACCESS_LOG") or None
+errorlog = "-"
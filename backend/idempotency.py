@@ -0,0 +1,116 @@
+"""``Idempotency-Key`` support for create endpoints.
+
+The first request with a key claims it by inserting a pending record into
+``idempotency_keys`` (unique on scope + caller + key, so two users' keys
+never meet), runs the handler and stores its response. Retries with the
+same key get the stored response back without re-running the handler; a
+retry that arrives while the first is still running gets 409. A claim is
+a lease of ``LEASE_SECONDS``: if its holder died before storing a
+response, the next retry after that takes it over and runs the handler.
+Records expire through a TTL index.
+"""
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# Longer than any request may run (gunicorn's WORKER_TIMEOUT_SECONDS)
+LEASE_SECONDS = int(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", "60"))
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(payload: BaseModel) -> str:
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, database):
+        self._database = database
+
+    async def ensure_indexes(self) -> None:
+        await self._database[IDEMPOTENCY_COLLECTION].create_index(
+            "created_at", expireAfterSeconds=TTL_SECONDS
+        )
+
+    async def run(
+        self,
+        scope: str,
+        key: Optional[str],
+        payload: BaseModel,
+        handler: Callable[[], Awaitable[dict]],
+        caller: Optional[str] = None,
+    ) -> dict:
+        """Run ``handler`` once per ``key`` of ``caller`` (a user id, or None
+        for unauthenticated calls) in ``scope``"""
+        if not key:
+            return await handler()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+        collection = self._database[IDEMPOTENCY_COLLECTION]
+        record_id = f"{scope}:{caller or '-'}:{key}"
+        payload_hash = fingerprint(payload)
+        claim = uuid.uuid4().hex
+        now = datetime.now(timezone.utc)
+        try:
+            await collection.insert_one({
+                "_id": record_id,
+                "status": "pending",
+                "payload_hash": payload_hash,
+                "claim": claim,
+                "claimed_at": now,
+                "created_at": now,
+            })
+        except DuplicateKeyError:
+            if not await self._reclaim(record_id, payload_hash, claim):
+                return await self._replay(record_id, payload_hash)
+
+        try:
+            response = await handler()
+        except BaseException:
+            # Let the client retry with the same key
+            await collection.delete_one({"_id": record_id, "status": "pending", "claim": claim})
+            raise
+        await collection.update_one(
+            {"_id": record_id, "claim": claim},
+            {"$set": {"status": "done", "response": response}},
+        )
+        return response
+
+    async def _reclaim(self, record_id: str, payload_hash: str, claim: str) -> bool:
+        """Take over a pending record whose holder outlived its lease"""
+        now = datetime.now(timezone.utc)
+        expired = now - timedelta(seconds=LEASE_SECONDS)
+        record = await self._database[IDEMPOTENCY_COLLECTION].find_one_and_update(
+            {
+                "_id": record_id,
+                "status": "pending",
+                "payload_hash": payload_hash,
+                "claimed_at": {"$lt": expired},
+            },
+            {"$set": {"claim": claim, "claimed_at": now}},
+        )
+        return record is not None
+
+    async def _replay(self, record_id: str, payload_hash: str) -> dict:
+        record = await self._database[IDEMPOTENCY_COLLECTION].find_one({"_id": record_id})
+        if record is None:
+            raise HTTPException(status_code=409, detail="Request with this Idempotency-Key was retried; try again")
+        if record.get("payload_hash") != payload_hash:
+            raise HTTPException(
+                status_code=422, detail="Idempotency-Key was already used with a different payload"
+            )
+        if record.get("status") != "done":
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        return record["response"]
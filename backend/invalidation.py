@@ -0,0 +1,128 @@
+"""Cross-worker cache invalidation over a capped MongoDB collection.
+
+Each worker process keeps its own in-memory caches. When one worker
+changes data behind a cache it publishes a small event; every other worker
+tails the capped collection and applies it. If tailing is interrupted,
+subscribers are asked to resync from the database because events may have
+been missed; an idle channel is not an interruption.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_COLLECTION = "cache_events"
+CHANNEL_SIZE_BYTES = 4 * 1024 * 1024
+RETRY_DELAY_SECONDS = 1.0
+
+Handler = Callable[[dict], Awaitable[None]]
+Resync = Callable[[], Awaitable[None]]
+
+
+class InvalidationBus:
+    def __init__(self, database):
+        self._database = database
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._resyncs: List[Resync] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, channel: str, handler: Handler, resync: Optional[Resync] = None) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+        if resync is not None:
+            self._resyncs.append(resync)
+
+    async def publish(self, channel: str, **payload) -> None:
+        event = {
+            "channel": channel,
+            "origin": self.worker_id,
+            "at": datetime.now(timezone.utc),
+            "payload": payload,
+        }
+        try:
+            await self._database[CHANNEL_COLLECTION].insert_one(event)
+        except PyMongoError:
+            # Other workers will catch up on their next resync
+            logger.exception("Failed to publish cache event on %s", channel)
+
+    async def start(self) -> None:
+        try:
+            await self._database.create_collection(
+                CHANNEL_COLLECTION, capped=True, size=CHANNEL_SIZE_BYTES
+            )
+        except CollectionInvalid:
+            pass
+        await self.publish("_hello")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        collection = self._database[CHANNEL_COLLECTION]
+        needs_resync = False
+        while True:
+            try:
+                anchor = await self._anchor(collection)
+                if needs_resync:
+                    await self._resync()
+                    needs_resync = False
+                # Capped collections keep insertion order, but ObjectIds made in
+                # different processes do not sort in it, so tail in $natural
+                # order and skip everything up to the anchor
+                cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                past_anchor = False
+                # An idle awaitData wait ends the async for; the cursor lives on
+                while cursor.alive:
+                    async for event in cursor:
+                        if not past_anchor:
+                            past_anchor = event["_id"] == anchor["_id"]
+                        elif event.get("origin") != self.worker_id:
+                            await self._dispatch(event)
+                    if not past_anchor:
+                        # Caught up without meeting the anchor: it was overwritten
+                        # and newer events were skipped with it
+                        past_anchor = True
+                        await self._resync()
+                logger.warning("Cache invalidation cursor closed; will resync")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation channel interrupted; will resync")
+            needs_resync = True
+            await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+    async def _anchor(self, collection) -> dict:
+        """Newest event; a tailable cursor on an empty capped collection dies at once"""
+        last = await collection.find_one({}, sort=[("$natural", -1)])
+        if last is None:
+            await self.publish("_hello")
+            last = await collection.find_one({}, sort=[("$natural", -1)])
+        if last is None:
+            raise RuntimeError(f"{CHANNEL_COLLECTION} is still empty")
+        return last
+
+    async def _dispatch(self, event: dict) -> None:
+        for handler in self._handlers.get(event.get("channel"), []):
+            try:
+                await handler(event.get("payload") or {})
+            except Exception:
+                logger.exception("Cache event handler failed for %s", event.get("channel"))
+
+    async def _resync(self) -> None:
+        for resync in self._resyncs:
+            await resync()
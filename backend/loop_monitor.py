@@ -0,0 +1,149 @@
+"""Event-loop lag measurement and slow-callback watchdog.
+
+A background task sleeps for a fixed interval and records how late it
+woke up; that delay is time the loop spent running something else
+without yielding.
+
+Lag alone says the loop stalled, not what stalled it. When a stall
+threshold is set, a watchdog thread also watches the task's heartbeat and,
+while the loop is still blocked, logs the loop thread's stack together
+with the route of the request whose task is running, and counts stalls
+per route.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import defaultdict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LagMonitor:
+    def __init__(self, interval: float = 0.1, smoothing: float = 0.2, stall_threshold_ms: Optional[float] = None):
+        self.interval = interval
+        self._smoothing = smoothing
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.stall_threshold_ms = stall_threshold_ms
+        self._task: Optional[asyncio.Task] = None
+
+        # Watchdog state; _heartbeat is written by the loop, read by the thread
+        self._heartbeat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._watchdog_stop = threading.Event()
+        self._requests: "weakref.WeakKeyDictionary[asyncio.Task, dict]" = weakref.WeakKeyDictionary()
+        # Written by the watchdog thread, read by /health on the loop thread
+        self._stalls_lock = threading.Lock()
+        self.stalls: Dict[str, dict] = defaultdict(lambda: {"count": 0, "max_ms": 0.0})
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._heartbeat = time.monotonic()
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+        if self.stall_threshold_ms and self._watchdog is None:
+            self._watchdog_stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._watchdog:
+            self._watchdog_stop.set()
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self, reset_max: bool = False) -> dict:
+        with self._stalls_lock:
+            stalls = {route: dict(stats) for route, stats in self.stalls.items()}
+        snapshot = {
+            "lag_ms": round(self.lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "stalls": stalls,
+        }
+        if reset_max:
+            self.max_lag_ms = 0.0
+        return snapshot
+
+    def _record(self, lag_ms: float) -> None:
+        # Smoothed so one late tick does not flip load shedding on and off
+        self.lag_ms += self._smoothing * (lag_ms - self.lag_ms)
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._heartbeat = time.monotonic()
+            self._record(max(0.0, (time.perf_counter() - started - self.interval) * 1000))
+
+    # -------------------------------------------------------------------------
+    # Watchdog
+    # -------------------------------------------------------------------------
+    def middleware(self, app):
+        """ASGI wrapper that tags each request's task with its scope"""
+        monitor = self
+
+        async def tag_request(scope, receive, send):
+            if scope["type"] != "http":
+                await app(scope, receive, send)
+                return
+            task = asyncio.current_task()
+            monitor._requests[task] = scope
+            try:
+                await app(scope, receive, send)
+            finally:
+                monitor._requests.pop(task, None)
+
+        return tag_request
+
+    def _current_route(self) -> str:
+        # Runs on the watchdog thread while the loop thread is blocked, so
+        # the loop's current task cannot change underneath us
+        task = asyncio.current_task(self._loop)
+        scope = self._requests.get(task) if task is not None else None
+        if scope is None:
+            return "<background>" if task is not None else "<loop callback>"
+        route = scope.get("route")
+        return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+    def _watch(self) -> None:
+        threshold = self.stall_threshold_ms / 1000
+        check_every = max(0.01, min(self.interval, threshold) / 2)
+        reported_beat = None
+        while not self._watchdog_stop.wait(check_every):
+            beat = self._heartbeat
+            # The heartbeat is legitimately up to one interval old
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < threshold:
+                if reported_beat is not None and beat != reported_beat:
+                    reported_beat = None
+                continue
+            route = self._current_route()
+            new_stall = beat != reported_beat
+            with self._stalls_lock:
+                stats = self.stalls[route]
+                if new_stall:
+                    stats["count"] += 1
+                stats["max_ms"] = round(max(stats["max_ms"], blocked * 1000), 1)
+            if new_stall:
+                reported_beat = beat
+                frame = sys._current_frames().get(self._loop_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>\n"
+                logger.warning(
+                    "Event loop blocked for %.0f ms in %s\n%s", blocked * 1000, route, stack.rstrip()
+                )
@@ -0,0 +1,366 @@
+"""Usage meters (machine hours, cycle counts) and meter-driven preventive work.
+
+Readings are buffered in memory and written every ``flush_interval``
+seconds (or once ``max_pending`` are waiting) with one unordered
+``insert_many`` into the ``meter_readings`` time-series collection,
+bucketed per asset and meter. The same flush upserts each meter's latest
+value into ``meter_latest``, one small document per asset and meter.
+
+Each reading's ``_id`` is derived from its asset, meter and timestamp, so
+a flush that is retried after a partial failure does not store a reading
+twice: ops a ``BulkWriteError`` reports as failed are the only ones put
+back, and duplicate-key errors count as stored. Time-series collections
+do not enforce unique ``_id``s, so ``history`` also drops repeats. The
+buffer holds at most ``max_buffered`` readings; past that ``ingest``
+raises ``MeterBufferFull`` until a flush gets through.
+
+A threshold says "every ``interval`` units"; its ``next_due`` value is
+kept in memory, so checking a reading costs a dict lookup. When a reading
+reaches it, ``on_due`` opens the preventive request first, under an id
+derived from the threshold and the due value, and only then is
+``next_due`` advanced with a compare-and-set. A failed request leaves the
+threshold due, so the next reading tries again; workers that see the same
+crossing open the same request id, so only one request is stored.
+"""
+import asyncio
+import logging
+import math
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+READINGS_COLLECTION = "meter_readings"
+LATEST_COLLECTION = "meter_latest"
+THRESHOLDS_COLLECTION = "meter_thresholds"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+DUPLICATE_KEY = 11000
+
+Key = Tuple[str, str]
+
+
+class MeterBufferFull(Exception):
+    """Too many readings are waiting to be written; retry shortly"""
+
+
+class _PartialFlush(Exception):
+    """Part of a flush was stored; carries what was not"""
+
+    def __init__(self, readings: List[dict], latest: Dict[Key, dict]):
+        super().__init__(f"{len(readings)} readings and {len(latest)} latest values not stored")
+        self.readings = readings
+        self.latest = latest
+
+
+def _key_id(equipment_id: str, meter: str) -> str:
+    return f"{equipment_id}:{meter}"
+
+
+def occurrence_id(threshold: dict, due: float) -> str:
+    """Request id for one crossing of ``threshold``; the same on every worker"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"meter:{threshold['_id']}:{threshold.get('updated_at')}:{float(due)!r}"))
+
+
+def _aware(value: datetime) -> datetime:
+    # Motor returns naive UTC datetimes unless the client is tz-aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def ensure_collections(database) -> None:
+    try:
+        await database.create_collection(
+            READINGS_COLLECTION,
+            timeseries={"timeField": "at", "metaField": "meta", "granularity": "seconds"},
+        )
+    except CollectionInvalid:
+        pass  # already exists
+    except OperationFailure:
+        # Time-series collections need MongoDB 5.0; a plain one still works
+        logger.warning("Time-series collections unavailable; %s is a regular collection", READINGS_COLLECTION)
+    await database[READINGS_COLLECTION].create_index(
+        [("meta.equipment_id", ASCENDING), ("meta.meter", ASCENDING), ("at", DESCENDING)]
+    )
+    await database[THRESHOLDS_COLLECTION].create_index("equipment_id")
+    await database[LATEST_COLLECTION].create_index("equipment_id")
+
+
+class MeterService:
+    def __init__(
+        self,
+        database,
+        on_due: Callable[[dict, float, float, str], Awaitable[dict]],
+        flush_interval: float = 1.0,
+        max_pending: int = 5000,
+        max_buffered: int = 100_000,
+    ):
+        self._database = database
+        self._on_due = on_due
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_buffered = max_buffered
+        self._pending: List[dict] = []
+        # Newest reading per meter whose meter_latest upsert is still owed
+        self._pending_latest: Dict[Key, dict] = {}
+        self._latest: Dict[Key, Tuple[datetime, float]] = {}
+        self._thresholds: Dict[Key, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    # -------------------------------------------------------------------------
+    # Ingestion
+    # -------------------------------------------------------------------------
+    async def ingest(self, readings: List[dict]) -> List[dict]:
+        """Buffer ``readings`` ({equipment_id, meter, value, at}); returns the
+        requests opened for thresholds they crossed. Raises ``MeterBufferFull``,
+        buffering none of them, when the buffer cannot take the batch."""
+        if len(self._pending) + len(readings) > self.max_buffered:
+            self._wakeup.set()
+            raise MeterBufferFull(f"{len(self._pending)} meter readings are waiting to be written")
+        due: Dict[Key, float] = {}
+        for reading in readings:
+            key = (reading["equipment_id"], reading["meter"])
+            at = reading["at"]
+            self._pending.append({
+                "_id": f"{_key_id(*key)}@{at.isoformat()}",
+                "at": at,
+                "meta": {"equipment_id": key[0], "meter": key[1]},
+                "value": reading["value"],
+            })
+            latest = self._latest.get(key)
+            if latest is not None and latest[0] >= at:
+                # Late or replayed readings are stored but drive nothing
+                continue
+            self._latest[key] = (at, reading["value"])
+            threshold = self._thresholds.get(key)
+            if threshold and reading["value"] >= threshold["next_due"]:
+                due[key] = max(reading["value"], due.get(key, 0))
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+        created = []
+        for key, value in due.items():
+            request = await self._trigger(key, value)
+            if request:
+                created.append(request)
+        return created
+
+    async def _trigger(self, key: Key, value: float) -> Optional[dict]:
+        threshold = self._thresholds[key]
+        interval = threshold["interval"]
+        due_at = threshold["next_due"]
+        try:
+            request = await self._on_due(threshold, due_at, value, occurrence_id(threshold, due_at))
+        except Exception:
+            # next_due is untouched, so the next reading past it tries again
+            logger.exception("Opening preventive request for %s %s failed", *key)
+            return None
+        # Skip whole intervals a long gap in readings jumped over
+        next_due = due_at + interval * (math.floor((value - due_at) / interval) + 1)
+        claimed = await self._database[THRESHOLDS_COLLECTION].find_one_and_update(
+            {"_id": _key_id(*key), "next_due": due_at},
+            {"$set": {
+                "next_due": next_due,
+                "last_due": due_at,
+                "last_value": value,
+                "last_triggered_at": datetime.now(timezone.utc).isoformat(),
+                "last_request_id": request["id"],
+            }},
+            return_document=ReturnDocument.AFTER,
+        )
+        if claimed is None:
+            # Another worker advanced it first, having opened the same request
+            await self.reload_threshold(*key)
+            return None
+        self._thresholds[key] = claimed
+        return request
+
+    # -------------------------------------------------------------------------
+    # Thresholds
+    # -------------------------------------------------------------------------
+    async def set_threshold(self, equipment_id: str, meter: str, interval: float, priority: str) -> dict:
+        """Open a preventive request every ``interval`` units, counted from the current reading"""
+        stored = await self._database[LATEST_COLLECTION].find_one({"_id": _key_id(equipment_id, meter)})
+        # Counters only go up; take whichever of this worker's and the
+        # stored latest value is further along
+        current = max(
+            stored["value"] if stored else 0,
+            self._latest.get((equipment_id, meter), (None, 0))[1],
+        )
+        doc = {
+            "_id": _key_id(equipment_id, meter),
+            "equipment_id": equipment_id,
+            "meter": meter,
+            "interval": interval,
+            "priority": priority,
+            "next_due": current + interval,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self._database[THRESHOLDS_COLLECTION].replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        self._thresholds[(equipment_id, meter)] = doc
+        return doc
+
+    async def remove_threshold(self, equipment_id: str, meter: str) -> bool:
+        result = await self._database[THRESHOLDS_COLLECTION].delete_one({"_id": _key_id(equipment_id, meter)})
+        self._thresholds.pop((equipment_id, meter), None)
+        return result.deleted_count > 0
+
+    async def reload_threshold(self, equipment_id: str, meter: str) -> None:
+        doc = await self._database[THRESHOLDS_COLLECTION].find_one({"_id": _key_id(equipment_id, meter)})
+        if doc:
+            self._thresholds[(equipment_id, meter)] = doc
+        else:
+            self._thresholds.pop((equipment_id, meter), None)
+
+    async def load(self) -> None:
+        """Thresholds and latest readings of every meter, for startup and cache-bus resyncs"""
+        self._thresholds = {
+            (doc["equipment_id"], doc["meter"]): doc
+            async for doc in self._database[THRESHOLDS_COLLECTION].find({})
+        }
+        async for doc in self._database[LATEST_COLLECTION].find({}):
+            key = (doc["equipment_id"], doc["meter"])
+            at = _aware(doc["at"])
+            if key not in self._latest or self._latest[key][0] < at:
+                self._latest[key] = (at, doc["value"])
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+    async def meters(self, equipment_id: str) -> Dict[str, dict]:
+        """Latest reading and threshold per meter of one asset, across all workers"""
+        latest, thresholds = await asyncio.gather(
+            self._database[LATEST_COLLECTION].find({"equipment_id": equipment_id}).to_list(None),
+            self._database[THRESHOLDS_COLLECTION].find({"equipment_id": equipment_id}).to_list(None),
+        )
+        meters: Dict[str, dict] = {}
+        for doc in latest:
+            meters.setdefault(doc["meter"], {})["latest"] = {"at": _aware(doc["at"]).isoformat(), "value": doc["value"]}
+        for doc in thresholds:
+            meters.setdefault(doc["meter"], {})["threshold"] = {k: v for k, v in doc.items() if k != "_id"}
+        return meters
+
+    async def history(self, equipment_id: str, meter: str, since: Optional[datetime], limit: int) -> List[dict]:
+        query = {"meta.equipment_id": equipment_id, "meta.meter": meter}
+        if since:
+            query["at"] = {"$gte": since}
+        cursor = self._database[READINGS_COLLECTION].find(query, {"_id": 0, "at": 1, "value": 1})
+        docs = await cursor.sort("at", DESCENDING).limit(limit).to_list(limit)
+        # A reading stored twice (see the module docstring) has one timestamp
+        seen = set()
+        readings = []
+        for doc in docs:
+            if doc["at"] not in seen:
+                seen.add(doc["at"])
+                readings.append({"at": _aware(doc["at"]).isoformat(), "value": doc["value"]})
+        return readings
+
+    # -------------------------------------------------------------------------
+    # Write-behind
+    # -------------------------------------------------------------------------
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="meter-buffer")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending and not self._pending_latest:
+                return 0
+            batch, self._pending = self._pending, []
+            latest, self._pending_latest = self._pending_latest, {}
+            try:
+                await self._write(batch, latest)
+            except _PartialFlush as exc:
+                self._requeue(exc.readings, exc.latest)
+                raise
+            except Exception:
+                # Outcome unknown; the readings' _ids make storing them again harmless
+                self._requeue(batch, latest)
+                raise
+            return len(batch)
+
+    def _requeue(self, readings: List[dict], latest: Dict[Key, dict]) -> None:
+        self._pending[:0] = readings
+        for key, doc in latest.items():
+            current = self._pending_latest.get(key)
+            if current is None or current["at"] < doc["at"]:
+                self._pending_latest[key] = doc
+
+    async def _write(self, batch: List[dict], latest: Dict[Key, dict]) -> None:
+        failed: List[dict] = []
+        if batch:
+            try:
+                await self._database[READINGS_COLLECTION].insert_many(batch, ordered=False)
+            except BulkWriteError as exc:
+                # Duplicates were stored by an earlier, partly failed flush
+                failed = [
+                    batch[error["index"]]
+                    for error in exc.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY
+                ]
+                if failed:
+                    logger.warning("%d of %d meter readings were not stored", len(failed), len(batch))
+
+        newest = dict(latest)
+        failed_ids = {doc["_id"] for doc in failed}
+        for doc in batch:
+            if doc["_id"] in failed_ids:
+                continue
+            key = (doc["meta"]["equipment_id"], doc["meta"]["meter"])
+            if key not in newest or newest[key]["at"] < doc["at"]:
+                newest[key] = doc
+        if newest:
+            try:
+                await self._write_latest(newest)
+            except Exception as exc:
+                raise _PartialFlush(failed, newest) from exc
+        if failed:
+            raise _PartialFlush(failed, {})
+
+    async def _write_latest(self, newest: Dict[Key, dict]) -> None:
+        # Only move meter_latest forward: another worker may have written a
+        # newer reading for the same meter
+        await self._database[LATEST_COLLECTION].bulk_write(
+            [
+                UpdateOne(
+                    {"_id": _key_id(*key)},
+                    [{"$set": {
+                        "equipment_id": key[0],
+                        "meter": key[1],
+                        "value": {"$cond": [{"$gt": [doc["at"], {"$ifNull": ["$at", EPOCH]}]}, doc["value"], "$value"]},
+                        "at": {"$cond": [{"$gt": [doc["at"], {"$ifNull": ["$at", EPOCH]}]}, doc["at"], "$at"]},
+                    }}],
+                    upsert=True,
+                )
+                for key, doc in newest.items()
+            ],
+            ordered=False,
+        )
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Flushing buffered meter readings failed; will retry")
@@ -0,0 +1,23 @@
+"""Data migrations, applied in version order with ``python -m migrations``.
+
+Add a migration as ``mNNNN_<name>.py`` exposing ``migration`` and list it
+in ``MIGRATIONS``. Backfills must be idempotent: a pass's query only
+matches documents that still need the change. A pass's ``update`` should
+log and return ``None`` for a document it cannot convert rather than
+raise, so one bad row does not stop the migration.
+"""
+from migrations import m0001_request_scheduled_at, m0002_request_created_ts, m0003_sync_seq
+from migrations.runner import (
+    MIGRATIONS_COLLECTION, Backfill, Migration, MigrationRunner, RunnerBusy, pending, status,
+)
+
+MIGRATIONS = [
+    m0001_request_scheduled_at.migration,
+    m0002_request_created_ts.migration,
+    m0003_sync_seq.migration,
+]
+
+__all__ = [
+    "MIGRATIONS", "MIGRATIONS_COLLECTION", "Backfill", "Migration", "MigrationRunner", "RunnerBusy", "pending",
+    "status",
+]
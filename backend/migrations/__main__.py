@@ -0,0 +1,59 @@
+"""Apply or inspect data migrations against the configured database.
+
+    cd backend && python -m migrations status
+    cd backend && python -m migrations up --rate 1000
+
+Safe to run while the API is serving: batches are paced, an interrupted
+run resumes from its recorded position, and the API's own background
+runner waits while this one holds the lease.
+"""
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from database import close_client, get_database
+from migrations import MIGRATIONS, MigrationRunner, status
+
+
+async def show_status() -> None:
+    for row in await status(get_database(), MIGRATIONS):
+        processed = sum(step.get("processed", 0) for step in row["steps"])
+        skipped = sum(step.get("skipped", 0) for step in row["steps"])
+        print(f"{row['version']:04d}  {row['name']:<32}{row['status']:<10}{processed:>10,} docs"
+              + (f"  {skipped:,} skipped" if skipped else "")
+              + (f"  error: {row['error']}" if row["error"] else ""))
+
+
+async def up(args) -> None:
+    runner = MigrationRunner(get_database(), batch_size=args.batch_size, docs_per_second=args.rate)
+    applied = await runner.run(MIGRATIONS, to_version=args.to)
+    print(f"Applied {len(applied)} migration(s)" + (f": {', '.join(f'{v:04d}' for v in applied)}" if applied else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m migrations", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="list migrations and their progress")
+    run = commands.add_parser("up", help="apply pending migrations")
+    run.add_argument("--to", type=int, help="stop after this version")
+    run.add_argument("--batch-size", type=int, default=500)
+    run.add_argument("--rate", type=float, default=2000, help="documents per second; 0 for no limit")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    async def command():
+        try:
+            await (show_status() if args.command == "status" else up(args))
+        finally:
+            close_client()
+
+    asyncio.run(command())
+
+
+if __name__ == "__main__":
+    main()
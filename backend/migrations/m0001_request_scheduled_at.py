@@ -0,0 +1,20 @@
+"""Typed ``scheduled_at`` for requests written before the overdue sweep.
+
+This used to run at the start of every sweep, which scanned the whole
+collection for documents missing the field each time.
+"""
+from migrations.runner import Backfill, Migration
+from overdue import parse_scheduled
+
+migration = Migration(
+    1,
+    "request_scheduled_at",
+    [
+        Backfill(
+            "requests",
+            {"scheduled_date": {"$nin": [None, ""]}, "scheduled_at": {"$exists": False}},
+            {"scheduled_date": 1},
+            lambda doc: {"scheduled_at": parse_scheduled(doc["scheduled_date"])},
+        ),
+    ],
+)
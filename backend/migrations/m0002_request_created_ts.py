@@ -0,0 +1,33 @@
+"""Typed ``created_ts`` next to the ISO ``created_at`` string on requests.
+
+Date operators (``$dateTrunc``, ``$week``) and time-series tooling need a
+BSON date; new requests are written with it and this fills in the rest,
+archived ones included.
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+from archive import ARCHIVE_COLLECTION
+from migrations.runner import Backfill, Migration
+
+logger = logging.getLogger(__name__)
+
+
+def _created_ts(doc: dict) -> Optional[dict]:
+    try:
+        return {"created_ts": datetime.fromisoformat(doc["created_at"])}
+    except ValueError:
+        logger.warning("Skipping document %s: unparseable created_at %r", doc["_id"], doc["created_at"])
+        return None
+
+
+migration = Migration(
+    2,
+    "request_created_ts",
+    [
+        Backfill(collection, {"created_at": {"$type": "string"}, "created_ts": {"$exists": False}},
+                 {"created_at": 1}, _created_ts)
+        for collection in ("requests", ARCHIVE_COLLECTION)
+    ],
+)
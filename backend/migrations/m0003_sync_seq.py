@@ -0,0 +1,20 @@
+"""Delta-sync positions for documents written before sync existed.
+
+Each batch is stamped like a live write, with a fresh ``sync_seq`` and
+``sync_at``. The backfill runs while the API serves, so a client can sync
+halfway through it; documents stamped afterwards land past that client's
+position and reach it on its next sync. (A fixed ``sync_seq`` of 0 would
+have sorted them behind it for good.) This used to run at every worker
+startup, scanning each synced collection for the missing field.
+"""
+from migrations.runner import Backfill, Migration
+from sync import SYNC_COLLECTIONS, sync_stamp
+
+migration = Migration(
+    3,
+    "sync_seq",
+    [
+        Backfill(collection, {"sync_seq": {"$exists": False}}, {}, lambda doc: {}, batch_fields=sync_stamp)
+        for collection in SYNC_COLLECTIONS
+    ],
+)
@@ -0,0 +1,184 @@
+"""Versioned, resumable data migrations.
+
+A ``Migration`` is a list of ``Backfill`` passes. Each pass walks one
+collection in ``_id`` order, ``batch_size`` documents at a time, and
+``$set``s the fields ``update(doc)`` returns on the documents that still
+match its query; a document ``update`` returns ``None`` for (a row it
+cannot convert) is counted as skipped and left alone. A pass with
+``batch_fields`` also sets the fields that coroutine returns, awaited once
+per batch, on every document of the batch. Progress (documents processed
+and the last ``_id`` per pass) is written to the ``migrations`` collection after every batch, so
+an interrupted run picks up where it stopped. Batches are paced to
+``docs_per_second`` so a backfill can run next to live traffic.
+
+Only one runner works at a time; it holds the ``migrations`` lease from
+``background``. The API applies pending migrations itself in the
+background (see ``server.apply_migrations``), so the CLI is only needed to
+run them ahead of a deploy or with different pacing.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+from background import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "migrations"
+LEASE_NAME = "migrations"
+LEASE_SECONDS = 60
+
+
+class RunnerBusy(RuntimeError):
+    """Another runner holds the migrations lease"""
+
+
+class Backfill:
+    """Sets ``update(doc)`` on every document of ``collection`` matching ``query``"""
+
+    def __init__(
+        self,
+        collection: str,
+        query: dict,
+        projection: dict,
+        update: Callable[[dict], Optional[dict]],
+        batch_fields: Optional[Callable[[object], Awaitable[dict]]] = None,
+    ):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.update = update
+        self.batch_fields = batch_fields
+
+
+class Migration:
+    def __init__(self, version: int, name: str, backfills: List[Backfill]):
+        self.version = version
+        self.name = name
+        self.backfills = backfills
+
+
+async def status(database, migrations: Iterable[Migration]) -> List[dict]:
+    records = {
+        record["_id"]: record
+        async for record in database[MIGRATIONS_COLLECTION].find({}, {"steps.last_id": 0})
+    }
+    return [
+        {
+            "version": migration.version,
+            "name": migration.name,
+            "status": records.get(migration.version, {}).get("status", "pending"),
+            "steps": records.get(migration.version, {}).get("steps", []),
+            "finished_at": records.get(migration.version, {}).get("finished_at"),
+            "error": records.get(migration.version, {}).get("error"),
+        }
+        for migration in migrations
+    ]
+
+
+async def pending(database, migrations: Iterable[Migration]) -> List[Migration]:
+    done = {
+        record["_id"]
+        async for record in database[MIGRATIONS_COLLECTION].find({"status": "done"}, {"_id": 1})
+    }
+    return [migration for migration in migrations if migration.version not in done]
+
+
+class MigrationRunner:
+    def __init__(self, database, batch_size: int = 500, docs_per_second: float = 2000):
+        self._database = database
+        self.batch_size = batch_size
+        self.docs_per_second = docs_per_second
+
+    async def run(self, migrations: Iterable[Migration], to_version: Optional[int] = None) -> List[int]:
+        """Apply pending migrations in version order; returns the versions applied"""
+        if not await acquire_lease(self._database, LEASE_NAME, LEASE_SECONDS):
+            raise RunnerBusy("Another migration runner is active")
+        applied = []
+        try:
+            for migration in sorted(await pending(self._database, migrations), key=lambda m: m.version):
+                if to_version is not None and migration.version > to_version:
+                    break
+                await self._apply(migration)
+                applied.append(migration.version)
+        finally:
+            await release_lease(self._database, LEASE_NAME)
+        return applied
+
+    async def _apply(self, migration: Migration) -> None:
+        records = self._database[MIGRATIONS_COLLECTION]
+        now = datetime.now(timezone.utc).isoformat()
+        record = await records.find_one_and_update(
+            {"_id": migration.version},
+            {
+                "$setOnInsert": {
+                    "name": migration.name,
+                    "started_at": now,
+                    "steps": [
+                        {"collection": backfill.collection, "processed": 0, "skipped": 0, "last_id": None, "done": False}
+                        for backfill in migration.backfills
+                    ],
+                },
+                "$set": {"status": "running", "error": None, "updated_at": now},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        logger.info("Applying migration %04d %s", migration.version, migration.name)
+        try:
+            for index, backfill in enumerate(migration.backfills):
+                step = record["steps"][index]
+                if not step["done"]:
+                    await self._backfill(migration.version, index, backfill, step["last_id"])
+        except Exception as exc:
+            await records.update_one({"_id": migration.version}, {"$set": {"status": "failed", "error": str(exc)}})
+            raise
+        await records.update_one(
+            {"_id": migration.version},
+            {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc).isoformat()}},
+        )
+        logger.info("Migration %04d %s done", migration.version, migration.name)
+
+    async def _backfill(self, version: int, index: int, backfill: Backfill, last_id) -> None:
+        collection = self._database[backfill.collection]
+        records = self._database[MIGRATIONS_COLLECTION]
+        while True:
+            started = time.monotonic()
+            # Walking _id upwards means each batch starts where the last one
+            # ended instead of rescanning documents that were just updated
+            query = backfill.query if last_id is None else {"$and": [backfill.query, {"_id": {"$gt": last_id}}]}
+            docs = await collection.find(query, {**backfill.projection, "_id": 1}).sort(
+                "_id", ASCENDING
+            ).to_list(self.batch_size)
+            if not docs:
+                break
+            shared = await backfill.batch_fields(self._database) if backfill.batch_fields else {}
+            ops = []
+            for doc in docs:
+                fields = backfill.update(doc)
+                if fields is not None:
+                    ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {**fields, **shared}}))
+            if ops:
+                await collection.bulk_write(ops, ordered=False)
+            last_id = docs[-1]["_id"]
+            await records.update_one(
+                {"_id": version},
+                {
+                    "$inc": {f"steps.{index}.processed": len(ops), f"steps.{index}.skipped": len(docs) - len(ops)},
+                    "$set": {f"steps.{index}.last_id": last_id, "updated_at": datetime.now(timezone.utc).isoformat()},
+                },
+            )
+            if not await acquire_lease(self._database, LEASE_NAME, LEASE_SECONDS):
+                raise RuntimeError("Lost the migrations lease")
+            await self._pace(len(docs), started)
+        await records.update_one({"_id": version}, {"$set": {f"steps.{index}.done": True}})
+
+    async def _pace(self, count: int, started: float) -> None:
+        if self.docs_per_second <= 0:
+            return
+        remaining = count / self.docs_per_second - (time.monotonic() - started)
+        await asyncio.sleep(max(remaining, 0))
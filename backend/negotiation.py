@@ -0,0 +1,181 @@
+"""Response compression and MessagePack content negotiation.
+
+``CompressionMiddleware`` compresses responses of at least
+``minimum_size`` bytes with brotli when the client accepts it and the
+optional ``brotli`` package is installed, otherwise with gzip. Streaming
+bodies are compressed chunk by chunk, so they are never buffered whole.
+Responses that support byte ranges (attachment downloads) are left as
+they are: their ETag and Range offsets refer to the stored bytes, and a
+200 encoded differently from its 206 parts would corrupt resumed
+downloads. Any other strong ETag is weakened when the body is encoded.
+
+``negotiated`` lets list and sync handlers answer in MessagePack when the
+client sends ``Accept: application/msgpack``. The payload is packed
+straight from the handler's dicts, so there is no JSON round trip. Both
+answers carry ``Vary: Accept`` so shared caches keep them apart.
+"""
+import asyncio
+import zlib
+from datetime import date, datetime
+from typing import Optional
+
+import msgpack
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+NEGOTIATED_HEADERS = {"Vary": "Accept"}
+
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "application/javascript", "text/")
+SKIP_STATUSES = {204, 206, 304}
+RANGE_HEADERS = ("accept-ranges", "content-range")
+# Larger chunks are compressed on a worker thread; zlib and brotli release
+# the GIL, and a multi-megabyte list would otherwise stall the event loop
+THREAD_MIN_BYTES = 256 * 1024
+
+
+# =============================================================================
+# MESSAGEPACK
+# =============================================================================
+def _pack_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__} to MessagePack")
+
+
+def wants_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def negotiated(request: Request, payload) -> Response:
+    """``payload`` as MessagePack if the client asked for it, else as JSON"""
+    if not wants_msgpack(request):
+        return JSONResponse(jsonable_encoder(payload), headers=NEGOTIATED_HEADERS)
+    return Response(
+        msgpack.packb(payload, default=_pack_default, use_bin_type=True),
+        media_type=MSGPACK_MEDIA_TYPES[0],
+        headers=NEGOTIATED_HEADERS,
+    )
+
+
+# =============================================================================
+# COMPRESSION
+# =============================================================================
+def _accepted_codings(header: str) -> set:
+    codings = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q=") and quality[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        if coding:
+            codings.add(coding.strip().lower())
+    return codings
+
+
+class _Compressor:
+    def __init__(self, coding: str, gzip_level: int, brotli_quality: int):
+        if coding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._compress = self._compressor.process
+            self._finish = self._compressor.finish
+        else:
+            # wbits=31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._finish = self._compressor.flush
+
+    def _run(self, data: bytes, final: bool) -> bytes:
+        out = self._compress(data)
+        return out + self._finish() if final else out
+
+    async def compress(self, data: bytes, final: bool) -> bytes:
+        if len(data) >= THREAD_MIN_BYTES:
+            return await asyncio.to_thread(self._run, data, final)
+        return self._run(data, final)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose(self, scope) -> Optional[str]:
+        accepted = _accepted_codings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        coding = self._choose(scope) if scope["type"] == "http" else None
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or any(name in headers for name in RANGE_HEADERS)
+                    or start_message["status"] in SKIP_STATUSES
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(coding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = coding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                if more_body:
+                    del headers["Content-Length"]
+                    await send(start_message)
+                else:
+                    body = await compressor.compress(body, final=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+            await send({
+                "type": "http.response.body",
+                "body": await compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, compressing_send)
@@ -0,0 +1,96 @@
+"""Overdue flagging for maintenance requests.
+
+A periodic sweep sets ``is_overdue`` on open requests whose typed
+``scheduled_at`` is before today (UTC), clears it on the rest, and stores
+the resulting count and list in ``materialized_views`` so the dashboard
+and Kanban read a precomputed value instead of scanning. Requests written
+before ``scheduled_at`` existed get it from data migration 0001, which the
+API applies on startup.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ASCENDING
+
+from sync import sync_stamp
+
+CLOSED_STAGES = ["repaired", "scrap"]
+
+MATERIALIZED_COLLECTION = "materialized_views"
+OVERDUE_VIEW_ID = "overdue"
+OVERDUE_LIST_LIMIT = 200
+
+OVERDUE_LIST_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "subject": 1,
+    "equipment_id": 1,
+    "equipment_name": 1,
+    "team_id": 1,
+    "team_name": 1,
+    "assigned_technician_name": 1,
+    "priority": 1,
+    "stage": 1,
+    "scheduled_date": 1,
+}
+
+
+def parse_scheduled(value: Optional[str]) -> Optional[datetime]:
+    """``scheduled_date`` ("YYYY-MM-DD" or full ISO) as a UTC datetime"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def today_start() -> datetime:
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def is_overdue(request: dict) -> bool:
+    scheduled = parse_scheduled(request.get("scheduled_date"))
+    stage = getattr(request.get("stage"), "value", request.get("stage"))
+    return scheduled is not None and scheduled < today_start() and stage not in CLOSED_STAGES
+
+
+async def sweep(database) -> dict:
+    cutoff = today_start()
+    overdue_query = {"scheduled_at": {"$lt": cutoff}, "stage": {"$nin": CLOSED_STAGES}}
+
+    stamp = await sync_stamp(database)
+    flagged = await database.requests.update_many(
+        {**overdue_query, "is_overdue": {"$ne": True}}, {"$set": {"is_overdue": True, **stamp}}
+    )
+    cleared = await database.requests.update_many(
+        {
+            "is_overdue": True,
+            "$or": [
+                {"stage": {"$in": CLOSED_STAGES}},
+                {"scheduled_at": {"$gte": cutoff}},
+                {"scheduled_at": None},
+            ],
+        },
+        {"$set": {"is_overdue": False, **stamp}},
+    )
+
+    count = await database.requests.count_documents({"is_overdue": True})
+    items = await database.requests.find(
+        {"is_overdue": True}, OVERDUE_LIST_PROJECTION
+    ).sort("scheduled_at", ASCENDING).to_list(OVERDUE_LIST_LIMIT)
+    view = {
+        "count": count,
+        "items": items,
+        "as_of": cutoff.date().isoformat(),
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await database[MATERIALIZED_COLLECTION].replace_one({"_id": OVERDUE_VIEW_ID}, view, upsert=True)
+    return {"flagged": flagged.modified_count, "cleared": cleared.modified_count, "count": count}
+
+
+async def read_overdue_view(database) -> Optional[dict]:
+    return await database[MATERIALIZED_COLLECTION].find_one({"_id": OVERDUE_VIEW_ID}, {"_id": 0})
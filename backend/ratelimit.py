@@ -0,0 +1,293 @@
+"""Per-client rate limiting and per-route-class load shedding (ASGI middleware).
+
+``RateLimitMiddleware`` keeps a token bucket per authenticated user and,
+when enabled, per client IP, and answers 429 with ``Retry-After`` once a
+bucket is empty. Buckets live in process memory by default; with
+``RATE_LIMIT_STORE=sqlite`` they are kept in a SQLite file so all worker
+processes on a host share one budget per client. Settings:
+
+- ``RATE_LIMIT_ENABLED`` (true): switches the middleware on or off.
+- ``RATE_LIMIT_USER_PER_SECOND`` / ``RATE_LIMIT_USER_BURST`` (10 / 30).
+- ``RATE_LIMIT_IP_ENABLED`` (false): per-IP buckets. Behind a proxy every
+  client shares the proxy's address, so only turn this on together with
+  ``RATE_LIMIT_TRUSTED_PROXIES``, or where clients connect directly.
+- ``RATE_LIMIT_IP_PER_SECOND`` / ``RATE_LIMIT_IP_BURST`` (20 / 60).
+- ``RATE_LIMIT_TRUSTED_PROXIES``: comma-separated addresses or CIDR
+  ranges of the ingress. ``X-Forwarded-For`` is only read when the peer is
+  one of them, and the client is the nearest address they did not add.
+
+``LoadShedMiddleware`` caps concurrent requests per route class. Excess
+requests wait in a short bounded queue; when the queue is full, or the
+event loop is lagging, non-interactive routes get 503 with ``Retry-After``
+so interactive routes keep their share of the worker.
+"""
+import asyncio
+import ipaddress
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from loop_monitor import LagMonitor
+
+EXEMPT_PATHS = ("/health", "/ready")
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _networks(value: str) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in value.split(",") if part.strip()]
+
+
+async def _send_json(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# =============================================================================
+# TOKEN BUCKET STORES
+# =============================================================================
+class MemoryBucketStore:
+    """Buckets in a bounded LRU map; least recently seen clients are evicted"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._max_keys = max_keys
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Spend one token; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class SqliteBucketStore:
+    """Buckets in a SQLite file shared by the worker processes on one host"""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def _take(self, key: str, rate: float, burst: float) -> float:
+        conn = self._connect()
+        # Wall clock, since monotonic clocks are not comparable across processes
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        # File locking can block; keep it off the event loop
+        return await asyncio.to_thread(self._take, key, rate, burst)
+
+
+def bucket_store_from_env():
+    if os.environ.get("RATE_LIMIT_STORE", "memory") == "sqlite":
+        path = os.environ.get("RATE_LIMIT_SQLITE_PATH", "/dev/shm/gearguard-ratelimit.sqlite3")
+        return SqliteBucketStore(path)
+    return MemoryBucketStore()
+
+
+# =============================================================================
+# RATE LIMITING
+# =============================================================================
+class RateLimitMiddleware:
+    def __init__(self, app, identify_user: Callable[[Dict[str, str]], Optional[str]], store=None):
+        self.app = app
+        self.identify_user = identify_user
+        self.store = store or bucket_store_from_env()
+        self.enabled = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+        self.ip_enabled = os.environ.get("RATE_LIMIT_IP_ENABLED", "false").lower() == "true"
+        self.ip_rate = _env_float("RATE_LIMIT_IP_PER_SECOND", 20)
+        self.ip_burst = _env_float("RATE_LIMIT_IP_BURST", 60)
+        self.user_rate = _env_float("RATE_LIMIT_USER_PER_SECOND", 10)
+        self.user_burst = _env_float("RATE_LIMIT_USER_BURST", 30)
+        self.trusted_proxies = _networks(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", ""))
+
+    def _trusted(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def _client_ip(self, scope, headers: Dict[str, str]) -> str:
+        client = scope.get("client")
+        peer = client[0] if client else "unknown"
+        if "x-forwarded-for" not in headers or not self._trusted(peer):
+            return peer
+        # Hops are appended, so everything left of the last untrusted one
+        # came from the client and may be forged
+        hops = [hop.strip() for hop in headers["x-forwarded-for"].split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if not self._trusted(hop):
+                return hop
+        return hops[0] if hops else peer
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["path"] in EXEMPT_PATHS \
+                or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        wait = 0.0
+        if self.ip_enabled:
+            wait = await self.store.take(f"ip:{self._client_ip(scope, headers)}", self.ip_rate, self.ip_burst)
+        if not wait:
+            user_id = self.identify_user(headers)
+            if user_id:
+                wait = await self.store.take(f"user:{user_id}", self.user_rate, self.user_burst)
+        if wait:
+            await _send_json(send, 429, "Rate limit exceeded", wait)
+            return
+        await self.app(scope, receive, send)
+
+
+# =============================================================================
+# LOAD SHEDDING
+# =============================================================================
+# Route classes, checked in order: (class, methods, exact paths, path prefixes)
+ROUTE_CLASSES = [
+    ("reporting", {"GET"}, set(), ("/api/analytics/", "/api/search", "/api/requests/calendar")),
+    ("list", {"GET"}, {"/api/equipment", "/api/requests", "/api/teams", "/api/users", "/api/sync"}, ()),
+]
+DEFAULT_CLASS = "interactive"
+
+
+def route_class(method: str, path: str) -> str:
+    for name, methods, paths, prefixes in ROUTE_CLASSES:
+        if method in methods and (path in paths or path.startswith(prefixes)):
+            return name
+    return DEFAULT_CLASS
+
+
+class _ClassLimiter:
+    def __init__(self, name: str, max_inflight: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.waiting = 0
+        self.shed = 0
+        self._semaphore = asyncio.Semaphore(max_inflight)
+
+    async def acquire(self) -> bool:
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.inflight += 1
+        return True
+
+    def release(self) -> None:
+        self.inflight -= 1
+        self._semaphore.release()
+
+
+class LoadShedMiddleware:
+    def __init__(self, app, lag_monitor: LagMonitor):
+        self.app = app
+        self.lag_monitor = lag_monitor
+        self.max_lag_ms = _env_float("SHED_MAX_LAG_MS", 250)
+        queue_timeout = _env_float("SHED_QUEUE_TIMEOUT_SECONDS", 2)
+        self.limiters = {
+            name: _ClassLimiter(
+                name,
+                max_inflight=int(_env_float(f"SHED_MAX_INFLIGHT_{name.upper()}", default)),
+                max_queue=int(_env_float(f"SHED_MAX_QUEUE_{name.upper()}", queue)),
+                queue_timeout=queue_timeout,
+            )
+            for name, default, queue in (
+                ("interactive", 256, 512),
+                ("list", 32, 64),
+                ("reporting", 8, 16),
+            )
+        }
+
+    def stats(self) -> dict:
+        return {
+            name: {"inflight": limiter.inflight, "waiting": limiter.waiting, "shed": limiter.shed}
+            for name, limiter in self.limiters.items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[route_class(scope["method"], scope["path"])]
+        if limiter.name != DEFAULT_CLASS and self.lag_monitor.lag_ms > self.max_lag_ms:
+            limiter.shed += 1
+            await _send_json(send, 503, "Server busy, retry shortly", 1)
+            return
+        if not await limiter.acquire():
+            limiter.shed += 1
+            await _send_json(send, 503, "Server busy, retry shortly", limiter.queue_timeout)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
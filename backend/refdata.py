@@ -0,0 +1,165 @@
+"""In-process snapshot of users, teams and equipment metadata.
+
+Handlers that only need a name, an avatar or a team assignment to
+denormalize onto a request, or to enrich a list, read it from here
+instead of issuing a ``find_one`` per lookup. Records are slotted, so
+a few thousand of each stay small.
+
+The snapshot is loaded on startup. Local writes update it through
+``refresh``, and other workers' writes arrive as cache-bus events that
+trigger the same call. Every change stamps the record with a new snapshot
+version. A refresh whose read started before a newer change to the same
+record is discarded, so an out-of-order reply cannot roll a record back.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+USER_PROJECTION = {"_id": 0, "password": 0}
+TEAM_PROJECTION = {"_id": 0}
+EQUIPMENT_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "name": 1,
+    "serial_number": 1,
+    "category": 1,
+    "department": 1,
+    "location": 1,
+    "assigned_team_id": 1,
+    "default_technician_id": 1,
+}
+
+
+class UserRef:
+    __slots__ = ("id", "email", "name", "role", "avatar", "team_id", "created_at", "version")
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, doc: dict, version: int):
+        for field in self.FIELDS:
+            setattr(self, field, doc.get(field))
+        self.version = version
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class TeamRef:
+    __slots__ = ("id", "name", "description", "member_ids", "created_at", "version")
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, doc: dict, version: int):
+        self.id = doc["id"]
+        self.name = doc.get("name")
+        self.description = doc.get("description")
+        self.member_ids = tuple(doc.get("member_ids") or ())
+        self.created_at = doc.get("created_at")
+        self.version = version
+
+    def to_dict(self) -> dict:
+        doc = {field: getattr(self, field) for field in self.FIELDS}
+        doc["member_ids"] = list(self.member_ids)
+        return doc
+
+
+class EquipmentRef:
+    __slots__ = (
+        "id", "name", "serial_number", "category", "department", "location",
+        "assigned_team_id", "default_technician_id", "version",
+    )
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, doc: dict, version: int):
+        for field in self.FIELDS:
+            setattr(self, field, doc.get(field))
+        self.version = version
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+KINDS = {
+    "users": (UserRef, USER_PROJECTION),
+    "teams": (TeamRef, TEAM_PROJECTION),
+    "equipment": (EquipmentRef, EQUIPMENT_PROJECTION),
+}
+
+
+class ReferenceSnapshot:
+    def __init__(self):
+        self.version = 0
+        self._records: Dict[str, Dict[str, object]] = {kind: {} for kind in KINDS}
+
+    def stats(self) -> dict:
+        return {"version": self.version, **{kind: len(records) for kind, records in self._records.items()}}
+
+    def user(self, user_id: Optional[str]) -> Optional[UserRef]:
+        return self._records["users"].get(user_id) if user_id else None
+
+    def team(self, team_id: Optional[str]) -> Optional[TeamRef]:
+        return self._records["teams"].get(team_id) if team_id else None
+
+    def equipment(self, equipment_id: Optional[str]) -> Optional[EquipmentRef]:
+        return self._records["equipment"].get(equipment_id) if equipment_id else None
+
+    def users(self, user_ids: Iterable[str]) -> List[UserRef]:
+        records = self._records["users"]
+        return [records[user_id] for user_id in user_ids if user_id in records]
+
+    def users_with_roles(self, roles: Iterable[str]) -> List[UserRef]:
+        roles = set(roles)
+        return [user for user in self._records["users"].values() if user.role in roles]
+
+    async def get_or_load(self, database, kind: str, record_id: Optional[str]):
+        """Snapshot hit, or one read for records another worker created moments ago"""
+        if not record_id:
+            return None
+        record = self._records[kind].get(record_id)
+        if record is None:
+            await self.refresh(database, kind, [record_id])
+            record = self._records[kind].get(record_id)
+        return record
+
+    async def load(self, database) -> None:
+        """Replace the whole snapshot with a fresh read of all three collections"""
+        loaded = {}
+        read_started = {}
+        for kind, (record, projection) in KINDS.items():
+            read_started[kind] = self.version
+            docs = [doc async for doc in database[kind].find({}, projection)]
+            self.version += 1
+            loaded[kind] = {doc["id"]: record(doc, self.version) for doc in docs}
+        # Records refreshed while the full read was running win
+        for kind, records in self._records.items():
+            for record_id, current in records.items():
+                if current.version > read_started[kind]:
+                    loaded[kind][record_id] = current
+        self._records = loaded
+        logger.info("Reference snapshot loaded: %s", self.stats())
+
+    def put(self, kind: str, doc: dict) -> None:
+        self.version += 1
+        self._records[kind][doc["id"]] = KINDS[kind][0](doc, self.version)
+
+    def remove(self, kind: str, record_id: str) -> None:
+        self.version += 1
+        self._records[kind].pop(record_id, None)
+
+    async def refresh(self, database, kind: str, ids: Iterable[str]) -> None:
+        """Re-read ``ids`` of ``kind``; ids no longer in the database are dropped"""
+        ids = list(ids)
+        if not ids:
+            return
+        record, projection = KINDS[kind]
+        started = self.version
+        docs = {doc["id"]: doc async for doc in database[kind].find({"id": {"$in": ids}}, projection)}
+        self.version += 1
+        records = self._records[kind]
+        for record_id in ids:
+            current = records.get(record_id)
+            if current is not None and current.version > started:
+                continue
+            if record_id in docs:
+                records[record_id] = record(docs[record_id], self.version)
+            else:
+                records.pop(record_id, None)
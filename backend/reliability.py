@@ -0,0 +1,162 @@
+"""Batch MTTR / MTBF analytics over maintenance requests.
+
+Requests in the reporting window are pulled once with a narrow projection
+into column lists, turned into a pandas frame, and every grouping
+(equipment, category, team, department) is computed from that frame with
+vectorized group-bys. Frames and results are cached per window and
+expire after ``RELIABILITY_CACHE_SECONDS``.
+
+pandas/numpy are imported on first use so they stay off the API's import
+path.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from archive import ARCHIVE_COLLECTION
+
+GROUPINGS = {
+    "equipment": "equipment_id",
+    "category": "equipment_category",
+    "team": "team_id",
+    "department": "department",
+}
+
+REQUEST_PROJECTION = {
+    "_id": 0,
+    "equipment_id": 1,
+    "equipment_name": 1,
+    "equipment_category": 1,
+    "team_id": 1,
+    "team_name": 1,
+    "request_type": 1,
+    "stage": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "repaired_at": 1,
+    "hours_spent": 1,
+}
+
+CACHE_SECONDS = int(os.environ.get("RELIABILITY_CACHE_SECONDS", "300"))
+BATCH_SIZE = 2000
+
+
+class ReliabilityEngine:
+    def __init__(self, database):
+        self._database = database
+        self._frames: Dict[int, Tuple[float, object]] = {}
+        self._results: Dict[Tuple[int, str], Tuple[float, List[dict]]] = {}
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._frames.clear()
+        self._results.clear()
+
+    async def metrics(self, group_by: str, days: int) -> List[dict]:
+        key = (days, group_by)
+        cached = self._results.get(key)
+        if cached and time.monotonic() - cached[0] < CACHE_SECONDS:
+            return cached[1]
+        # One loader per window at a time; concurrent callers reuse its frame
+        async with self._lock:
+            cached = self._results.get(key)
+            if cached and time.monotonic() - cached[0] < CACHE_SECONDS:
+                return cached[1]
+            frame = await self._frame(days)
+            result = await asyncio.to_thread(compute_metrics, frame, GROUPINGS[group_by])
+            self._results[key] = (time.monotonic(), result)
+            return result
+
+    async def _frame(self, days: int):
+        cached = self._frames.get(days)
+        if cached and time.monotonic() - cached[0] < CACHE_SECONDS:
+            return cached[1]
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+        columns = {field: [] for field in REQUEST_PROJECTION if field != "_id"}
+        # Archived requests still count towards MTTR / MTBF, unless they
+        # were soft-deleted along with their equipment
+        for collection in ("requests", ARCHIVE_COLLECTION):
+            cursor = self._database[collection].find(
+                {"created_at": {"$gte": since}, "deleted_at": {"$exists": False}},
+                REQUEST_PROJECTION,
+                batch_size=BATCH_SIZE,
+            )
+            async for doc in cursor:
+                for field, values in columns.items():
+                    values.append(doc.get(field))
+        departments = {
+            doc["id"]: doc.get("department")
+            async for doc in self._database.equipment.find({}, {"_id": 0, "id": 1, "department": 1})
+        }
+        frame = await asyncio.to_thread(build_frame, columns, departments)
+        self._frames[days] = (time.monotonic(), frame)
+        return frame
+
+
+def build_frame(columns: dict, departments: dict):
+    import pandas as pd
+
+    frame = pd.DataFrame(columns)
+    frame["department"] = frame["equipment_id"].map(departments)
+    frame["created"] = pd.to_datetime(frame["created_at"], utc=True, format="ISO8601")
+    # Requests repaired before repaired_at was recorded fall back to updated_at
+    repaired_at = frame["repaired_at"].fillna(frame["updated_at"])
+    frame["repaired"] = pd.to_datetime(repaired_at, utc=True, format="ISO8601")
+    frame["hours_spent"] = pd.to_numeric(frame["hours_spent"], errors="coerce").fillna(0.0)
+    frame["request_type"] = frame["request_type"].fillna("corrective")
+    frame["is_failure"] = frame["request_type"] == "corrective"
+    frame["is_repair"] = frame["is_failure"] & (frame["stage"] == "repaired")
+    frame["repair_hours"] = (
+        (frame["repaired"] - frame["created"]).dt.total_seconds() / 3600
+    ).where(frame["is_repair"])
+
+    # Gap since the same asset's previous failure, for MTBF
+    failures = frame[frame["is_failure"]].sort_values(["equipment_id", "created"])
+    gaps = failures.groupby("equipment_id")["created"].diff().dt.total_seconds() / 3600
+    frame["failure_gap_hours"] = gaps.reindex(frame.index)
+    return frame
+
+
+def compute_metrics(frame, key: str) -> List[dict]:
+    import numpy as np
+
+    if frame.empty:
+        return []
+    grouped = frame.groupby(frame[key].fillna("unassigned"), sort=False)
+    summary = grouped.agg(
+        requests=("request_type", "size"),
+        failures=("is_failure", "sum"),
+        repairs=("is_repair", "sum"),
+        hours_spent=("hours_spent", "sum"),
+        mttr_hours=("repair_hours", "mean"),
+        mtbf_hours=("failure_gap_hours", "mean"),
+        median_repair_hours=("repair_hours", "median"),
+    )
+    labels = {
+        "equipment_id": "equipment_name",
+        "team_id": "team_name",
+    }
+    if key in labels:
+        summary["label"] = grouped[labels[key]].first()
+    summary = summary.replace({np.nan: None}).sort_values("requests", ascending=False)
+
+    results = []
+    for group, row in summary.iterrows():
+        results.append({
+            "key": group,
+            "label": row.get("label", group),
+            "requests": int(row["requests"]),
+            "failures": int(row["failures"]),
+            "repairs": int(row["repairs"]),
+            "hours_spent": round(float(row["hours_spent"]), 2),
+            "mttr_hours": _round(row["mttr_hours"]),
+            "median_repair_hours": _round(row["median_repair_hours"]),
+            "mtbf_hours": _round(row["mtbf_hours"]),
+        })
+    return results
+
+
+def _round(value):
+    return round(float(value), 2) if value is not None else None
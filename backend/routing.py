@@ -0,0 +1,30 @@
+"""An ``APIRouter`` that builds its routes when mounted rather than at import.
+
+FastAPI analyses every endpoint (dependencies, request and response
+models) when it is decorated, and ``include_router`` then copies and
+analyses each route a second time. With ~50 endpoints that is most of the
+cost of importing ``server``. ``DeferredRouter`` only records the
+decorated endpoints; ``mount(app)`` adds them to the app once, from the
+lifespan hook, before the worker accepts connections.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+
+from fastapi import APIRouter, FastAPI
+
+
+class DeferredRouter(APIRouter):
+    def __init__(self, *, prefix: str = "", **kwargs):
+        super().__init__(prefix=prefix, **kwargs)
+        self._pending: List[Tuple[str, Callable[..., Any], Dict[str, Any]]] = []
+        self._mounted = False
+
+    def add_api_route(self, path: str, endpoint: Callable[..., Any], **kwargs) -> None:
+        self._pending.append((path, endpoint, kwargs))
+
+    def mount(self, app: FastAPI) -> None:
+        """Add the recorded routes to ``app``; later calls do nothing"""
+        if self._mounted:
+            return
+        for path, endpoint, kwargs in self._pending:
+            app.router.add_api_route(self.prefix + path, endpoint, **kwargs)
+        self._mounted = True
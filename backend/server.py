@@ -1,39 +1,228 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, status
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pymongo import ASCENDING, DESCENDING, TEXT, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from typing import Awaitable, List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
 from enum import Enum
 
+from database import (
+    LazyDatabase, close_client, get_client, get_database, pool_monitor, pool_settings_from_env,
+    transactional, warm_pool,
+)
+from equipment_index import EquipmentPrefixIndex
+from idempotency import IdempotencyStore
+from equipment_stats import (
+    STATS_COLLECTION, rebuild_pipeline, stats_for_change, stats_for_create, stats_for_delete, summarize,
+)
+from invalidation import InvalidationBus
+from loop_monitor import LagMonitor
+import meters
+from meters import MeterBufferFull, MeterService
+from negotiation import CompressionMiddleware, negotiated
+from ratelimit import LoadShedMiddleware, RateLimitMiddleware
+from refdata import ReferenceSnapshot
+from routing import DeferredRouter
+import sync
+from sync import record_deletes, sync_stamp
+from background import PeriodicJob
+import migrations
+import archive
+from attachments import AttachmentService, AttachmentTooLarge, download_response, store_from_env, thumbnail_id
+from archive import ARCHIVE_COLLECTION, archive_closed_requests, archived_rollups, find_requests
+import cascade
+from cascade import CascadeRunner
+from overdue import is_overdue, parse_scheduled, read_overdue_view, sweep as sweep_overdue
+from reliability import GROUPINGS, ReliabilityEngine
+from time_log import HoursBuffer
+from tokens import KeySet, RevocationList
+from transitions import TRANSITIONS_COLLECTION, build_transition, cycle_time_pipeline
+
 
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection. Handles bind to a per-worker client on first use, so
+# importing this module (e.g. gunicorn --preload) never opens sockets.
+db = LazyDatabase("write")
+# Large list scans and reporting reads can be served by secondaries so they
+# do not compete with Kanban writes; see database.READ_POLICY_DEFAULTS
+list_db = LazyDatabase("list")
+reporting_db = LazyDatabase("reporting")
+
+# Tells other worker processes when their in-memory caches are stale
+cache_bus = InvalidationBus(db)
+
+# MTTR / MTBF batch analytics, cached per reporting window
+reliability = ReliabilityEngine(reporting_db)
+
+# Replays responses for retried creates that carry an Idempotency-Key
+idempotency = IdempotencyStore(db)
+
+# Flags overdue requests and materializes the overdue count/list
+OVERDUE_SWEEP_SECONDS = int(os.environ.get('OVERDUE_SWEEP_SECONDS', '300'))
+overdue_job = PeriodicJob("overdue-sweep", OVERDUE_SWEEP_SECONDS, lambda: sweep_overdue(db), db)
+
+# Moves long-closed requests out of the hot collection
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+archive_job = PeriodicJob(
+    "request-archive",
+    int(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600')),
+    lambda: archive_closed_requests(db, ARCHIVE_AFTER_DAYS, int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))),
+    db,
+)
+
+# Pending data migrations are applied in the background by one worker at a
+# time (the runner holds a lease), checked again every MIGRATION_CHECK_SECONDS
+# so a run cut short by a restart is picked up. MIGRATIONS_AUTO_APPLY=0
+# leaves them to `python -m migrations up`.
+MIGRATIONS_AUTO_APPLY = os.environ.get('MIGRATIONS_AUTO_APPLY', '1') == '1'
+migration_runner = migrations.MigrationRunner(
+    db,
+    batch_size=int(os.environ.get('MIGRATION_BATCH_SIZE', '500')),
+    docs_per_second=float(os.environ.get('MIGRATION_DOCS_PER_SECOND', '2000')),
+)
+migration_job = PeriodicJob(
+    "migrations-apply",
+    int(os.environ.get('MIGRATION_CHECK_SECONDS', '300')),
+    lambda: apply_migrations(),
+    db,
+    single_worker=False,
+)
+
+# Cleans up the requests, equipment and rollups that still point at a
+# deleted asset or team, in paced batches off the request path
+cascade_runner = CascadeRunner(
+    db,
+    batch_size=int(os.environ.get('CASCADE_BATCH_SIZE', '500')),
+    pause_seconds=float(os.environ.get('CASCADE_BATCH_PAUSE_SECONDS', '0.05')),
+    on_batch=lambda kind, step, ids: on_cascade_batch(kind, step, ids),
+    on_finished=lambda job: on_cascade_finished(job),
+)
+# Picks up cascade jobs whose worker stopped before finishing them
+cascade_resume_job = PeriodicJob(
+    "cascade-resume", int(os.environ.get('CASCADE_RESUME_SECONDS', '60')), cascade_runner.resume_stale, db
+)
+
+# Hour and cycle meters: readings are written in batches to a time-series
+# collection, and crossing a threshold opens a preventive request
+meter_service = MeterService(
+    db,
+    on_due=lambda threshold, due, value, request_id: open_meter_request(threshold, due, value, request_id),
+    flush_interval=float(os.environ.get('METER_FLUSH_SECONDS', '1')),
+    max_pending=int(os.environ.get('METER_MAX_PENDING', '5000')),
+    max_buffered=int(os.environ.get('METER_MAX_BUFFERED', '100000')),
+)
+
+# Photos and manuals on requests and equipment, streamed to GridFS or
+# local disk (ATTACHMENT_STORE); image thumbnails need Pillow
+attachment_service = AttachmentService(
+    db,
+    store_from_env(get_database),
+    max_bytes=int(os.environ.get('ATTACHMENT_MAX_BYTES', str(25 * 1024 * 1024))),
+    thumbnail_size=int(os.environ.get('THUMBNAIL_SIZE', '256')),
+    thumbnail_workers=int(os.environ.get('THUMBNAIL_WORKERS', '2')),
+)
+
+# Coalesces technicians' time-log increments into periodic bulk writes
+hours_buffer = HoursBuffer(
+    db,
+    flush_interval=float(os.environ.get('HOURS_FLUSH_SECONDS', '2')),
+    max_pending=int(os.environ.get('HOURS_MAX_PENDING', '500')),
+)
+
+# Event-loop lag, used by load shedding and reported on /health. Callbacks
+# blocking the loop longer than LOOP_STALL_THRESHOLD_MS are logged with
+# their stack and route (0 disables the watchdog).
+lag_monitor = LagMonitor(stall_threshold_ms=float(os.environ.get('LOOP_STALL_THRESHOLD_MS', '250')))
+
+# Readiness fails once this many operations are queued for a connection
+READY_MAX_WAIT_QUEUE = int(os.environ.get('READY_MAX_WAIT_QUEUE', '50'))
 
-# JWT Config
+# JWT Config. New tokens are signed with the JWT_ACTIVE_KID key from
+# JWT_KEYS ("kid:secret,..."); JWT_SECRET alone keeps working without them
 JWT_SECRET = os.environ.get('JWT_SECRET', 'gearguard-super-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+signing_keys = KeySet.from_env(JWT_SECRET, JWT_ALGORITHM)
+
+# Revoked tokens, checked in memory; every worker pulls new revocations
+# each REVOCATION_REFRESH_SECONDS
+revocations = RevocationList(db, timedelta(hours=JWT_EXPIRATION_HOURS))
+revocation_job = PeriodicJob(
+    "revocation-refresh",
+    float(os.environ.get('REVOCATION_REFRESH_SECONDS', '5')),
+    revocations.refresh,
+    db,
+    single_worker=False,
+)
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing. passlib and the bcrypt backend are only loaded the
+# first time a password is hashed or checked.
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Users, teams and equipment metadata for enrichment and denormalization,
+# loaded on startup and kept current by write hooks and cache-bus events
+refdata = ReferenceSnapshot()
+
+# Typeahead index over equipment name/serial number, warmed on startup
+equipment_index = EquipmentPrefixIndex()
+SUGGEST_PROJECTION = {"_id": 0, "id": 1, "name": 1, "serial_number": 1, "category": 1, "location": 1}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connections, indexes and caches are set up per worker here rather than
+    # at import time; see on_startup / on_shutdown below. The /api routes
+    # are built here too, which keeps importing this module cheap.
+    api_router.mount(app)
+    await on_startup()
+    try:
+        yield
+    finally:
+        await on_shutdown()
 
 # Create the main app
-app = FastAPI(title="GearGuard API", version="1.0.0")
+app = FastAPI(title="GearGuard API", version="1.0.0", lifespan=lifespan)
+
+def bearer_user_id(headers) -> Optional[str]:
+    """User id from the bearer token without a DB lookup, for per-user rate
+    limits and Idempotency-Key scoping"""
+    authorization = headers.get("authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    try:
+        return signing_keys.decode(authorization[7:]).get("sub")
+    except jwt.InvalidTokenError:
+        return None
+
+# Lets the loop watchdog attribute stalls to the route being served
+app.add_middleware(lag_monitor.middleware)
+# Added before CORS so rejections still carry CORS headers; rate limiting
+# runs ahead of load shedding so throttled clients never take a slot
+app.add_middleware(LoadShedMiddleware, lag_monitor=lag_monitor)
+app.add_middleware(RateLimitMiddleware, identify_user=bearer_user_id)
+# gzip, or brotli when installed, for responses above the size threshold
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MIN_BYTES', '1024')),
+)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -48,8 +237,9 @@ app.add_middleware(
 )
 
 
-# Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+# Create a router with the /api prefix; its routes are added to the app by
+# the lifespan hook
+api_router = DeferredRouter(prefix="/api")
 
 # =============================================================================
 # ENUMS
@@ -63,6 +253,10 @@ class RequestType(str, Enum):
     CORRECTIVE = "corrective"
     PREVENTIVE = "preventive"
 
+class MeterKind(str, Enum):
+    HOURS = "hours"
+    CYCLES = "cycles"
+
 class RequestStage(str, Enum):
     NEW = "new"
     IN_PROGRESS = "in_progress"
@@ -72,19 +266,24 @@ class RequestStage(str, Enum):
 # =============================================================================
 # MODELS
 # =============================================================================
-class UserBase(BaseModel):
+# Validators are built on first use (when the routes are mounted) instead
+# of while this module is imported
+class APIModel(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
+class UserBase(APIModel):
     email: EmailStr
     name: str
     role: UserRole = UserRole.USER
     avatar: Optional[str] = None
 
-class UserCreate(BaseModel):
+class UserCreate(APIModel):
     email: EmailStr
     name: str
     password: str
     role: UserRole = UserRole.USER
 
-class UserLogin(BaseModel):
+class UserLogin(APIModel):
     email: EmailStr
     password: str
 
@@ -94,13 +293,13 @@ class User(UserBase):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     team_id: Optional[str] = None
 
-class TokenResponse(BaseModel):
+class TokenResponse(APIModel):
     access_token: str
     token_type: str = "bearer"
     user: dict
 
 # Team Models
-class TeamBase(BaseModel):
+class TeamBase(APIModel):
     name: str
     description: Optional[str] = None
 
@@ -113,11 +312,14 @@ class Team(TeamBase):
     member_ids: List[str] = []
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class TeamMembers(APIModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=500)
+
 class TeamWithMembers(Team):
     members: List[dict] = []
 
 # Equipment Models
-class EquipmentBase(BaseModel):
+class EquipmentBase(APIModel):
     name: str
     serial_number: str
     location: str
@@ -146,7 +348,7 @@ class EquipmentWithDetails(Equipment):
     open_request_count: int = 0
 
 # Maintenance Request Models
-class RequestBase(BaseModel):
+class RequestBase(APIModel):
     subject: str
     description: Optional[str] = None
     request_type: RequestType = RequestType.CORRECTIVE
@@ -173,7 +375,7 @@ class MaintenanceRequest(RequestBase):
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     created_by: Optional[str] = None
 
-class RequestUpdate(BaseModel):
+class RequestUpdate(APIModel):
     subject: Optional[str] = None
     description: Optional[str] = None
     stage: Optional[RequestStage] = None
@@ -182,40 +384,89 @@ class RequestUpdate(BaseModel):
     scheduled_date: Optional[str] = None
     priority: Optional[str] = None
 
+class MeterReading(APIModel):
+    equipment_id: str
+    meter: MeterKind
+    value: float = Field(..., ge=0)
+    at: Optional[datetime] = None
+
+class MeterReadingBatch(APIModel):
+    readings: List[MeterReading] = Field(..., min_length=1, max_length=5000)
+
+class MeterThreshold(APIModel):
+    interval: float = Field(..., gt=0)
+    priority: str = "medium"
+
+class TimeLogEntry(APIModel):
+    hours: float = Field(..., gt=0, le=24)
+
+class StageMove(APIModel):
+    id: str
+    stage: RequestStage
+
+class BulkStageUpdate(APIModel):
+    moves: List[StageMove] = Field(..., min_length=1, max_length=500)
+
 # =============================================================================
 # HELPERS
 # =============================================================================
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
-
-async def get_current_user(authorization: str = None) -> dict:
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(hours=JWT_EXPIRATION_HOURS)
+    # iat keeps sub-second precision so a token issued just after a
+    # "log out everywhere" cutoff is not caught by it
+    to_encode.update({"exp": expire, "iat": now.timestamp(), "jti": uuid.uuid4().hex})
+    return signing_keys.encode(to_encode)
+
+def date_range_filter(start: Optional[str], end: Optional[str]) -> Optional[dict]:
+    """Build a range clause for ISO date strings (inclusive start, exclusive end)"""
+    clause = {}
+    if start:
+        clause["$gte"] = start
+    if end:
+        clause["$lt"] = end
+    return clause or None
+
+def build_sort(sort_by: Optional[str], sort_order: str, allowed: set, default: str) -> list:
+    field = sort_by or default
+    if field not in allowed:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{field}'")
+    direction = ASCENDING if sort_order == "asc" else DESCENDING
+    # Tie-break on id so paging through equal keys stays stable
+    return [(field, direction), ("id", ASCENDING)]
+
+def token_claims(authorization: Optional[str]) -> dict:
+    """Verified, unrevoked claims of the bearer token"""
     if not authorization:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     try:
         token = authorization.replace("Bearer ", "")
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        payload = signing_keys.decode(token)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    # In-memory lookup; see tokens.RevocationList
+    if revocations.is_revoked(payload):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return payload
+
+async def get_current_user(authorization: str = None) -> dict:
+    payload = token_claims(authorization)
+    user = await db.users.find_one({"id": payload["sub"]}, {"_id": 0, "password": 0})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
 
 # =============================================================================
 # AUTH ROUTES
@@ -238,6 +489,7 @@ async def register(user_data: UserCreate):
     doc['created_at'] = doc['created_at'].isoformat()
     
     await db.users.insert_one(doc)
+    await refdata_changed("users", [user.id])
     
     token = create_access_token({"sub": user.id, "role": user.role})
     user_dict = {k: v for k, v in doc.items() if k not in ['password', '_id']}
@@ -255,6 +507,17 @@ async def login(credentials: UserLogin):
     
     return TokenResponse(access_token=token, user=user_dict)
 
+@api_router.post("/auth/logout")
+async def logout(authorization: Optional[str] = Header(None), everywhere: bool = False):
+    """Revoke the caller's token, or with ``everywhere`` every token they hold"""
+    claims = token_claims(authorization)
+    # Tokens issued before jti existed can only be revoked per user
+    if everywhere or not claims.get("jti"):
+        await revocations.revoke_user(claims["sub"])
+    else:
+        await revocations.revoke(claims)
+    return {"message": "Logged out"}
+
 @api_router.get("/auth/me")
 async def get_me(authorization: str = None):
     from fastapi import Header
@@ -269,10 +532,12 @@ async def get_users():
     users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
     return users
 
+TECHNICIAN_ROLES = ["technician", "manager"]
+
 @api_router.get("/users/technicians", response_model=List[dict])
 async def get_technicians():
     users = await db.users.find(
-        {"role": {"$in": ["technician", "manager"]}},
+        {"role": {"$in": TECHNICIAN_ROLES}},
         {"_id": 0, "password": 0}
     ).to_list(1000)
     return users
@@ -288,33 +553,31 @@ async def create_team(team_data: TeamCreate):
         member_ids=team_data.member_ids
     )
     doc = team.model_dump()
+    doc['member_ids'] = list(dict.fromkeys(team.member_ids))
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.teams.insert_one(doc)
+    stamp = {'updated_at': doc['created_at'], **await sync_stamp(db)}
+    doc.update(stamp)
     
-    # Update users with team_id
-    if team_data.member_ids:
-        await db.users.update_many(
-            {"id": {"$in": team_data.member_ids}},
-            {"$set": {"team_id": team.id}}
-        )
+    async def write(session):
+        await db.teams.insert_one(doc, session=session)
+        return await move_members(session, team.id, doc['member_ids'], [], stamp)
+    
+    left = await transactional(write)
+    await refdata_changed("teams", [team.id, *left])
+    await refdata_changed("users", doc['member_ids'])
     
     return {k: v for k, v in doc.items() if k != '_id'}
 
 @api_router.get("/teams", response_model=List[dict])
 async def get_teams():
     teams = await db.teams.find({}, {"_id": 0}).to_list(1000)
-    
-    for team in teams:
-        if team.get('member_ids'):
-            members = await db.users.find(
-                {"id": {"$in": team['member_ids']}},
-                {"_id": 0, "password": 0}
-            ).to_list(100)
-            team['members'] = members
-        else:
-            team['members'] = []
-    
-    return teams
+    return with_members(teams)
+
+def with_members(teams: List[dict]) -> List[dict]:
+    return [
+        {**team, 'members': [member.to_dict() for member in refdata.users(team.get('member_ids') or [])]}
+        for team in teams
+    ]
 
 @api_router.get("/teams/{team_id}")
 async def get_team(team_id: str):
@@ -322,90 +585,212 @@ async def get_team(team_id: str):
     if not team:
         raise HTTPException(status_code=404, detail="Team not found")
     
-    if team.get('member_ids'):
-        members = await db.users.find(
-            {"id": {"$in": team['member_ids']}},
-            {"_id": 0, "password": 0}
-        ).to_list(100)
-        team['members'] = members
-    else:
-        team['members'] = []
+    team['members'] = [member.to_dict() for member in refdata.users(team.get('member_ids') or [])]
     
     return team
 
 @api_router.put("/teams/{team_id}")
 async def update_team(team_id: str, team_data: TeamCreate):
-    existing = await db.teams.find_one({"id": team_id})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Team not found")
-    
-    # Remove old team association
-    if existing.get('member_ids'):
-        await db.users.update_many(
-            {"id": {"$in": existing['member_ids']}},
-            {"$unset": {"team_id": ""}}
-        )
-    
     update_data = team_data.model_dump()
-    await db.teams.update_one({"id": team_id}, {"$set": update_data})
+    update_data['member_ids'] = list(dict.fromkeys(team_data.member_ids))
+    stamp = {'updated_at': datetime.now(timezone.utc).isoformat(), **await sync_stamp(db)}
+    update_data.update(stamp)
     
-    # Add new team association
-    if team_data.member_ids:
-        await db.users.update_many(
-            {"id": {"$in": team_data.member_ids}},
-            {"$set": {"team_id": team_id}}
+    async def write(session):
+        # The pre-image gives the membership diff; only those users are written
+        existing = await db.teams.find_one_and_update(
+            {"id": team_id}, {"$set": update_data}, {"_id": 0, "member_ids": 1}, session=session
         )
+        if not existing:
+            raise HTTPException(status_code=404, detail="Team not found")
+        old_ids = existing.get('member_ids') or []
+        added = [user_id for user_id in update_data['member_ids'] if user_id not in old_ids]
+        removed = [user_id for user_id in old_ids if user_id not in update_data['member_ids']]
+        left = await move_members(session, team_id, added, removed, stamp)
+        return added + removed, left
     
+    changed, left = await transactional(write)
     updated = await db.teams.find_one({"id": team_id}, {"_id": 0})
+    await refdata_changed("teams", [team_id, *left])
+    await refdata_changed("users", changed)
     return updated
 
+@api_router.post("/teams/{team_id}/members")
+async def add_team_members(team_id: str, members: TeamMembers):
+    return await change_members(team_id, add=members.user_ids, remove=[])
+
+@api_router.delete("/teams/{team_id}/members/{user_id}")
+async def remove_team_member(team_id: str, user_id: str):
+    return await change_members(team_id, add=[], remove=[user_id])
+
+async def change_members(team_id: str, add: List[str], remove: List[str]) -> dict:
+    stamp = {'updated_at': datetime.now(timezone.utc).isoformat(), **await sync_stamp(db)}
+    
+    async def write(session):
+        team = await db.teams.find_one({"id": team_id}, {"_id": 0, "member_ids": 1}, session=session)
+        if not team:
+            raise HTTPException(status_code=404, detail="Team not found")
+        current = set(team.get('member_ids') or [])
+        added = [user_id for user_id in dict.fromkeys(add) if user_id not in current]
+        removed = [user_id for user_id in dict.fromkeys(remove) if user_id in current]
+        # $addToSet and $pull on the same array cannot share one update
+        if added:
+            await db.teams.update_one(
+                {"id": team_id},
+                {"$addToSet": {"member_ids": {"$each": added}}, "$set": stamp},
+                session=session,
+            )
+        if removed:
+            await db.teams.update_one(
+                {"id": team_id}, {"$pull": {"member_ids": {"$in": removed}}, "$set": stamp}, session=session
+            )
+        left = await move_members(session, team_id, added, removed, stamp)
+        return added + removed, left
+    
+    changed, left = await transactional(write)
+    if changed:
+        await refdata_changed("teams", [team_id, *left])
+        await refdata_changed("users", changed)
+    return await db.teams.find_one({"id": team_id}, {"_id": 0})
+
+async def move_members(session, team_id: str, added: List[str], removed: List[str], stamp: dict) -> List[str]:
+    """Point just the added and removed users at their new team.
+
+    A user is on one team at a time, so added users are also pulled from
+    the team they were on. Returns the ids of those other teams.
+    """
+    left = []
+    if added:
+        left = await db.users.distinct(
+            "team_id", {"id": {"$in": added}, "team_id": {"$nin": [None, team_id]}}, session=session
+        )
+        if left:
+            await db.teams.update_many(
+                {"id": {"$in": left}}, {"$pull": {"member_ids": {"$in": added}}, "$set": stamp}, session=session
+            )
+        await db.users.update_many({"id": {"$in": added}}, {"$set": {"team_id": team_id}}, session=session)
+    if removed:
+        await db.users.update_many(
+            {"id": {"$in": removed}, "team_id": team_id}, {"$unset": {"team_id": ""}}, session=session
+        )
+    return left
+
 @api_router.delete("/teams/{team_id}")
 async def delete_team(team_id: str):
-    result = await db.teams.delete_one({"id": team_id})
-    if result.deleted_count == 0:
+    existing = await db.teams.find_one_and_delete({"id": team_id}, {"_id": 0, "name": 1, "member_ids": 1})
+    if not existing:
         raise HTTPException(status_code=404, detail="Team not found")
     
     await db.users.update_many({"team_id": team_id}, {"$unset": {"team_id": ""}})
-    return {"message": "Team deleted"}
+    await record_deletes(db, "teams", [team_id])
+    await refdata_changed("teams", [team_id])
+    await refdata_changed("users", existing.get('member_ids') or [])
+    # Equipment and requests assigned to the team are re-pointed in the background
+    job = await cascade_runner.schedule("team", {"id": team_id, "name": existing.get('name')})
+    return {"message": "Team deleted", "job_id": job['id']}
 
 # =============================================================================
 # EQUIPMENT ROUTES
 # =============================================================================
 @api_router.post("/equipment", response_model=dict)
-async def create_equipment(equipment_data: EquipmentCreate):
+async def create_equipment(
+    request: Request,
+    equipment_data: EquipmentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    return await idempotency.run(
+        "equipment", idempotency_key, equipment_data, lambda: insert_equipment(equipment_data),
+        caller=bearer_user_id(request.headers),
+    )
+
+async def insert_equipment(equipment_data: EquipmentCreate) -> dict:
     equipment = Equipment(**equipment_data.model_dump())
     doc = equipment.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
+    doc['updated_at'] = doc['created_at']
+    doc.update(await sync_stamp(db))
     await db.equipment.insert_one(doc)
+    equipment_index.upsert(doc)
+    refdata.put("equipment", doc)
+    await cache_bus.publish("equipment", op="upsert", id=equipment.id)
     return {k: v for k, v in doc.items() if k != '_id'}
 
+EQUIPMENT_SORT_FIELDS = {
+    "name", "serial_number", "category", "department", "location",
+    "purchase_date", "warranty_expiry", "created_at",
+}
+
 @api_router.get("/equipment", response_model=List[dict])
-async def get_equipment():
-    equipment_list = await db.equipment.find({}, {"_id": 0}).to_list(1000)
+async def get_equipment(
+    request: Request,
+    department: Optional[str] = None,
+    location: Optional[str] = None,
+    category: Optional[str] = None,
+    team_id: Optional[str] = None,
+    technician_id: Optional[str] = None,
+    is_usable: Optional[bool] = None,
+    purchased_from: Optional[str] = None,
+    purchased_to: Optional[str] = None,
+    warranty_from: Optional[str] = None,
+    warranty_to: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_order: str = Query("asc", pattern="^(asc|desc)$"),
+):
+    query = {}
+    if department:
+        query['department'] = department
+    if location:
+        query['location'] = location
+    if category:
+        query['category'] = category
+    if team_id:
+        query['assigned_team_id'] = team_id
+    if technician_id:
+        query['default_technician_id'] = technician_id
+    if is_usable is not None:
+        query['is_usable'] = is_usable
+    purchased = date_range_filter(purchased_from, purchased_to)
+    if purchased:
+        query['purchase_date'] = purchased
+    warranty = date_range_filter(warranty_from, warranty_to)
+    if warranty:
+        query['warranty_expiry'] = warranty
+    
+    sort = build_sort(sort_by, sort_order, EQUIPMENT_SORT_FIELDS, "name")
+    return negotiated(request, await list_equipment(query, sort))
+
+async def list_equipment(query: dict, sort: list) -> List[dict]:
+    equipment_list = await list_db.equipment.find(query, {"_id": 0}).sort(sort).to_list(1000)
+    
+    # Open request counts for the whole page in one aggregation
+    open_counts = await list_db.requests.aggregate([
+        {"$match": {
+            "equipment_id": {"$in": [eq['id'] for eq in equipment_list]},
+            "stage": {"$nin": ["repaired", "scrap"]},
+        }},
+        {"$group": {"_id": "$equipment_id", "count": {"$sum": 1}}},
+    ]).to_list(None)
+    open_count_by_id = {row['_id']: row['count'] for row in open_counts}
     
     for eq in equipment_list:
-        # Get team info
+        # Team and technician info come from the reference snapshot
         if eq.get('assigned_team_id'):
-            team = await db.teams.find_one({"id": eq['assigned_team_id']}, {"_id": 0})
-            eq['team'] = team
+            team = refdata.team(eq['assigned_team_id'])
+            eq['team'] = team.to_dict() if team else None
         
-        # Get technician info
         if eq.get('default_technician_id'):
-            tech = await db.users.find_one(
-                {"id": eq['default_technician_id']},
-                {"_id": 0, "password": 0}
-            )
-            eq['technician'] = tech
+            tech = refdata.user(eq['default_technician_id'])
+            eq['technician'] = tech.to_dict() if tech else None
         
-        # Get open request count
-        count = await db.requests.count_documents({
-            "equipment_id": eq['id'],
-            "stage": {"$nin": ["repaired", "scrap"]}
-        })
-        eq['open_request_count'] = count
+        eq['open_request_count'] = open_count_by_id.get(eq['id'], 0)
     
     return equipment_list
 
+@api_router.get("/equipment/suggest")
+async def suggest_equipment(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """Typeahead over equipment name and serial number, served from memory"""
+    return equipment_index.suggest(q, limit)
+
 @api_router.get("/equipment/{equipment_id}")
 async def get_equipment_item(equipment_id: str):
     eq = await db.equipment.find_one({"id": equipment_id}, {"_id": 0})
@@ -413,15 +798,12 @@ async def get_equipment_item(equipment_id: str):
         raise HTTPException(status_code=404, detail="Equipment not found")
     
     if eq.get('assigned_team_id'):
-        team = await db.teams.find_one({"id": eq['assigned_team_id']}, {"_id": 0})
-        eq['team'] = team
+        team = await refdata.get_or_load(db, "teams", eq['assigned_team_id'])
+        eq['team'] = team.to_dict() if team else None
     
     if eq.get('default_technician_id'):
-        tech = await db.users.find_one(
-            {"id": eq['default_technician_id']},
-            {"_id": 0, "password": 0}
-        )
-        eq['technician'] = tech
+        tech = await refdata.get_or_load(db, "users", eq['default_technician_id'])
+        eq['technician'] = tech.to_dict() if tech else None
     
     count = await db.requests.count_documents({
         "equipment_id": eq['id'],
@@ -438,9 +820,14 @@ async def update_equipment(equipment_id: str, equipment_data: EquipmentCreate):
         raise HTTPException(status_code=404, detail="Equipment not found")
     
     update_data = equipment_data.model_dump()
+    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data.update(await sync_stamp(db))
     await db.equipment.update_one({"id": equipment_id}, {"$set": update_data})
     
     updated = await db.equipment.find_one({"id": equipment_id}, {"_id": 0})
+    equipment_index.upsert(updated)
+    refdata.put("equipment", updated)
+    await cache_bus.publish("equipment", op="upsert", id=equipment_id)
     return updated
 
 @api_router.delete("/equipment/{equipment_id}")
@@ -448,76 +835,178 @@ async def delete_equipment(equipment_id: str):
     result = await db.equipment.delete_one({"id": equipment_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Equipment not found")
-    return {"message": "Equipment deleted"}
+    await record_deletes(db, "equipment", [equipment_id])
+    equipment_index.remove(equipment_id)
+    refdata.remove("equipment", equipment_id)
+    await cache_bus.publish("equipment", op="remove", id=equipment_id)
+    # Its requests are soft-deleted in the background
+    job = await cascade_runner.schedule("equipment", {"id": equipment_id})
+    return {"message": "Equipment deleted", "job_id": job['id']}
 
 @api_router.get("/equipment/{equipment_id}/requests")
-async def get_equipment_requests(equipment_id: str):
-    requests = await db.requests.find(
-        {"equipment_id": equipment_id},
-        {"_id": 0}
-    ).to_list(1000)
-    return requests
+async def get_equipment_requests(request: Request, equipment_id: str, include_archived: bool = False):
+    requests = await find_requests(
+        list_db, {"equipment_id": equipment_id}, [("created_at", DESCENDING)], 1000, include_archived
+    )
+    return negotiated(request, requests)
+
+@api_router.get("/equipment/{equipment_id}/history")
+async def get_equipment_history(
+    equipment_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[str] = None,
+    include_archived: bool = False,
+):
+    """Newest-first page of an asset's requests plus its rollup stats.
+
+    ``before`` is the ``next_cursor`` of the previous page.
+    """
+    query = {"equipment_id": equipment_id}
+    if before:
+        created_at, _, request_id = before.partition("|")
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": request_id}},
+        ]
+    
+    page, stats = await asyncio.gather(
+        find_requests(
+            list_db, query, [("created_at", DESCENDING), ("id", DESCENDING)], limit + 1, include_archived
+        ),
+        list_db[STATS_COLLECTION].find_one({"equipment_id": equipment_id}, {"_id": 0}),
+    )
+    
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = f"{page[-1]['created_at']}|{page[-1]['id']}"
+    
+    return {"items": page, "next_cursor": next_cursor, "stats": summarize(stats)}
 
 # =============================================================================
 # MAINTENANCE REQUEST ROUTES
 # =============================================================================
 @api_router.post("/requests", response_model=dict)
-async def create_request(request_data: RequestCreate, authorization: str = None):
+async def create_request(
+    request: Request,
+    request_data: RequestCreate,
+    authorization: str = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    return await idempotency.run(
+        "requests", idempotency_key, request_data, lambda: insert_request(request_data),
+        caller=bearer_user_id(request.headers),
+    )
+
+async def insert_request(request_data: RequestCreate, request_id: Optional[str] = None) -> dict:
+    """Store a new request. A caller that may retry passes a fixed
+    ``request_id``; if it was already stored, the stored request is returned."""
     # Get equipment info
-    equipment = await db.equipment.find_one({"id": request_data.equipment_id}, {"_id": 0})
+    equipment = await refdata.get_or_load(db, "equipment", request_data.equipment_id)
     if not equipment:
         raise HTTPException(status_code=404, detail="Equipment not found")
     
     # Auto-fill from equipment
-    team_name = None
-    if equipment.get('assigned_team_id'):
-        team = await db.teams.find_one({"id": equipment['assigned_team_id']}, {"_id": 0})
-        team_name = team.get('name') if team else None
+    team = await refdata.get_or_load(db, "teams", equipment.assigned_team_id)
+    team_name = team.name if team else None
     
     tech_name = None
     tech_avatar = None
-    if equipment.get('default_technician_id'):
-        tech = await db.users.find_one(
-            {"id": equipment['default_technician_id']},
-            {"_id": 0, "password": 0}
-        )
-        if tech:
-            tech_name = tech.get('name')
-            tech_avatar = tech.get('avatar')
+    tech = await refdata.get_or_load(db, "users", equipment.default_technician_id)
+    if tech:
+        tech_name = tech.name
+        tech_avatar = tech.avatar
     
     req = MaintenanceRequest(
         **request_data.model_dump(),
-        equipment_name=equipment.get('name'),
-        equipment_category=equipment.get('category'),
-        team_id=equipment.get('assigned_team_id'),
+        **({'id': request_id} if request_id else {}),
+        equipment_name=equipment.name,
+        equipment_category=equipment.category,
+        team_id=equipment.assigned_team_id,
         team_name=team_name,
-        assigned_technician_id=equipment.get('default_technician_id'),
+        assigned_technician_id=equipment.default_technician_id,
         assigned_technician_name=tech_name,
         assigned_technician_avatar=tech_avatar
     )
     
     doc = req.model_dump()
+    doc['created_ts'] = doc['created_at']
     doc['created_at'] = doc['created_at'].isoformat()
     doc['updated_at'] = doc['updated_at'].isoformat()
+    doc['stage_entered_at'] = doc['created_at']
+    doc['scheduled_at'] = parse_scheduled(doc.get('scheduled_date'))
+    doc['is_overdue'] = is_overdue(doc)
+    doc.update(await sync_stamp(db))
     
-    await db.requests.insert_one(doc)
+    try:
+        await db.requests.insert_one(doc)
+    except DuplicateKeyError:
+        if request_id is None:
+            raise
+        return await db.requests.find_one({"id": request_id}, {"_id": 0})
+    await db[STATS_COLLECTION].update_one(
+        {"equipment_id": doc['equipment_id']}, stats_for_create(doc), upsert=True
+    )
     return {k: v for k, v in doc.items() if k != '_id'}
 
+REQUEST_SORT_FIELDS = {
+    "created_at", "updated_at", "scheduled_date", "priority", "stage", "subject",
+}
+
 @api_router.get("/requests", response_model=List[dict])
-async def get_requests(stage: Optional[str] = None, request_type: Optional[str] = None):
+async def get_requests(
+    request: Request,
+    stage: Optional[str] = None,
+    request_type: Optional[str] = None,
+    team_id: Optional[str] = None,
+    assigned_technician_id: Optional[str] = None,
+    equipment_id: Optional[str] = None,
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    scheduled_from: Optional[str] = None,
+    scheduled_to: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_order: str = Query("desc", pattern="^(asc|desc)$"),
+    include_archived: bool = False,
+):
     query = {}
     if stage:
         query['stage'] = stage
     if request_type:
         query['request_type'] = request_type
+    if team_id:
+        query['team_id'] = team_id
+    if assigned_technician_id:
+        query['assigned_technician_id'] = assigned_technician_id
+    if equipment_id:
+        query['equipment_id'] = equipment_id
+    if priority:
+        query['priority'] = priority
+    if category:
+        query['equipment_category'] = category
+    created = date_range_filter(created_from, created_to)
+    if created:
+        query['created_at'] = created
+    scheduled = date_range_filter(scheduled_from, scheduled_to)
+    if scheduled:
+        query['scheduled_date'] = scheduled
     
-    requests = await db.requests.find(query, {"_id": 0}).to_list(1000)
-    return requests
+    sort = build_sort(sort_by, sort_order, REQUEST_SORT_FIELDS, "created_at")
+    requests = await find_requests(list_db, query, sort, 1000, include_archived)
+    return negotiated(request, requests)
+
+@api_router.get("/requests/overdue")
+async def get_overdue_requests():
+    """Overdue requests as of the last background sweep"""
+    view = await read_overdue_view(list_db)
+    return view or {"count": 0, "items": [], "as_of": None, "computed_at": None}
 
 @api_router.get("/requests/calendar")
 async def get_calendar_requests():
     """Get preventive maintenance requests for calendar view"""
-    requests = await db.requests.find(
+    requests = await reporting_db.requests.find(
         {"request_type": "preventive"},
         {"_id": 0}
     ).to_list(1000)
@@ -526,10 +1015,40 @@ async def get_calendar_requests():
 @api_router.get("/requests/{request_id}")
 async def get_request(request_id: str):
     req = await db.requests.find_one({"id": request_id}, {"_id": 0})
+    if not req:
+        # Archived requests stay readable
+        req = await db[ARCHIVE_COLLECTION].find_one({"id": request_id}, {"_id": 0})
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     return req
 
+async def save_request_update(existing: dict, update_dict: dict):
+    """Write a request update together with its stage transition and stats.
+
+    All three writes share a transaction when the deployment supports one.
+    """
+    now = update_dict['updated_at']
+    transition = None
+    if 'stage' in update_dict and update_dict['stage'] != existing.get('stage'):
+        transition = build_transition(existing, update_dict['stage'], now)
+        update_dict['stage_entered_at'] = now
+    if 'scheduled_date' in update_dict:
+        update_dict['scheduled_at'] = parse_scheduled(update_dict['scheduled_date'])
+    update_dict['is_overdue'] = is_overdue({**existing, **update_dict})
+    stats_update = stats_for_change(existing, update_dict, now)
+    update_dict.update(await sync_stamp(db))
+    
+    async def write(session):
+        await db.requests.update_one({"id": existing['id']}, {"$set": update_dict}, session=session)
+        if transition:
+            await db[TRANSITIONS_COLLECTION].insert_one(transition, session=session)
+        if stats_update:
+            await db[STATS_COLLECTION].update_one(
+                {"equipment_id": existing['equipment_id']}, stats_update, upsert=True, session=session
+            )
+    
+    await transactional(write)
+
 @api_router.put("/requests/{request_id}")
 async def update_request(request_id: str, update_data: RequestUpdate):
     existing = await db.requests.find_one({"id": request_id})
@@ -543,20 +1062,17 @@ async def update_request(request_id: str, update_data: RequestUpdate):
     if update_data.stage == RequestStage.SCRAP:
         await db.equipment.update_one(
             {"id": existing['equipment_id']},
-            {"$set": {"is_usable": False}}
+            {"$set": {"is_usable": False, **await sync_stamp(db)}}
         )
     
     # If assigning technician, get their info
     if update_data.assigned_technician_id:
-        tech = await db.users.find_one(
-            {"id": update_data.assigned_technician_id},
-            {"_id": 0, "password": 0}
-        )
+        tech = await refdata.get_or_load(db, "users", update_data.assigned_technician_id)
         if tech:
-            update_dict['assigned_technician_name'] = tech.get('name')
-            update_dict['assigned_technician_avatar'] = tech.get('avatar')
+            update_dict['assigned_technician_name'] = tech.name
+            update_dict['assigned_technician_avatar'] = tech.avatar
     
-    await db.requests.update_one({"id": request_id}, {"$set": update_dict})
+    await save_request_update(existing, update_dict)
     
     updated = await db.requests.find_one({"id": request_id}, {"_id": 0})
     return updated
@@ -576,68 +1092,360 @@ async def update_request_stage(request_id: str, stage: RequestStage):
     if stage == RequestStage.SCRAP:
         await db.equipment.update_one(
             {"id": existing['equipment_id']},
-            {"$set": {"is_usable": False}}
+            {"$set": {"is_usable": False, **await sync_stamp(db)}}
         )
     
-    await db.requests.update_one({"id": request_id}, {"$set": update_dict})
+    await save_request_update(existing, update_dict)
     
     updated = await db.requests.find_one({"id": request_id}, {"_id": 0})
     return updated
 
+@api_router.post("/requests/bulk-stage")
+async def bulk_update_request_stage(payload: BulkStageUpdate):
+    """Move many Kanban cards at once: one bulk_write per collection"""
+    ids = [move.id for move in payload.moves]
+    existing_docs = await db.requests.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+    by_id = {doc['id']: doc for doc in existing_docs}
+    now = datetime.now(timezone.utc).isoformat()
+    # One sequence number for the whole batch; sync pages tie-break on id
+    stamp = await sync_stamp(db)
+    
+    request_ops = []
+    stats_ops = []
+    transitions = []
+    scrapped_equipment = set()
+    not_found = []
+    for move in payload.moves:
+        existing = by_id.get(move.id)
+        if not existing:
+            not_found.append(move.id)
+            continue
+        if existing.get('stage') == move.stage:
+            continue
+        update_dict = {'stage': move.stage, 'updated_at': now, 'stage_entered_at': now}
+        update_dict['is_overdue'] = is_overdue({**existing, **update_dict})
+        transitions.append(build_transition(existing, move.stage, now))
+        stats_update = stats_for_change(existing, update_dict, now)
+        if stats_update:
+            stats_ops.append(UpdateOne({"equipment_id": existing['equipment_id']}, stats_update, upsert=True))
+        request_ops.append(UpdateOne({"id": move.id}, {"$set": {**update_dict, **stamp}}))
+        if move.stage == RequestStage.SCRAP:
+            scrapped_equipment.add(existing['equipment_id'])
+        # Later moves of the same card in this batch start from this stage
+        by_id[move.id] = {**existing, **update_dict}
+    
+    async def write(session):
+        if request_ops:
+            await db.requests.bulk_write(request_ops, ordered=True, session=session)
+            await db[TRANSITIONS_COLLECTION].insert_many(transitions, session=session)
+        if stats_ops:
+            await db[STATS_COLLECTION].bulk_write(stats_ops, ordered=True, session=session)
+        if scrapped_equipment:
+            await db.equipment.update_many(
+                {"id": {"$in": list(scrapped_equipment)}},
+                {"$set": {"is_usable": False, **stamp}},
+                session=session,
+            )
+    
+    await transactional(write)
+    return {"updated": len(request_ops), "not_found": not_found}
+
+@api_router.post("/requests/{request_id}/time-log", status_code=status.HTTP_202_ACCEPTED)
+async def log_request_time(request_id: str, entry: TimeLogEntry):
+    """Add hours to a request's hours_spent.
+
+    The increment is buffered and written with others in the next flush, so
+    it shows up in reads within HOURS_FLUSH_SECONDS rather than immediately.
+    """
+    pending = hours_buffer.add(request_id, entry.hours)
+    return {"request_id": request_id, "pending_hours": pending}
+
+@api_router.get("/requests/{request_id}/transitions")
+async def get_request_transitions(request_id: str):
+    transitions = await db[TRANSITIONS_COLLECTION].find(
+        {"request_id": request_id}, {"_id": 0}
+    ).sort("at", ASCENDING).to_list(1000)
+    return transitions
+
 @api_router.delete("/requests/{request_id}")
 async def delete_request(request_id: str):
-    result = await db.requests.delete_one({"id": request_id})
-    if result.deleted_count == 0:
+    existing = await db.requests.find_one_and_delete({"id": request_id}, {"_id": 0})
+    if not existing:
         raise HTTPException(status_code=404, detail="Request not found")
+    await db[STATS_COLLECTION].update_one(
+        {"equipment_id": existing['equipment_id']}, stats_for_delete(existing)
+    )
+    await record_deletes(db, "requests", [request_id])
     return {"message": "Request deleted"}
 
+# =============================================================================
+# METER ROUTES
+# =============================================================================
+@api_router.post("/meters/readings", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_meter_readings(batch: MeterReadingBatch):
+    """Buffer a batch of readings; they are stored within METER_FLUSH_SECONDS.
+
+    Readings for unknown equipment are skipped and listed in ``rejected``.
+    Answers 503 when the write buffer is full, e.g. while MongoDB is down.
+    """
+    now = datetime.now(timezone.utc)
+    accepted, rejected = [], set()
+    for reading in batch.readings:
+        # Reference snapshot lookup, no database round trip per reading
+        if refdata.equipment(reading.equipment_id) is None:
+            rejected.add(reading.equipment_id)
+            continue
+        at = reading.at or now
+        # Readings without an offset are taken to be UTC
+        at = at.astimezone(timezone.utc) if at.tzinfo else at.replace(tzinfo=timezone.utc)
+        accepted.append({
+            "equipment_id": reading.equipment_id,
+            "meter": reading.meter.value,
+            "value": reading.value,
+            "at": at,
+        })
+    try:
+        created = await meter_service.ingest(accepted)
+    except MeterBufferFull as exc:
+        raise HTTPException(
+            status_code=503, detail=str(exc), headers={"Retry-After": str(max(1, round(meter_service.flush_interval)))}
+        )
+    return {
+        "accepted": len(accepted),
+        "rejected": sorted(rejected),
+        "requests_created": [request['id'] for request in created],
+    }
+
+@api_router.get("/equipment/{equipment_id}/meters")
+async def get_equipment_meters(equipment_id: str):
+    """Latest reading and threshold of each of the asset's meters"""
+    return await meter_service.meters(equipment_id)
+
+@api_router.get("/equipment/{equipment_id}/meters/{meter}/readings")
+async def get_meter_readings(
+    equipment_id: str,
+    meter: MeterKind,
+    since: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=5000),
+):
+    return await meter_service.history(equipment_id, meter.value, since, limit)
+
+@api_router.put("/equipment/{equipment_id}/meters/{meter}/threshold")
+async def set_meter_threshold(equipment_id: str, meter: MeterKind, threshold: MeterThreshold):
+    """Open a preventive request every ``interval`` hours or cycles from the current reading"""
+    if not await refdata.get_or_load(db, "equipment", equipment_id):
+        raise HTTPException(status_code=404, detail="Equipment not found")
+    doc = await meter_service.set_threshold(equipment_id, meter.value, threshold.interval, threshold.priority)
+    await cache_bus.publish("meters", equipment_id=equipment_id, meter=meter.value)
+    return {k: v for k, v in doc.items() if k != '_id'}
+
+@api_router.delete("/equipment/{equipment_id}/meters/{meter}/threshold")
+async def delete_meter_threshold(equipment_id: str, meter: MeterKind):
+    if not await meter_service.remove_threshold(equipment_id, meter.value):
+        raise HTTPException(status_code=404, detail="Threshold not found")
+    await cache_bus.publish("meters", equipment_id=equipment_id, meter=meter.value)
+    return {"message": "Threshold removed"}
+
+async def open_meter_request(threshold: dict, due: float, value: float, request_id: str) -> dict:
+    unit = threshold['meter']
+    return await insert_request(RequestCreate(
+        subject=f"Service due at {due:g} {unit}",
+        description=(
+            f"Meter read {value:g} {unit}, passing the {threshold['interval']:g} {unit} service interval."
+        ),
+        request_type=RequestType.PREVENTIVE,
+        scheduled_date=datetime.now(timezone.utc).date().isoformat(),
+        priority=threshold.get('priority', 'medium'),
+        equipment_id=threshold['equipment_id'],
+    ), request_id=request_id)
+
+# =============================================================================
+# ATTACHMENT ROUTES
+# =============================================================================
+@api_router.post("/requests/{request_id}/attachments")
+async def upload_request_attachment(
+    request: Request,
+    request_id: str,
+    filename: str = Query(..., min_length=1, max_length=255),
+):
+    """Attach the raw request body as a file named ``filename``"""
+    if not await db.requests.count_documents({"id": request_id}, limit=1):
+        raise HTTPException(status_code=404, detail="Request not found")
+    return await upload_attachment(request, "request", request_id, filename)
+
+@api_router.get("/requests/{request_id}/attachments")
+async def get_request_attachments(request_id: str):
+    return await attachment_service.list("request", request_id)
+
+@api_router.post("/equipment/{equipment_id}/attachments")
+async def upload_equipment_attachment(
+    request: Request,
+    equipment_id: str,
+    filename: str = Query(..., min_length=1, max_length=255),
+):
+    """Attach the raw request body as a file named ``filename``"""
+    if not await refdata.get_or_load(db, "equipment", equipment_id):
+        raise HTTPException(status_code=404, detail="Equipment not found")
+    return await upload_attachment(request, "equipment", equipment_id, filename)
+
+@api_router.get("/equipment/{equipment_id}/attachments")
+async def get_equipment_attachments(equipment_id: str):
+    return await attachment_service.list("equipment", equipment_id)
+
+async def upload_attachment(request: Request, owner_type: str, owner_id: str, filename: str) -> dict:
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > attachment_service.max_bytes:
+        raise HTTPException(status_code=413, detail=f"Attachments are limited to {attachment_service.max_bytes} bytes")
+    content_type = request.headers.get("content-type", "application/octet-stream").split(";")[0].strip()
+    try:
+        # The body is consumed chunk by chunk as it arrives
+        return await attachment_service.upload(owner_type, owner_id, filename, content_type, request.stream())
+    except AttachmentTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+
+@api_router.get("/attachments/{attachment_id}")
+async def download_attachment(request: Request, attachment_id: str):
+    """File contents; supports Range, If-Range and If-None-Match"""
+    attachment = await attachment_service.get(attachment_id)
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return download_response(
+        attachment_service.store,
+        attachment['id'],
+        attachment['size'],
+        f'"{attachment["sha256"]}"',
+        attachment['content_type'],
+        attachment['filename'],
+        request.headers,
+    )
+
+@api_router.get("/attachments/{attachment_id}/thumbnail")
+async def download_attachment_thumbnail(request: Request, attachment_id: str):
+    attachment = await attachment_service.get(attachment_id)
+    if not attachment or attachment.get('thumbnail') != "ready":
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    return download_response(
+        attachment_service.store,
+        thumbnail_id(attachment['id']),
+        attachment['thumbnail_bytes'],
+        f'"{attachment["sha256"]}-thumb"',
+        "image/jpeg",
+        attachment['filename'],
+        request.headers,
+    )
+
+@api_router.delete("/attachments/{attachment_id}")
+async def delete_attachment(attachment_id: str):
+    attachment = await attachment_service.get(attachment_id)
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    await attachment_service.delete(attachment)
+    return {"message": "Attachment deleted"}
+
+# =============================================================================
+# JOB ROUTES
+# =============================================================================
+@api_router.get("/jobs")
+async def list_jobs(
+    status: str = Query("failed", pattern="^(pending|running|retrying|failed|done)$"),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Cascade jobs in one status, oldest first; ``failed`` ones ran out of retries"""
+    return await cascade_runner.by_status(status, limit)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and per-step progress of a background cascade job"""
+    job = await cascade_runner.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# =============================================================================
+# SYNC ROUTES
+# =============================================================================
+@api_router.get("/sync")
+async def sync_changes(
+    request: Request,
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+):
+    """Requests, equipment and teams changed or deleted since the previous sync's token.
+
+    With no ``since``, or when the reply has ``reset``, the client drops its
+    local copy and pages from the start until ``has_more`` is false.
+    """
+    # Read from the primary: a lagging secondary could hide settled writes
+    return negotiated(request, await sync.changes_since(db, since, limit))
+
+# =============================================================================
+# SEARCH ROUTES
+# =============================================================================
+@api_router.get("/search")
+async def search(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
+    """Full-text search over equipment name/serial number and request subject/description"""
+    text_query = {"$text": {"$search": q}}
+    score = {"score": {"$meta": "textScore"}}
+    projection = {"_id": 0, **score}
+    
+    equipment = await list_db.equipment.find(text_query, projection).sort(
+        [("score", {"$meta": "textScore"})]
+    ).to_list(limit)
+    requests = await list_db.requests.find(text_query, projection).sort(
+        [("score", {"$meta": "textScore"})]
+    ).to_list(limit)
+    
+    return {"equipment": equipment, "requests": requests}
+
 # =============================================================================
 # ANALYTICS ROUTES
 # =============================================================================
 @api_router.get("/analytics/dashboard")
 async def get_dashboard_analytics():
-    # Counts by stage
+    return await dashboard_analytics(reporting_db.teams.find({}, {"_id": 0}).to_list(100))
+
+async def dashboard_analytics(teams: Awaitable[List[dict]]) -> dict:
+    """Dashboard counters; the independent counts and the team read run concurrently"""
     stages = ["new", "in_progress", "repaired", "scrap"]
-    stage_counts = {}
-    for stage in stages:
-        count = await db.requests.count_documents({"stage": stage})
-        stage_counts[stage] = count
-    
-    # Counts by team
-    teams = await db.teams.find({}, {"_id": 0}).to_list(100)
-    team_counts = []
-    for team in teams:
-        count = await db.requests.count_documents({"team_id": team['id']})
-        team_counts.append({"name": team['name'], "count": count, "id": team['id']})
-    
-    # Overdue count (scheduled_date in past, not completed)
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    overdue_count = await db.requests.count_documents({
-        "scheduled_date": {"$lt": today, "$ne": None},
-        "stage": {"$nin": ["repaired", "scrap"]}
-    })
-    
-    # Total equipment and unusable
-    total_equipment = await db.equipment.count_documents({})
-    unusable_equipment = await db.equipment.count_documents({"is_usable": False})
-    
-    # Total requests
-    total_requests = await db.requests.count_documents({})
-    
-    # Request type breakdown
-    corrective = await db.requests.count_documents({"request_type": "corrective"})
-    preventive = await db.requests.count_documents({"request_type": "preventive"})
+    requests = reporting_db.requests
+    (
+        teams, stage_totals, team_totals, overdue_view, total_equipment, unusable_equipment,
+        total_requests, corrective, preventive, archived,
+    ) = await asyncio.gather(
+        teams,
+        asyncio.gather(*(requests.count_documents({"stage": stage}) for stage in stages)),
+        requests.aggregate([{"$group": {"_id": "$team_id", "count": {"$sum": 1}}}]).to_list(None),
+        # Overdue count, materialized by the overdue sweep
+        read_overdue_view(reporting_db),
+        reporting_db.equipment.count_documents({}),
+        reporting_db.equipment.count_documents({"is_usable": False}),
+        requests.count_documents({}),
+        requests.count_documents({"request_type": "corrective"}),
+        requests.count_documents({"request_type": "preventive"}),
+        # Counts contributed by requests moved to the archive
+        archived_rollups(reporting_db),
+    )
+    per_team = {row['_id']: row['count'] for row in team_totals}
+    for team_id, count in archived.get('team_id', {}).items():
+        per_team[team_id] = per_team.get(team_id, 0) + count
+    archived_stages = archived.get('stage', {})
+    archived_types = archived.get('request_type', {})
     
     return {
-        "stage_counts": stage_counts,
-        "team_counts": team_counts,
-        "overdue_count": overdue_count,
+        "stage_counts": {
+            stage: count + archived_stages.get(stage, 0) for stage, count in zip(stages, stage_totals)
+        },
+        "team_counts": [
+            {"name": team['name'], "count": per_team.get(team['id'], 0), "id": team['id']}
+            for team in teams
+        ],
+        "overdue_count": overdue_view['count'] if overdue_view else 0,
         "total_equipment": total_equipment,
         "unusable_equipment": unusable_equipment,
-        "total_requests": total_requests,
+        "total_requests": total_requests + archived.get('total', {}).get(None, 0),
         "request_types": {
-            "corrective": corrective,
-            "preventive": preventive
+            "corrective": corrective + archived_types.get('corrective', 0),
+            "preventive": preventive + archived_types.get('preventive', 0)
         }
     }
 
@@ -647,8 +1455,10 @@ async def get_requests_by_category():
         {"$group": {"_id": "$equipment_category", "count": {"$sum": 1}}},
         {"$project": {"category": "$_id", "count": 1, "_id": 0}}
     ]
-    result = await db.requests.aggregate(pipeline).to_list(100)
-    return result
+    result, archived = await asyncio.gather(
+        reporting_db.requests.aggregate(pipeline).to_list(100), archived_rollups(reporting_db)
+    )
+    return with_archived_counts(result, "category", archived.get('equipment_category', {}))
 
 @api_router.get("/analytics/requests-by-team")
 async def get_requests_by_team():
@@ -656,11 +1466,94 @@ async def get_requests_by_team():
         {"$group": {"_id": "$team_name", "count": {"$sum": 1}}},
         {"$project": {"team": "$_id", "count": 1, "_id": 0}}
     ]
-    result = await db.requests.aggregate(pipeline).to_list(100)
-    return result
+    result, archived = await asyncio.gather(
+        reporting_db.requests.aggregate(pipeline).to_list(100), archived_rollups(reporting_db)
+    )
+    return with_archived_counts(result, "team", archived.get('team_name', {}))
+
+def with_archived_counts(rows: List[dict], key: str, archived: dict) -> List[dict]:
+    """Add archived requests' counts to ``{key: value, "count": n}`` rows"""
+    counts = {row[key]: row['count'] for row in rows}
+    for value, count in archived.items():
+        counts[value] = counts.get(value, 0) + count
+    return [{key: value, "count": count} for value, count in counts.items()]
+
+@api_router.get("/analytics/cycle-time")
+async def get_cycle_time(days: int = Query(90, ge=1, le=3650), team_id: Optional[str] = None):
+    """Average time spent per Kanban stage and created-to-repaired lead time"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    result = await reporting_db[TRANSITIONS_COLLECTION].aggregate(
+        cycle_time_pipeline(since, team_id)
+    ).to_list(1)
+    report = result[0] if result else {"stages": [], "lead_time": []}
+    return {"days": days, **report}
+
+@api_router.get("/analytics/reliability")
+async def get_reliability(
+    group_by: str = Query("equipment", pattern=f"^({'|'.join(GROUPINGS)})$"),
+    days: int = Query(365, ge=1, le=3650),
+):
+    """MTTR / MTBF per equipment, category, team or department over the last ``days``"""
+    results = await reliability.metrics(group_by, days)
+    return {"group_by": group_by, "days": days, "results": results}
 
-# Include the router in the main app
-app.include_router(api_router)
+# =============================================================================
+# BOOTSTRAP ROUTES
+# =============================================================================
+@api_router.get("/bootstrap")
+async def bootstrap(authorization: Optional[str] = Header(None)):
+    """Everything the SPA loads right after login, in one round trip.
+
+    After authentication, the queries behind /analytics/dashboard, the two
+    dashboard charts, /teams, /equipment and /users/technicians run
+    concurrently and share one read of the teams.
+    """
+    user = await get_current_user(authorization)
+    teams = asyncio.ensure_future(db.teams.find({}, {"_id": 0}).to_list(1000))
+    dashboard, by_category, by_team, equipment = await asyncio.gather(
+        dashboard_analytics(teams),
+        get_requests_by_category(),
+        get_requests_by_team(),
+        list_equipment({}, build_sort(None, "asc", EQUIPMENT_SORT_FIELDS, "name")),
+    )
+    technicians = [
+        user_ref.to_dict() for user_ref in refdata.users_with_roles(TECHNICIAN_ROLES)
+    ]
+    return {
+        "user": user,
+        "dashboard": dashboard,
+        "requests_by_category": by_category,
+        "requests_by_team": by_team,
+        "teams": with_members(teams.result()),
+        "equipment": equipment,
+        "technicians": technicians,
+    }
+
+# =============================================================================
+# HEALTH ROUTES
+# =============================================================================
+@app.get("/health")
+async def health():
+    """Liveness: answers without touching MongoDB and reports pool and loop pressure"""
+    return {"status": "ok", "pool": pool_monitor.stats(), "loop": lag_monitor.snapshot()}
+
+@app.get("/ready")
+async def ready():
+    """Readiness: MongoDB answers a ping and the pool is not starved"""
+    pool = pool_monitor.stats()
+    try:
+        await asyncio.wait_for(get_client().admin.command("ping"), timeout=2)
+    except Exception as exc:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "reason": f"mongo: {exc.__class__.__name__}", "pool": pool},
+        )
+    if pool["wait_queue_depth"] > READY_MAX_WAIT_QUEUE:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "saturated", "reason": "connection wait queue too deep", "pool": pool},
+        )
+    return {"status": "ready", "pool": pool}
 
 
 # Configure logging
@@ -670,6 +1563,190 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def connect_mongo():
+    settings = pool_settings_from_env()
+    await warm_pool(get_client(), settings["minPoolSize"])
+    logger.info("Mongo pool warmed in worker %d: %s", os.getpid(), pool_monitor.stats())
+
+async def ensure_indexes():
+    """Create the indexes backing id lookups, list filters, sorts and text search"""
+    await db.users.create_index("id", unique=True)
+    await db.users.create_index("email")
+    await db.users.create_index("team_id")
+    await db.teams.create_index("id", unique=True)
+    
+    await db.equipment.create_index("id", unique=True)
+    await db.equipment.create_index("name")
+    await db.equipment.create_index([("department", ASCENDING), ("name", ASCENDING)])
+    await db.equipment.create_index([("location", ASCENDING), ("name", ASCENDING)])
+    await db.equipment.create_index([("category", ASCENDING), ("name", ASCENDING)])
+    await db.equipment.create_index("assigned_team_id")
+    await db.equipment.create_index("default_technician_id")
+    await db.equipment.create_index(
+        [("name", TEXT), ("serial_number", TEXT)],
+        name="equipment_text",
+        weights={"serial_number": 5, "name": 1},
+    )
+    
+    await db.requests.create_index("id", unique=True)
+    await db.requests.create_index([("created_at", DESCENDING)])
+    await db.requests.create_index([("stage", ASCENDING), ("created_at", DESCENDING)])
+    await db.requests.create_index([("request_type", ASCENDING), ("scheduled_date", ASCENDING)])
+    await db.requests.create_index([("team_id", ASCENDING), ("created_at", DESCENDING)])
+    await db.requests.create_index([("assigned_technician_id", ASCENDING), ("created_at", DESCENDING)])
+    await db.requests.create_index(
+        [("equipment_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]
+    )
+    await db.requests.create_index([("priority", ASCENDING), ("created_at", DESCENDING)])
+    await db.requests.create_index([("equipment_category", ASCENDING), ("created_at", DESCENDING)])
+    await db.requests.create_index("scheduled_date")
+    await db.requests.create_index("scheduled_at")
+    await db.requests.create_index([("is_overdue", ASCENDING), ("scheduled_at", ASCENDING)])
+    await db.requests.create_index(
+        [("subject", TEXT), ("description", TEXT)],
+        name="requests_text",
+        weights={"subject": 3, "description": 1},
+    )
+    
+    await db[STATS_COLLECTION].create_index("equipment_id", unique=True)
+    
+    await db[TRANSITIONS_COLLECTION].create_index([("request_id", ASCENDING), ("at", ASCENDING)])
+    await db[TRANSITIONS_COLLECTION].create_index([("at", DESCENDING)])
+    await db[TRANSITIONS_COLLECTION].create_index([("team_id", ASCENDING), ("at", DESCENDING)])
+    
+    await idempotency.ensure_indexes()
+    await sync.ensure_indexes(db)
+    await archive.ensure_indexes(db)
+    await revocations.ensure_indexes()
+    await attachment_service.ensure_indexes()
+    await meters.ensure_collections(db)
+    await cascade.ensure_indexes(db)
+
+async def backfill_equipment_stats():
+    """Build the per-asset rollups once for databases that predate them"""
+    if await db[STATS_COLLECTION].estimated_document_count() > 0:
+        return
+    if await db.requests.estimated_document_count() == 0:
+        return
+    await db.requests.aggregate(rebuild_pipeline(union_with=ARCHIVE_COLLECTION)).to_list(None)
+    logger.info("Backfilled equipment stats from existing requests")
+
+async def reload_equipment_index():
+    docs = [doc async for doc in db.equipment.find({}, SUGGEST_PROJECTION)]
+    equipment_index.load(docs)
+    logger.info("Equipment suggest index warmed with %d assets", len(equipment_index))
+
+async def on_equipment_event(payload: dict):
+    if payload.get("op") == "remove":
+        equipment_index.remove(payload["id"])
+        return
+    doc = await db.equipment.find_one({"id": payload["id"]}, SUGGEST_PROJECTION)
+    if doc:
+        equipment_index.upsert(doc)
+
+cache_bus.subscribe("equipment", on_equipment_event, resync=reload_equipment_index)
+
+async def refdata_changed(kind: str, ids):
+    """Re-read changed reference records here and in every other worker"""
+    ids = list(ids)
+    if not ids:
+        return
+    await refdata.refresh(db, kind, ids)
+    await cache_bus.publish("refdata", kind=kind, ids=ids)
+
+async def on_refdata_event(payload: dict):
+    await refdata.refresh(db, payload["kind"], payload["ids"])
+
+async def on_equipment_refdata_event(payload: dict):
+    await refdata.refresh(db, "equipment", [payload["id"]])
+
+async def reload_refdata():
+    await refdata.load(db)
+
+cache_bus.subscribe("refdata", on_refdata_event, resync=reload_refdata)
+cache_bus.subscribe("equipment", on_equipment_refdata_event)
+
+async def on_cascade_batch(kind: str, step: str, ids: List[str]):
+    if step == "equipment":
+        await refdata_changed("equipment", ids)
+
+async def on_cascade_finished(job: dict):
+    # Drop what the dashboards computed while the dependents still existed
+    reliability.invalidate()
+    await sweep_overdue(db)
+
+async def apply_migrations():
+    """Apply pending data migrations unless another worker or the CLI already is"""
+    try:
+        applied = await migration_runner.run(migrations.MIGRATIONS)
+    except migrations.RunnerBusy:
+        return
+    if applied:
+        logger.info("Applied data migrations: %s", ", ".join(f"{version:04d}" for version in applied))
+        # Backfilled fields (e.g. scheduled_at) count towards the overdue view
+        # now rather than at the next sweep
+        await overdue_job.run_once()
+
+async def warn_pending_migrations():
+    pending = await migrations.pending(db, migrations.MIGRATIONS)
+    if pending:
+        logger.warning(
+            "Pending data migrations: %s; run `python -m migrations up` from backend/",
+            ", ".join(f"{m.version:04d} {m.name}" for m in pending),
+        )
+
+async def on_meter_event(payload: dict):
+    await meter_service.reload_threshold(payload["equipment_id"], payload["meter"])
+
+cache_bus.subscribe("meters", on_meter_event, resync=meter_service.load)
+
+async def warm_caches():
+    await revocations.refresh()
+    await meter_service.load()
+    await reload_refdata()
+    await reload_equipment_index()
+    await cache_bus.start()
+
+# =============================================================================
+# LIFECYCLE
+# =============================================================================
+async def on_startup():
+    started = time.perf_counter()
+    lag_monitor.start()
+    await connect_mongo()
+    await ensure_indexes()
+    await backfill_equipment_stats()
+    if not MIGRATIONS_AUTO_APPLY:
+        await warn_pending_migrations()
+    await warm_caches()
+    overdue_job.start()
+    archive_job.start()
+    cascade_resume_job.start()
+    revocation_job.start()
+    if MIGRATIONS_AUTO_APPLY:
+        migration_job.start()
+    hours_buffer.start()
+    meter_service.start()
+    logger.info("Worker %d ready in %.0f ms", os.getpid(), (time.perf_counter() - started) * 1000)
+
+async def on_shutdown():
+    # Flush buffered writes while the client is still open. A step that
+    # fails is logged and the rest still run, so the client always closes.
+    for stop in (
+        hours_buffer.stop,
+        meter_service.stop,
+        overdue_job.stop,
+        archive_job.stop,
+        cascade_resume_job.stop,
+        revocation_job.stop,
+        migration_job.stop,
+        attachment_service.stop,
+        cascade_runner.stop,
+        cache_bus.stop,
+        lag_monitor.stop,
+    ):
+        try:
+            await stop()
+        except Exception:
+            logger.exception("Shutdown step %s failed", stop.__qualname__)
+    close_client()
@@ -0,0 +1,141 @@
+"""Delta sync for offline-capable clients.
+
+Every write to a synced collection stamps the document with ``sync_seq``,
+a number from one global ``$inc`` counter, plus ``sync_at``. Deletes leave
+a tombstone with its own sequence number. A client sends back the opaque
+token from its last sync and gets only the documents whose
+``(sync_seq, id)`` is past its position in each collection.
+
+Sequence numbers are handed out before the write that carries them, so a
+slow write can become visible after a later number. A token therefore
+only advances past documents stamped more than ``SETTLE_SECONDS`` ago.
+Anything newer is sent again on the next sync, and clients apply changes
+idempotently by id.
+"""
+import base64
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo import ASCENDING, ReturnDocument
+
+SYNC_COLLECTIONS = ("requests", "equipment", "teams")
+TOMBSTONES_COLLECTION = "sync_tombstones"
+COUNTERS_COLLECTION = "counters"
+SYNC_COUNTER_ID = "sync"
+
+SETTLE_SECONDS = float(os.environ.get("SYNC_SETTLE_SECONDS", "5"))
+TOMBSTONE_TTL_DAYS = int(os.environ.get("SYNC_TOMBSTONE_TTL_DAYS", "30"))
+
+Position = Tuple[int, str]
+STREAMS = SYNC_COLLECTIONS + (TOMBSTONES_COLLECTION,)
+START: Position = (-1, "")
+
+
+async def next_seq(database) -> int:
+    counter = await database[COUNTERS_COLLECTION].find_one_and_update(
+        {"_id": SYNC_COUNTER_ID},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return counter["seq"]
+
+
+async def sync_stamp(database) -> dict:
+    """Fields to ``$set`` alongside a write to a synced collection.
+
+    Take the stamp before opening a transaction; the counter is one hot
+    document and would make concurrent transactions conflict.
+    """
+    return {"sync_seq": await next_seq(database), "sync_at": datetime.now(timezone.utc)}
+
+
+async def record_deletes(database, collection: str, ids: Iterable[str]) -> None:
+    ids = list(ids)
+    if not ids:
+        return
+    stamp = await sync_stamp(database)
+    await database[TOMBSTONES_COLLECTION].insert_many(
+        [{"collection": collection, "id": doc_id, **stamp} for doc_id in ids]
+    )
+
+
+async def ensure_indexes(database) -> None:
+    for name in SYNC_COLLECTIONS:
+        await database[name].create_index([("sync_seq", ASCENDING), ("id", ASCENDING)])
+    await database[TOMBSTONES_COLLECTION].create_index([("sync_seq", ASCENDING), ("id", ASCENDING)])
+    await database[TOMBSTONES_COLLECTION].create_index(
+        "sync_at", expireAfterSeconds=TOMBSTONE_TTL_DAYS * 24 * 3600
+    )
+
+
+def encode_token(positions: Dict[str, Position], issued_at: datetime) -> str:
+    raw = json.dumps({"at": issued_at.timestamp(), "pos": positions}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_token(token: str) -> Tuple[Dict[str, Position], datetime]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        positions = {stream: tuple(raw["pos"][stream]) for stream in STREAMS}
+        issued_at = datetime.fromtimestamp(raw["at"], tz=timezone.utc)
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return positions, issued_at
+
+
+def _after(position: Position) -> dict:
+    seq, doc_id = position
+    return {"$or": [{"sync_seq": {"$gt": seq}}, {"sync_seq": seq, "id": {"$gt": doc_id}}]}
+
+
+async def changes_since(database, token: Optional[str], limit: int) -> dict:
+    now = datetime.now(timezone.utc)
+    reset = False
+    if token:
+        positions, issued_at = decode_token(token)
+        if now - issued_at > timedelta(days=TOMBSTONE_TTL_DAYS):
+            # Tombstones this client has not seen may already have expired
+            positions, reset = {stream: START for stream in STREAMS}, True
+    else:
+        positions, reset = {stream: START for stream in STREAMS}, True
+
+    settled_before = now - timedelta(seconds=SETTLE_SECONDS)
+    changes: Dict[str, List[dict]] = {}
+    deleted: Dict[str, List[str]] = {name: [] for name in SYNC_COLLECTIONS}
+    has_more = False
+    for stream in STREAMS:
+        docs = await database[stream].find(_after(positions[stream]), {"_id": 0}).sort(
+            [("sync_seq", ASCENDING), ("id", ASCENDING)]
+        ).to_list(limit)
+
+        # Advance only over the settled prefix of this page
+        settled = 0
+        for doc in docs:
+            if doc["sync_at"].replace(tzinfo=timezone.utc) >= settled_before:
+                break
+            settled += 1
+        if settled:
+            positions[stream] = (docs[settled - 1]["sync_seq"], docs[settled - 1]["id"])
+        if len(docs) == limit and settled == len(docs):
+            has_more = True
+
+        if stream == TOMBSTONES_COLLECTION:
+            for doc in docs:
+                deleted.setdefault(doc["collection"], []).append(doc["id"])
+        else:
+            for doc in docs:
+                doc.pop("sync_seq", None)
+                doc.pop("sync_at", None)
+            changes[stream] = docs
+
+    return {
+        "token": encode_token(positions, now),
+        "reset": reset,
+        "has_more": has_more,
+        "changes": changes,
+        "deleted": deleted,
+    }
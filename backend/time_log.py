@@ -0,0 +1,164 @@
+"""Write-behind buffer for technicians' hours_spent increments.
+
+Increments are summed per request in memory and flushed every
+``flush_interval`` seconds (or sooner once ``max_pending`` requests are
+buffered) as one ``bulk_write`` of ``$inc`` updates, plus one for the
+per-asset stats, in a single transaction where the deployment has them.
+
+Each flush has an id that every ``$inc`` records on its document (the
+last ``FLUSH_IDS_KEPT`` of them), and an update skips documents that
+already carry it. A failed flush, whatever the error, is kept and retried
+whole under the same id before any newer hours are written: ops that did
+land, including ones a timeout or an unknown commit result left in doubt,
+are no-ops the second time, so no hours are counted twice. ``stop()``
+flushes whatever is left, so a clean shutdown loses nothing; a crash can
+lose at most one window.
+"""
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional
+
+from pymongo import UpdateOne
+
+from database import transactional
+from equipment_stats import STATS_COLLECTION
+from sync import sync_stamp
+
+logger = logging.getLogger(__name__)
+
+# Applied flush ids remembered per document. Only a failed flush is ever
+# retried, and it is retried before this worker writes anything newer, so
+# this only has to outlast other workers' flushes to the same document.
+FLUSH_IDS_KEPT = 16
+
+
+class _Flush(NamedTuple):
+    flush_id: str
+    hours: Dict[str, float]
+
+
+class HoursBuffer:
+    def __init__(self, database, flush_interval: float = 2.0, max_pending: int = 500):
+        self._database = database
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[str, float] = defaultdict(float)
+        # A flush that failed, to be retried as is before anything newer
+        self._failed: Optional[_Flush] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    def add(self, request_id: str, hours: float) -> float:
+        """Buffer ``hours`` for ``request_id``; returns its pending total"""
+        self._pending[request_id] += hours
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+        return self.pending(request_id)
+
+    def pending(self, request_id: str) -> float:
+        failed = self._failed.hours.get(request_id, 0.0) if self._failed else 0.0
+        return self._pending.get(request_id, 0.0) + failed
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="hours-buffer")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            written = 0
+            if self._failed is not None:
+                await self._apply(self._failed)
+                written, self._failed = len(self._failed.hours), None
+            if self._pending:
+                batch, self._pending = _Flush(uuid.uuid4().hex, dict(self._pending)), defaultdict(float)
+                self._failed = batch
+                await self._apply(batch)
+                written, self._failed = written + len(batch.hours), None
+            return written
+
+    async def _apply(self, flush: _Flush) -> None:
+        stamp = await sync_stamp(self._database)
+        await transactional(lambda session: self._write(flush, stamp, session))
+
+    async def _write(self, flush: _Flush, stamp: dict, session) -> None:
+        batch = flush.hours
+        now = datetime.now(timezone.utc).isoformat()
+        docs = await self._database.requests.find(
+            {"id": {"$in": list(batch)}}, {"_id": 0, "id": 1, "equipment_id": 1}, session=session
+        ).to_list(len(batch))
+        equipment_of = {doc["id"]: doc["equipment_id"] for doc in docs}
+
+        request_ids = [request_id for request_id in batch if request_id in equipment_of]
+        if len(request_ids) < len(batch):
+            logger.warning("Dropped hours for %d unknown requests", len(batch) - len(request_ids))
+        if not request_ids:
+            return
+        await self._database.requests.bulk_write(
+            [
+                UpdateOne(
+                    {"id": request_id, "hours_flush_ids": {"$ne": flush.flush_id}},
+                    {
+                        "$inc": {"hours_spent": batch[request_id]},
+                        "$set": {"updated_at": now, **stamp},
+                        "$push": {"hours_flush_ids": {"$each": [flush.flush_id], "$slice": -FLUSH_IDS_KEPT}},
+                    },
+                )
+                for request_id in request_ids
+            ],
+            ordered=False,
+            session=session,
+        )
+
+        per_equipment: Dict[str, float] = defaultdict(float)
+        for request_id in request_ids:
+            per_equipment[equipment_of[request_id]] += batch[request_id]
+        await self._database[STATS_COLLECTION].bulk_write(
+            [
+                # Filtering on the flush id would make an upsert insert a
+                # second stats document once it was applied; check it inside
+                UpdateOne({"equipment_id": equipment_id}, _add_once(flush.flush_id, hours), upsert=True)
+                for equipment_id, hours in per_equipment.items()
+            ],
+            ordered=False,
+            session=session,
+        )
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Flushing buffered hours failed; will retry")
+
+
+def _add_once(flush_id: str, hours: float) -> list:
+    """Pipeline adding ``hours`` to total_hours unless ``flush_id`` already did"""
+    seen = {"$ifNull": ["$hours_flush_ids", []]}
+    applied = {"$in": [flush_id, seen]}
+    return [{"$set": {
+        "total_hours": {"$cond": [applied, "$total_hours", {"$add": [{"$ifNull": ["$total_hours", 0]}, hours]}]},
+        "hours_flush_ids": {"$cond": [
+            applied, "$hours_flush_ids", {"$slice": [{"$concatArrays": [seen, [flush_id]]}, -FLUSH_IDS_KEPT]}
+        ]},
+    }}]
@@ -0,0 +1,148 @@
+"""Access-token signing keys and revocation.
+
+Tokens carry the ``kid`` of the key that signed them. ``JWT_KEYS`` lists
+the accepted keys as ``kid:secret`` pairs and ``JWT_ACTIVE_KID`` picks the
+one new tokens are signed with. To rotate, add a key, make it active, and
+drop the old one once its last tokens have expired. Without ``JWT_KEYS``
+the single ``JWT_SECRET`` is used, as before; it also verifies tokens
+issued before key ids existed.
+
+Revoked tokens (by ``jti``) and per-user "revoke everything issued before"
+cutoffs are stored in the small ``revoked_tokens`` collection, where a TTL
+index drops entries once the tokens they cover have expired. Each worker
+keeps them in memory and pulls new entries on a short interval, so
+checking a token is a set lookup and never a database round trip.
+
+Cutoffs and ``iat`` both keep sub-second precision, and a cutoff covers
+tokens issued strictly before it, so logging in again right after logging
+out everywhere gives a token that stays valid.
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import jwt
+from pymongo import ASCENDING
+
+logger = logging.getLogger(__name__)
+
+REVOKED_COLLECTION = "revoked_tokens"
+LEGACY_KID = "default"
+# Entries written by a worker whose clock runs behind are still picked up
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class KeySet:
+    def __init__(self, keys: Dict[str, str], active_kid: str, algorithm: str = "HS256"):
+        if active_kid not in keys:
+            raise ValueError(f"Active signing key '{active_kid}' is not in the key set")
+        self._keys = keys
+        self.active_kid = active_kid
+        self.algorithm = algorithm
+
+    @classmethod
+    def from_env(cls, default_secret: str, algorithm: str = "HS256") -> "KeySet":
+        configured = os.environ.get("JWT_KEYS", "")
+        if not configured:
+            return cls({LEGACY_KID: default_secret}, LEGACY_KID, algorithm)
+        keys = {}
+        for entry in configured.split(","):
+            kid, _, secret = entry.strip().partition(":")
+            if not kid or not secret:
+                raise ValueError("JWT_KEYS entries must look like kid:secret")
+            keys[kid] = secret
+        return cls(keys, os.environ.get("JWT_ACTIVE_KID") or kid, algorithm)
+
+    def encode(self, claims: dict) -> str:
+        return jwt.encode(
+            claims, self._keys[self.active_kid], algorithm=self.algorithm, headers={"kid": self.active_kid}
+        )
+
+    def decode(self, token: str) -> dict:
+        """Verified claims; raises ``jwt.InvalidTokenError`` (or a subclass)"""
+        kid = jwt.get_unverified_header(token).get("kid", LEGACY_KID)
+        key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key '{kid}'")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+
+class RevocationList:
+    def __init__(self, database, token_lifetime: timedelta):
+        self._database = database
+        self._token_lifetime = token_lifetime
+        # jti -> expiry (epoch seconds) of the revoked token
+        self._tokens: Dict[str, float] = {}
+        # user id -> tokens issued before this time (epoch seconds, with
+        # sub-second precision) are revoked
+        self._users: Dict[str, float] = {}
+        self._synced_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._tokens) + len(self._users)
+
+    def is_revoked(self, claims: dict) -> bool:
+        if claims.get("jti") in self._tokens:
+            return True
+        cutoff = self._users.get(claims.get("sub"))
+        # Strictly before: a token issued right after "log out everywhere",
+        # even within the same second, must stay valid
+        return cutoff is not None and claims.get("iat", 0) < cutoff
+
+    async def ensure_indexes(self) -> None:
+        collection = self._database[REVOKED_COLLECTION]
+        await collection.create_index("expires_at", expireAfterSeconds=0)
+        await collection.create_index([("revoked_at", ASCENDING)])
+
+    async def revoke(self, claims: dict) -> None:
+        """Revoke one token"""
+        now = datetime.now(timezone.utc)
+        doc = {
+            "_id": claims["jti"],
+            "kind": "token",
+            "user_id": claims.get("sub"),
+            "expires_at": datetime.fromtimestamp(claims["exp"], timezone.utc),
+            "revoked_at": now,
+        }
+        await self._database[REVOKED_COLLECTION].replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        self._apply(doc)
+
+    async def revoke_user(self, user_id: str) -> None:
+        """Revoke every token issued to ``user_id`` until now"""
+        now = datetime.now(timezone.utc)
+        doc = {
+            "_id": f"user:{user_id}",
+            "kind": "user",
+            "user_id": user_id,
+            "before": now.timestamp(),
+            # Tokens issued before the cutoff are all expired by then
+            "expires_at": now + self._token_lifetime,
+            "revoked_at": now,
+        }
+        await self._database[REVOKED_COLLECTION].replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        self._apply(doc)
+
+    async def refresh(self) -> None:
+        """Pull entries revoked since the last refresh, and forget expired ones"""
+        started = datetime.now(timezone.utc)
+        query = {"expires_at": {"$gt": started}}
+        if self._synced_at is not None:
+            query["revoked_at"] = {"$gte": self._synced_at - SYNC_OVERLAP}
+        async for doc in self._database[REVOKED_COLLECTION].find(query):
+            self._apply(doc)
+        self._synced_at = started
+
+        now = started.timestamp()
+        self._tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+        oldest_live = now - self._token_lifetime.total_seconds()
+        self._users = {user_id: before for user_id, before in self._users.items() if before > oldest_live}
+
+    def _apply(self, doc: dict) -> None:
+        if doc["kind"] == "user":
+            self._users[doc["user_id"]] = max(doc["before"], self._users.get(doc["user_id"], 0))
+        else:
+            expires_at = doc["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            self._tokens[doc["_id"]] = expires_at.timestamp()
@@ -0,0 +1,96 @@
+"""Append-only log of Kanban stage changes in ``stage_transitions``.
+
+Each entry records how long the request sat in the stage it left, so
+cycle-time (per stage) and lead-time (created -> repaired) reports are a
+single aggregation over this collection.
+"""
+from datetime import datetime
+
+TRANSITIONS_COLLECTION = "stage_transitions"
+
+DONE_STAGE = "repaired"
+
+
+def _value(value):
+    return getattr(value, "value", value)
+
+
+def _hours_between(start: str, end: str) -> float:
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds() / 3600
+
+
+def stage_entered_at(request: dict) -> str:
+    """When ``request`` entered its current stage.
+
+    Requests written before ``stage_entered_at`` existed fall back to their
+    creation time while still new, otherwise to their last update.
+    """
+    if request.get("stage_entered_at"):
+        return request["stage_entered_at"]
+    if request.get("stage", "new") == "new":
+        return request["created_at"]
+    return request.get("updated_at") or request["created_at"]
+
+
+def build_transition(request: dict, to_stage, at: str, changed_by: str = None) -> dict:
+    to_stage = _value(to_stage)
+    entered_at = stage_entered_at(request)
+    transition = {
+        "request_id": request["id"],
+        "equipment_id": request.get("equipment_id"),
+        "team_id": request.get("team_id"),
+        "request_type": _value(request.get("request_type")),
+        "from_stage": _value(request.get("stage")),
+        "to_stage": to_stage,
+        "at": at,
+        "entered_at": entered_at,
+        "duration_hours": max(0.0, _hours_between(entered_at, at)),
+        "request_created_at": request["created_at"],
+        "changed_by": changed_by,
+    }
+    if to_stage == DONE_STAGE:
+        transition["lead_hours"] = max(0.0, _hours_between(request["created_at"], at))
+    return transition
+
+
+def cycle_time_pipeline(since: str, team_id: str = None) -> list:
+    match = {"at": {"$gte": since}}
+    if team_id:
+        match["team_id"] = team_id
+    return [
+        {"$match": match},
+        {"$facet": {
+            "stages": [
+                {"$group": {
+                    "_id": "$from_stage",
+                    "transitions": {"$sum": 1},
+                    "avg_hours": {"$avg": "$duration_hours"},
+                    "max_hours": {"$max": "$duration_hours"},
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "stage": "$_id",
+                    "transitions": 1,
+                    "avg_hours": {"$round": ["$avg_hours", 2]},
+                    "max_hours": {"$round": ["$max_hours", 2]},
+                }},
+                {"$sort": {"stage": 1}},
+            ],
+            "lead_time": [
+                {"$match": {"to_stage": DONE_STAGE}},
+                {"$group": {
+                    "_id": "$request_type",
+                    "completed": {"$sum": 1},
+                    "avg_hours": {"$avg": "$lead_hours"},
+                    "max_hours": {"$max": "$lead_hours"},
+                }},
+                {"$project": {
+                    "_id": 0,
+                    "request_type": "$_id",
+                    "completed": 1,
+                    "avg_hours": {"$round": ["$avg_hours", 2]},
+                    "max_hours": {"$round": ["$max_hours", 2]},
+                }},
+            ],
+        }},
+    ]
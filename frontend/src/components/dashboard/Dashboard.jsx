@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { analyticsService } from '../../services/requests';
 import { equipmentService } from '../../services/equipment';
+import { bootstrapService } from '../../services/bootstrap';
 import { 
     BarChart, 
     Bar, 
@@ -46,11 +47,14 @@ export const Dashboard = () => {
 
     const loadData = async () => {
         try {
-            const [dashboardData, categoryRes, teamRes] = await Promise.all([
-                analyticsService.getDashboard(),
-                analyticsService.getRequestsByCategory(),
-                analyticsService.getRequestsByTeam()
-            ]);
+            const initial = await bootstrapService.claim('dashboard');
+            const [dashboardData, categoryRes, teamRes] = initial
+                ? [initial.dashboard, initial.requests_by_category, initial.requests_by_team]
+                : await Promise.all([
+                    analyticsService.getDashboard(),
+                    analyticsService.getRequestsByCategory(),
+                    analyticsService.getRequestsByTeam()
+                ]);
             setAnalytics(dashboardData);
             setCategoryData(categoryRes.filter(c => c.category));
             setTeamData(teamRes.filter(t => t.team));
@@ -24,6 +24,9 @@ export const EquipmentDetail = () => {
     const navigate = useNavigate();
     const [equipment, setEquipment] = useState(null);
     const [requests, setRequests] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [stats, setStats] = useState(null);
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
@@ -32,12 +35,14 @@ export const EquipmentDetail = () => {
 
     const loadData = async () => {
         try {
-            const [eqData, reqData] = await Promise.all([
+            const [eqData, history] = await Promise.all([
                 equipmentService.getById(id),
-                equipmentService.getRequests(id)
+                equipmentService.getHistory(id)
             ]);
             setEquipment(eqData);
-            setRequests(reqData);
+            setRequests(history.items);
+            setNextCursor(history.next_cursor);
+            setStats(history.stats);
         } catch (error) {
             console.error('Failed to load equipment:', error);
         } finally {
@@ -45,6 +50,19 @@ export const EquipmentDetail = () => {
         }
     };
 
+    const loadMore = async () => {
+        setLoadingMore(true);
+        try {
+            const history = await equipmentService.getHistory(id, { before: nextCursor });
+            setRequests(prev => [...prev, ...history.items]);
+            setNextCursor(history.next_cursor);
+        } catch (error) {
+            console.error('Failed to load older requests:', error);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     if (loading) {
         return (
             <div className="flex items-center justify-center h-64">
@@ -70,6 +88,7 @@ export const EquipmentDetail = () => {
     }
 
     const openRequests = requests.filter(r => r.stage !== 'repaired' && r.stage !== 'scrap');
+    const openCount = equipment.open_request_count ?? openRequests.length;
 
     return (
         <div className="space-y-6" data-testid="equipment-detail">
@@ -103,9 +122,9 @@ export const EquipmentDetail = () => {
                 >
                     <Wrench className="w-4 h-4 mr-2" />
                     Create Request
-                    {openRequests.length > 0 && (
+                    {openCount > 0 && (
                         <span className="ml-2 px-1.5 py-0.5 text-xs font-bold bg-white/20 rounded">
-                            {openRequests.length}
+                            {openCount}
                         </span>
                     )}
                 </Button>
@@ -191,6 +210,26 @@ export const EquipmentDetail = () => {
                 </Card>
             </div>
 
+            {/* Maintenance Stats */}
+            {stats && stats.request_count > 0 && (
+                <Card className="bg-zinc-900/50 border-zinc-800">
+                    <CardHeader>
+                        <CardTitle className="text-white text-lg">Reliability</CardTitle>
+                    </CardHeader>
+                    <CardContent className="grid grid-cols-2 md:grid-cols-5 gap-4">
+                        <InfoRow icon={Clock} label="Hours Logged" value={stats.total_hours} />
+                        <InfoRow icon={Wrench} label="MTTR (h)" value={stats.mttr_hours} />
+                        <InfoRow icon={AlertCircle} label="MTBF (h)" value={stats.mtbf_hours} />
+                        <InfoRow 
+                            icon={CheckCircle} 
+                            label="Corrective / Preventive" 
+                            value={`${stats.corrective_count} / ${stats.preventive_count}`} 
+                        />
+                        <InfoRow icon={Calendar} label="Last Repair" value={formatDate(stats.last_repair_at)} />
+                    </CardContent>
+                </Card>
+            )}
+
             {/* Notes */}
             {equipment.notes && (
                 <Card className="bg-zinc-900/50 border-zinc-800">
@@ -209,9 +248,9 @@ export const EquipmentDetail = () => {
                     <CardTitle className="text-white text-lg flex items-center gap-2">
                         <Wrench className="w-5 h-5 text-orange-500" />
                         Maintenance Requests
-                        {openRequests.length > 0 && (
+                        {openCount > 0 && (
                             <span className="ml-2 px-2 py-0.5 text-xs font-bold bg-orange-500 text-white rounded">
-                                {openRequests.length} open
+                                {openCount} open
                             </span>
                         )}
                     </CardTitle>
@@ -231,6 +270,17 @@ export const EquipmentDetail = () => {
                                     onClick={() => navigate('/requests')}
                                 />
                             ))}
+                            {nextCursor && (
+                                <Button
+                                    onClick={loadMore}
+                                    disabled={loadingMore}
+                                    variant="outline"
+                                    className="w-full border-zinc-700"
+                                    data-testid="load-more-requests-btn"
+                                >
+                                    {loadingMore ? 'Loading...' : 'Load older requests'}
+                                </Button>
+                            )}
                         </div>
                     )}
                 </CardContent>
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { equipmentService } from '../../services/equipment';
 import { teamsService, usersService } from '../../services/teams';
+import { bootstrapService } from '../../services/bootstrap';
 import { formatDate } from '../../lib/utils';
 import { 
     Plus, 
@@ -78,11 +79,14 @@ export const EquipmentList = () => {
 
     const loadData = async () => {
         try {
-            const [eqData, teamData, techData] = await Promise.all([
-                equipmentService.getAll(),
-                teamsService.getAll(),
-                usersService.getTechnicians()
-            ]);
+            const initial = await bootstrapService.claim('equipment-list');
+            const [eqData, teamData, techData] = initial
+                ? [initial.equipment, initial.teams, initial.technicians]
+                : await Promise.all([
+                    equipmentService.getAll(),
+                    teamsService.getAll(),
+                    usersService.getTechnicians()
+                ]);
             setEquipment(eqData);
             setTeams(teamData);
             setTechnicians(techData);
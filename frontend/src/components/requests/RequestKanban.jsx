@@ -275,7 +275,7 @@ const SortableRequestCard = ({ request }) => {
 };
 
 const RequestCard = ({ request, isDragging, listeners }) => {
-    const overdue = isOverdue(request.scheduled_date, request.stage);
+    const overdue = request.is_overdue ?? isOverdue(request.scheduled_date, request.stage);
 
     return (
         <div
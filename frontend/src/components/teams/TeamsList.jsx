@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { teamsService, usersService } from '../../services/teams';
+import { bootstrapService } from '../../services/bootstrap';
 import { 
     Plus, 
     Search, 
@@ -51,10 +52,13 @@ export const TeamsList = () => {
 
     const loadData = async () => {
         try {
-            const [teamData, userData] = await Promise.all([
-                teamsService.getAll(),
-                usersService.getTechnicians()
-            ]);
+            const initial = await bootstrapService.claim('teams-list');
+            const [teamData, userData] = initial
+                ? [initial.teams, initial.technicians]
+                : await Promise.all([
+                    teamsService.getAll(),
+                    usersService.getTechnicians()
+                ]);
             setTeams(teamData);
             setUsers(userData);
         } catch (error) {
@@ -1,5 +1,6 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import { authService } from '../services/auth';
+import { bootstrapService } from '../services/bootstrap';
 
 const AuthContext = createContext(null);
 
@@ -16,6 +17,7 @@ export const AuthProvider = ({ children }) => {
             if (storedToken && storedUser) {
                 setToken(storedToken);
                 setUser(JSON.parse(storedUser));
+                bootstrapService.prefetch();
             }
             setLoading(false);
         };
@@ -28,6 +30,7 @@ export const AuthProvider = ({ children }) => {
         
         localStorage.setItem('token', access_token);
         localStorage.setItem('user', JSON.stringify(userData));
+        bootstrapService.prefetch();
         
         setToken(access_token);
         setUser(userData);
@@ -41,6 +44,7 @@ export const AuthProvider = ({ children }) => {
         
         localStorage.setItem('token', access_token);
         localStorage.setItem('user', JSON.stringify(userData));
+        bootstrapService.prefetch();
         
         setToken(access_token);
         setUser(userData);
@@ -49,8 +53,14 @@ export const AuthProvider = ({ children }) => {
     };
 
     const logout = () => {
+        const storedToken = localStorage.getItem('token');
+        if (storedToken) {
+            // Revoke server-side too; the local session ends either way
+            authService.logout(storedToken).catch(() => {});
+        }
         localStorage.removeItem('token');
         localStorage.removeItem('user');
+        bootstrapService.reset();
         setToken(null);
         setUser(null);
     };
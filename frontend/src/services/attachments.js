@@ -0,0 +1,35 @@
+import api from './api';
+
+const OWNER_PATHS = { request: 'requests', equipment: 'equipment' };
+
+export const attachmentsService = {
+    async list(ownerType, ownerId) {
+        const response = await api.get(`/${OWNER_PATHS[ownerType]}/${ownerId}/attachments`);
+        return response.data;
+    },
+
+    async upload(ownerType, ownerId, file, { onUploadProgress } = {}) {
+        // The file is sent as the raw body so the server can stream it to storage
+        const response = await api.post(`/${OWNER_PATHS[ownerType]}/${ownerId}/attachments`, file, {
+            params: { filename: file.name },
+            headers: { 'Content-Type': file.type || 'application/octet-stream' },
+            onUploadProgress
+        });
+        return response.data;
+    },
+
+    url(attachment) {
+        return `${api.defaults.baseURL}/attachments/${attachment.id}`;
+    },
+
+    thumbnailUrl(attachment) {
+        return attachment.thumbnail === 'ready'
+            ? `${api.defaults.baseURL}/attachments/${attachment.id}/thumbnail`
+            : null;
+    },
+
+    async delete(id) {
+        const response = await api.delete(`/attachments/${id}`);
+        return response.data;
+    }
+};
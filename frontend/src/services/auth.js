@@ -11,6 +11,15 @@ export const authService = {
         return response.data;
     },
 
+    async logout(token) {
+        // The token is passed explicitly because it is cleared from storage
+        // before the request interceptor runs
+        const response = await api.post('/auth/logout', null, {
+            headers: { Authorization: `Bearer ${token}` }
+        });
+        return response.data;
+    },
+
     async getMe() {
         const response = await api.get('/auth/me');
         return response.data;
@@ -0,0 +1,46 @@
+import api from './api';
+
+// Data every page needs right after login, fetched in one request. Each
+// page claims the payload once on its first load; reloads after an edit go
+// to the regular endpoints. Any write discards the payload so no page is
+// handed data older than a change the user just made.
+const MAX_AGE_MS = 30000;
+
+let pending = null;
+let fetchedAt = 0;
+const claimed = new Set();
+
+const reset = () => {
+    pending = null;
+    claimed.clear();
+};
+
+api.interceptors.request.use((config) => {
+    if (config.method !== 'get') reset();
+    return config;
+});
+
+export const bootstrapService = {
+    prefetch() {
+        if (!pending) {
+            fetchedAt = Date.now();
+            pending = api.get('/bootstrap').then((response) => response.data);
+            pending.catch(reset);
+        }
+        return pending;
+    },
+
+    async claim(consumer) {
+        if (!pending || claimed.has(consumer) || Date.now() - fetchedAt > MAX_AGE_MS) {
+            return null;
+        }
+        claimed.add(consumer);
+        try {
+            return await pending;
+        } catch (error) {
+            return null;
+        }
+    },
+
+    reset
+};
@@ -1,8 +1,13 @@
 import api from './api';
 
 export const equipmentService = {
-    async getAll() {
-        const response = await api.get('/equipment');
+    async getAll(filters = {}) {
+        const response = await api.get('/equipment', { params: filters });
+        return response.data;
+    },
+
+    async suggest(q, limit = 10) {
+        const response = await api.get('/equipment/suggest', { params: { q, limit } });
         return response.data;
     },
 
@@ -11,8 +16,10 @@ export const equipmentService = {
         return response.data;
     },
 
-    async create(data) {
-        const response = await api.post('/equipment', data);
+    async create(data, { idempotencyKey } = {}) {
+        // Pass the same key when retrying a submission so it is not created twice
+        const headers = idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {};
+        const response = await api.post('/equipment', data, { headers });
         return response.data;
     },
 
@@ -29,5 +36,10 @@ export const equipmentService = {
     async getRequests(id) {
         const response = await api.get(`/equipment/${id}/requests`);
         return response.data;
+    },
+
+    async getHistory(id, { limit = 20, before } = {}) {
+        const response = await api.get(`/equipment/${id}/history`, { params: { limit, before } });
+        return response.data;
     }
 };
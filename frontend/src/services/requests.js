@@ -3,8 +3,9 @@ import api from './api';
 export const requestsService = {
     async getAll(filters = {}) {
         const params = new URLSearchParams();
-        if (filters.stage) params.append('stage', filters.stage);
-        if (filters.request_type) params.append('request_type', filters.request_type);
+        Object.entries(filters).forEach(([key, value]) => {
+            if (value !== undefined && value !== null && value !== '') params.append(key, value);
+        });
         
         const response = await api.get(`/requests?${params.toString()}`);
         return response.data;
@@ -20,8 +21,10 @@ export const requestsService = {
         return response.data;
     },
 
-    async create(data) {
-        const response = await api.post('/requests', data);
+    async create(data, { idempotencyKey } = {}) {
+        // Pass the same key when retrying a submission so it is not created twice
+        const headers = idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {};
+        const response = await api.post('/requests', data, { headers });
         return response.data;
     },
 
@@ -35,6 +38,11 @@ export const requestsService = {
         return response.data;
     },
 
+    async logTime(id, hours) {
+        const response = await api.post(`/requests/${id}/time-log`, { hours });
+        return response.data;
+    },
+
     async delete(id) {
         const response = await api.delete(`/requests/${id}`);
         return response.data;
@@ -57,3 +65,10 @@ export const analyticsService = {
         return response.data;
     }
 };
+
+export const searchService = {
+    async search(q, limit = 20) {
+        const response = await api.get('/search', { params: { q, limit } });
+        return response.data;
+    }
+};
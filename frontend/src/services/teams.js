@@ -24,6 +24,16 @@ export const teamsService = {
     async delete(id) {
         const response = await api.delete(`/teams/${id}`);
         return response.data;
+    },
+
+    async addMembers(id, userIds) {
+        const response = await api.post(`/teams/${id}/members`, { user_ids: userIds });
+        return response.data;
+    },
+
+    async removeMember(id, userId) {
+        const response = await api.delete(`/teams/${id}/members/${userId}`);
+        return response.data;
     }
 };
 
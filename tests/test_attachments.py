@@ -0,0 +1,86 @@
+import pytest
+from starlette.datastructures import Headers
+
+from attachments import AttachmentStore, Upload, download_response, parse_range
+
+
+def test_parse_range_without_header_sends_whole_file():
+    assert parse_range(None, 100) is None
+    assert parse_range("", 100) is None
+
+
+def test_parse_range_closed_and_open_ended():
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=99-99", 100) == (99, 99)
+
+
+def test_parse_range_suffix():
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    # Longer than the file: the whole file, as a 206
+    assert parse_range("bytes=-500", 100) == (0, 99)
+    with pytest.raises(ValueError):
+        parse_range("bytes=-0", 100)
+
+
+def test_parse_range_end_past_the_file_is_clamped():
+    assert parse_range("bytes=50-1000", 100) == (50, 99)
+
+
+def test_parse_range_start_past_the_file_is_unsatisfiable():
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=150-160", 100)
+
+
+def test_parse_range_reversed_is_unsatisfiable():
+    with pytest.raises(ValueError):
+        parse_range("bytes=20-10", 100)
+
+
+def test_parse_range_multiple_ranges_send_whole_file():
+    assert parse_range("bytes=0-9,20-29", 100) is None
+    assert parse_range("bytes=-5, 0-1", 100) is None
+
+
+@pytest.mark.parametrize("header", ["items=0-9", "bytes=a-b", "bytes=-", "bytes=1-2-3", "bytes=--5"])
+def test_parse_range_ignores_malformed_headers(header):
+    assert parse_range(header, 100) is None
+
+
+def test_parse_range_empty_file_is_sent_whole():
+    assert parse_range("bytes=0-9", 0) is None
+
+
+def test_store_interfaces_are_abstract():
+    with pytest.raises(TypeError):
+        AttachmentStore()
+    with pytest.raises(TypeError):
+        Upload()
+
+
+class _Store:
+    async def read(self, file_id, start, end):
+        yield b"x" * (end - start + 1)
+
+
+def _download(media_type, filename="file"):
+    return download_response(_Store(), "f1", 10, '"abc"', media_type, filename, Headers({}))
+
+
+@pytest.mark.parametrize("media_type", ["image/png", "image/jpeg", "application/pdf", "IMAGE/PNG; charset=binary"])
+def test_safe_types_are_served_inline(media_type):
+    assert _download(media_type).headers["content-disposition"].startswith("inline;")
+
+
+@pytest.mark.parametrize("media_type", ["text/html", "image/svg+xml", "application/xhtml+xml", "text/javascript"])
+def test_other_types_download_as_files(media_type):
+    response = _download(media_type, "page.html")
+    assert response.headers["content-disposition"] == "attachment; filename*=UTF-8''page.html"
+
+
+def test_downloads_are_never_sniffed_or_run_on_the_api_origin():
+    response = _download("text/html")
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["content-security-policy"] == "sandbox"
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+import idempotency
+from idempotency import IDEMPOTENCY_COLLECTION, IdempotencyStore
+
+
+class _Collection:
+    def __init__(self):
+        self.docs = {}
+
+    def _matches(self, doc, query):
+        for field, expected in query.items():
+            if isinstance(expected, dict) and "$lt" in expected:
+                if field not in doc or not doc[field] < expected["$lt"]:
+                    return False
+            elif doc.get(field) != expected:
+                return False
+        return True
+
+    async def insert_one(self, doc):
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate key")
+        self.docs[doc["_id"]] = dict(doc)
+
+    async def find_one(self, query):
+        return next((doc for doc in self.docs.values() if self._matches(doc, query)), None)
+
+    async def find_one_and_update(self, query, update):
+        doc = await self.find_one(query)
+        if doc is not None:
+            doc.update(update["$set"])
+        return doc
+
+    async def update_one(self, query, update):
+        await self.find_one_and_update(query, update)
+
+    async def delete_one(self, query):
+        doc = await self.find_one(query)
+        if doc is not None:
+            del self.docs[doc["_id"]]
+
+
+class _Payload(BaseModel):
+    name: str
+
+
+def _store():
+    collection = _Collection()
+    return IdempotencyStore({IDEMPOTENCY_COLLECTION: collection}), collection
+
+
+def _handler(calls):
+    async def handler():
+        calls.append(True)
+        return {"id": len(calls)}
+    return handler
+
+
+def test_retry_replays_the_stored_response():
+    store, _ = _store()
+    calls = []
+    first = asyncio.run(store.run("requests", "k1", _Payload(name="a"), _handler(calls), caller="u1"))
+    again = asyncio.run(store.run("requests", "k1", _Payload(name="a"), _handler(calls), caller="u1"))
+    assert first == again == {"id": 1}
+    assert len(calls) == 1
+
+
+def test_keys_are_scoped_per_caller():
+    store, _ = _store()
+    calls = []
+    asyncio.run(store.run("requests", "k1", _Payload(name="a"), _handler(calls), caller="u1"))
+    other = asyncio.run(store.run("requests", "k1", _Payload(name="a"), _handler(calls), caller="u2"))
+    assert other == {"id": 2}
+
+
+def test_claim_within_its_lease_gets_409():
+    store, collection = _store()
+    asyncio.run(collection.insert_one({
+        "_id": "requests:u1:k1",
+        "status": "pending",
+        "payload_hash": idempotency.fingerprint(_Payload(name="a")),
+        "claim": "other",
+        "claimed_at": datetime.now(timezone.utc),
+    }))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(store.run("requests", "k1", _Payload(name="a"), _handler([]), caller="u1"))
+    assert exc.value.status_code == 409
+
+
+def test_abandoned_claim_is_taken_over_after_its_lease():
+    store, collection = _store()
+    stale = datetime.now(timezone.utc) - timedelta(seconds=idempotency.LEASE_SECONDS + 1)
+    asyncio.run(collection.insert_one({
+        "_id": "requests:u1:k1",
+        "status": "pending",
+        "payload_hash": idempotency.fingerprint(_Payload(name="a")),
+        "claim": "crashed-worker",
+        "claimed_at": stale,
+    }))
+    calls = []
+    response = asyncio.run(store.run("requests", "k1", _Payload(name="a"), _handler(calls), caller="u1"))
+    assert response == {"id": 1}
+    assert collection.docs["requests:u1:k1"]["status"] == "done"
+
+
+def test_abandoned_claim_with_another_payload_is_not_taken_over():
+    store, collection = _store()
+    stale = datetime.now(timezone.utc) - timedelta(seconds=idempotency.LEASE_SECONDS + 1)
+    asyncio.run(collection.insert_one({
+        "_id": "requests:u1:k1",
+        "status": "pending",
+        "payload_hash": idempotency.fingerprint(_Payload(name="b")),
+        "claim": "crashed-worker",
+        "claimed_at": stale,
+    }))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(store.run("requests", "k1", _Payload(name="a"), _handler([]), caller="u1"))
+    assert exc.value.status_code == 422
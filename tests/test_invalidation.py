@@ -0,0 +1,97 @@
+import asyncio
+
+from bson import ObjectId
+
+from invalidation import InvalidationBus
+
+
+class _Cursor:
+    """Tailable cursor whose getMores return ``batches`` in turn, then die"""
+
+    def __init__(self, docs, batches):
+        self._docs = list(docs)
+        self._batches = list(batches)
+        self.alive = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._docs:
+            return self._docs.pop(0)
+        if self._batches:
+            # An empty getMore ends this pass but leaves the cursor open
+            self._docs = self._batches.pop(0)
+            raise StopAsyncIteration
+        self.alive = False
+        raise StopAsyncIteration
+
+
+class _Collection:
+    def __init__(self, docs, batches):
+        self.docs = docs
+        self.batches = batches
+        self.inserted = []
+
+    async def find_one(self, query, sort=None):
+        return self.docs[-1] if self.docs else None
+
+    def find(self, query, cursor_type=None):
+        return _Cursor(self.docs, self.batches)
+
+    async def insert_one(self, doc):
+        self.inserted.append(doc)
+
+
+class _Database(dict):
+    pass
+
+
+def _event(channel, origin="other"):
+    return {"_id": ObjectId(), "channel": channel, "origin": origin, "payload": {"n": channel}}
+
+
+async def _tail(collection):
+    bus = InvalidationBus(_Database(cache_events=collection))
+    seen, resyncs = [], []
+
+    async def handler(payload):
+        seen.append(payload["n"])
+
+    async def resync():
+        resyncs.append(True)
+
+    bus.subscribe("a", handler, resync)
+    task = asyncio.create_task(bus._run())
+    await asyncio.sleep(0.05)
+    task.cancel()
+    return bus, seen, resyncs
+
+
+def test_idle_tailing_neither_resyncs_nor_publishes():
+    old = _event("a")
+    collection = _Collection([old], [[], [], [_event("a")], []])
+    collection.batches[2][0]["payload"]["n"] = "new"
+    bus, seen, resyncs = asyncio.run(_tail(collection))
+    assert seen == ["new"]
+    assert resyncs == []
+    assert collection.inserted == []
+
+
+def test_events_after_the_anchor_are_applied_whatever_their_ids():
+    anchor = _event("a")
+    # Made earlier by another process, inserted after the anchor
+    earlier = {"_id": ObjectId.from_datetime(anchor["_id"].generation_time.replace(year=2000)),
+               "channel": "a", "origin": "other", "payload": {"n": "earlier"}}
+    collection = _Collection([_event("a"), anchor], [[earlier]])
+    bus, seen, resyncs = asyncio.run(_tail(collection))
+    assert seen == ["earlier"]
+
+
+def test_overwritten_anchor_resyncs():
+    anchor = _event("a")
+    collection = _Collection([anchor], [])
+    collection.find = lambda query, cursor_type=None: _Cursor([_event("a")], [[]])
+    bus, seen, resyncs = asyncio.run(_tail(collection))
+    assert seen == []
+    assert resyncs
@@ -0,0 +1,87 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from meters import MeterBufferFull, MeterService, occurrence_id
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class _Collection:
+    def __init__(self):
+        self.docs = {}
+        self.fail_indexes = set()
+
+    async def insert_many(self, docs, ordered=True):
+        errors = []
+        for index, doc in enumerate(docs):
+            if index in self.fail_indexes:
+                errors.append({"index": index, "code": 6, "errmsg": "host unreachable"})
+            elif doc["_id"] in self.docs:
+                errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+            else:
+                self.docs[doc["_id"]] = doc
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def bulk_write(self, ops, ordered=True):
+        return None
+
+
+class _Database(dict):
+    def __missing__(self, name):
+        collection = self[name] = _Collection()
+        return collection
+
+
+def _readings(values):
+    return [
+        {"equipment_id": "e1", "meter": "hours", "value": value, "at": T0 + timedelta(minutes=value)}
+        for value in values
+    ]
+
+
+def _service(database, **kwargs):
+    async def on_due(threshold, due, value, request_id):
+        return {"id": request_id}
+    return MeterService(database, on_due, **kwargs)
+
+
+def test_partial_flush_requeues_only_failed_readings():
+    async def run():
+        database = _Database()
+        service = _service(database)
+        await service.ingest(_readings(range(4)))
+        database["meter_readings"].fail_indexes = {1, 3}
+        with pytest.raises(Exception):
+            await service.flush()
+        assert [doc["value"] for doc in service._pending] == [1, 3]
+
+        database["meter_readings"].fail_indexes = set()
+        assert await service.flush() == 2
+        assert len(database["meter_readings"].docs) == 4
+
+        # Replaying stored readings is a no-op, not a failure
+        await service.ingest(_readings(range(4)))
+        await service.flush()
+        assert len(database["meter_readings"].docs) == 4
+    asyncio.run(run())
+
+
+def test_full_buffer_rejects_the_whole_batch():
+    async def run():
+        service = _service(_Database(), max_buffered=3)
+        await service.ingest(_readings([1, 2]))
+        with pytest.raises(MeterBufferFull):
+            await service.ingest(_readings([3, 4]))
+        assert len(service._pending) == 2
+    asyncio.run(run())
+
+
+def test_occurrence_id_is_stable_per_crossing():
+    threshold = {"_id": "e1:hours", "updated_at": "2026-01-01T00:00:00+00:00"}
+    assert occurrence_id(threshold, 250) == occurrence_id(dict(threshold), 250.0)
+    assert occurrence_id(threshold, 250) != occurrence_id(threshold, 500)
+    assert occurrence_id(threshold, 250) != occurrence_id({**threshold, "updated_at": "later"}, 250)
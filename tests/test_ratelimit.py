@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from ratelimit import MemoryBucketStore, RateLimitMiddleware
+
+
+def _middleware(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    return RateLimitMiddleware(app, identify_user=lambda headers: None, store=MemoryBucketStore())
+
+
+def _scope(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return {"type": "http", "path": "/api/equipment", "method": "GET", "client": (peer, 5000), "headers": headers}
+
+
+def _statuses(middleware, scope, count):
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    async def run():
+        for _ in range(count):
+            await middleware(scope, None, send)
+
+    asyncio.run(run())
+    return statuses
+
+
+def test_ip_limit_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_IP_ENABLED", raising=False)
+    middleware = _middleware(monkeypatch, RATE_LIMIT_IP_BURST="2")
+    assert _statuses(middleware, _scope("10.0.0.5"), 5) == [200] * 5
+
+
+def test_ip_limit_applies_when_enabled(monkeypatch):
+    middleware = _middleware(monkeypatch, RATE_LIMIT_IP_ENABLED="true", RATE_LIMIT_IP_BURST="2",
+                             RATE_LIMIT_IP_PER_SECOND="0.001")
+    assert _statuses(middleware, _scope("203.0.113.9"), 3) == [200, 200, 429]
+
+
+@pytest.mark.parametrize("peer, forwarded, client", [
+    # Untrusted peer: the header is ignored
+    ("203.0.113.9", "198.51.100.1", "203.0.113.9"),
+    ("10.0.0.5", "198.51.100.1", "198.51.100.1"),
+    # A forged leftmost hop is skipped
+    ("10.0.0.5", "1.2.3.4, 198.51.100.1", "198.51.100.1"),
+    ("10.0.0.5", "198.51.100.1, 10.0.0.7", "198.51.100.1"),
+    ("10.0.0.5", None, "10.0.0.5"),
+])
+def test_forwarded_for_is_read_only_from_trusted_proxies(monkeypatch, peer, forwarded, client):
+    middleware = _middleware(monkeypatch, RATE_LIMIT_TRUSTED_PROXIES="10.0.0.0/8, ::1")
+    scope = _scope(peer, forwarded)
+    headers = {k.decode(): v.decode() for k, v in scope["headers"]}
+    assert middleware._client_ip(scope, headers) == client
@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+import time_log
+from equipment_stats import STATS_COLLECTION
+from time_log import HoursBuffer
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    async def to_list(self, length):
+        return self._docs
+
+
+class _Requests:
+    def __init__(self, docs):
+        self.docs = {doc["id"]: doc for doc in docs}
+        # Ops to apply before failing with an unknown outcome, or None
+        self.apply_then_fail = None
+
+    def find(self, query, projection, session=None):
+        return _Cursor([dict(self.docs[i]) for i in query["id"]["$in"] if i in self.docs])
+
+    async def bulk_write(self, ops, ordered=True, session=None):
+        count = len(ops) if self.apply_then_fail is None else self.apply_then_fail
+        for op in ops[:count]:
+            query, update = op._filter, op._doc
+            doc = self.docs[query["id"]]
+            if query["hours_flush_ids"]["$ne"] in doc.setdefault("hours_flush_ids", []):
+                continue
+            doc["hours_spent"] += update["$inc"]["hours_spent"]
+            doc["hours_flush_ids"] += update["$push"]["hours_flush_ids"]["$each"]
+        if self.apply_then_fail is not None:
+            raise AutoReconnect("connection closed")
+
+
+class _Stats:
+    def __init__(self):
+        self.docs = {}
+        self.fail = False
+
+    async def bulk_write(self, ops, ordered=True, session=None):
+        if self.fail:
+            raise AutoReconnect("connection closed")
+        for op in ops:
+            # Evaluate the _add_once pipeline for one flush id
+            stage = op._doc[0]["$set"]["total_hours"]["$cond"]
+            flush_id, hours = stage[0]["$in"][0], stage[2]["$add"][1]
+            doc = self.docs.setdefault(op._filter["equipment_id"], {"total_hours": 0, "flush_ids": []})
+            if flush_id not in doc["flush_ids"]:
+                doc["total_hours"] += hours
+                doc["flush_ids"].append(flush_id)
+
+
+class _Database(dict):
+    @property
+    def requests(self):
+        return self["requests"]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    async def standalone(callback):
+        return await callback(None)
+
+    async def no_stamp(database):
+        return {}
+
+    monkeypatch.setattr(time_log, "transactional", standalone)
+    monkeypatch.setattr(time_log, "sync_stamp", no_stamp)
+    return _Database({
+        "requests": _Requests([
+            {"id": "r1", "equipment_id": "e1", "hours_spent": 0.0},
+            {"id": "r2", "equipment_id": "e1", "hours_spent": 0.0},
+            {"id": "r3", "equipment_id": "e2", "hours_spent": 0.0},
+        ]),
+        STATS_COLLECTION: _Stats(),
+    })
+
+
+def _hours(database):
+    return {i: doc["hours_spent"] for i, doc in database.requests.docs.items()}
+
+
+def _totals(database):
+    return {i: doc["total_hours"] for i, doc in database[STATS_COLLECTION].docs.items()}
+
+
+def _log(buffer, entries):
+    for request_id, hours in entries:
+        buffer.add(request_id, hours)
+
+
+def test_unknown_outcome_retry_applies_each_increment_once(database):
+    async def run():
+        buffer = HoursBuffer(database)
+        _log(buffer, [("r1", 1.0), ("r2", 2.0), ("r3", 4.0)])
+        database.requests.apply_then_fail = 2
+        with pytest.raises(AutoReconnect):
+            await buffer.flush()
+        assert buffer.pending("r1") == 1.0
+
+        database.requests.apply_then_fail = None
+        assert await buffer.flush() == 3
+        assert _hours(database) == {"r1": 1.0, "r2": 2.0, "r3": 4.0}
+        assert _totals(database) == {"e1": 3.0, "e2": 4.0}
+    asyncio.run(run())
+
+
+def test_stats_failure_after_requests_landed_is_not_double_counted(database):
+    async def run():
+        buffer = HoursBuffer(database)
+        _log(buffer, [("r1", 1.0), ("r3", 4.0)])
+        database[STATS_COLLECTION].fail = True
+        with pytest.raises(AutoReconnect):
+            await buffer.flush()
+        database[STATS_COLLECTION].fail = False
+        await buffer.flush()
+        assert _hours(database) == {"r1": 1.0, "r2": 0.0, "r3": 4.0}
+        assert _totals(database) == {"e1": 1.0, "e2": 4.0}
+    asyncio.run(run())
+
+
+def test_hours_logged_during_a_failure_go_in_a_later_flush(database):
+    async def run():
+        buffer = HoursBuffer(database)
+        _log(buffer, [("r1", 1.0)])
+        database.requests.apply_then_fail = 1
+        with pytest.raises(AutoReconnect):
+            await buffer.flush()
+        _log(buffer, [("r1", 0.5)])
+        assert buffer.pending("r1") == 1.5
+
+        database.requests.apply_then_fail = None
+        assert await buffer.flush() == 2
+        assert _hours(database)["r1"] == 1.5
+        assert _totals(database) == {"e1": 1.5}
+        assert len(database.requests.docs["r1"]["hours_flush_ids"]) == 2
+    asyncio.run(run())
@@ -0,0 +1,44 @@
+import asyncio
+from datetime import timedelta
+
+from tokens import KeySet, RevocationList
+
+
+class _Collection:
+    async def replace_one(self, *args, **kwargs):
+        return None
+
+
+class _Database(dict):
+    def __missing__(self, name):
+        return _Collection()
+
+
+def _revoked_user(user_id):
+    revocations = RevocationList(_Database(), timedelta(hours=24))
+    asyncio.run(revocations.revoke_user(user_id))
+    return revocations, revocations._users[user_id]
+
+
+def test_revoke_user_covers_tokens_issued_before_the_cutoff():
+    revocations, cutoff = _revoked_user("u1")
+    assert revocations.is_revoked({"sub": "u1", "iat": cutoff - 0.001})
+    # Tokens from before sub-second iat carry whole seconds
+    assert revocations.is_revoked({"sub": "u1", "iat": int(cutoff) - 1})
+
+
+def test_token_issued_in_the_same_second_after_logout_stays_valid():
+    revocations, cutoff = _revoked_user("u1")
+    assert not revocations.is_revoked({"sub": "u1", "iat": cutoff + 0.001})
+    assert not revocations.is_revoked({"sub": "u1", "iat": cutoff})
+
+
+def test_revoke_user_only_affects_that_user():
+    revocations, cutoff = _revoked_user("u1")
+    assert not revocations.is_revoked({"sub": "u2", "iat": cutoff - 1})
+
+
+def test_sub_second_iat_survives_signing():
+    keys = KeySet({"k1": "k" * 32}, "k1")
+    token = keys.encode({"sub": "u1", "iat": 1700000000.25, "exp": 4102444800})
+    assert keys.decode(token)["iat"] == 1700000000.25